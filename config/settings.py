@@ -42,11 +42,14 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'rest_framework',
     'dashboard',
 ]
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    # Serves collected static files, compressed and with far-future cache headers
+    'whitenoise.middleware.WhiteNoiseMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -79,13 +82,81 @@ WSGI_APPLICATION = 'config.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 # This looks for the DATABASE_URL environment variable.
+# Connections are kept open for DB_CONN_MAX_AGE seconds (0 closes them after every request)
+# and checked before reuse, so a restarted database does not surface as errors.
 DATABASES = {
     'default': dj_database_url.config(
         default='postgres://dmarc_user:password@db:5432/dmarc',
-        engine='timescale.db.backends.postgresql'
+        engine='timescale.db.backends.postgresql',
+        conn_max_age=int(os.environ.get('DB_CONN_MAX_AGE', '60')),
+        conn_health_checks=True
     )
 }
 
+# Threads per process that run the dashboard's independent queries side by side
+# (dashboard.queries.run_concurrently). Each keeps its own persistent connection,
+# so count them in: (WEB_THREADS + DB_QUERY_WORKERS) x WEB_WORKERS < max_connections.
+DB_QUERY_WORKERS = int(os.environ.get('DB_QUERY_WORKERS', '3'))
+
+
+# Cache for dashboard pages (see dashboard.caching). Local memory by default, which
+# is per process; set CACHE_BACKEND/CACHE_LOCATION to share one between processes, e.g.
+# django.core.cache.backends.filebased.FileBasedCache with /tmp/dmarc-cache, or
+# django.core.cache.backends.redis.RedisCache with redis://redis:6379.
+# Entries are invalidated by a data version bump; the timeout only bounds how long
+# the rolling "last N days" windows may lag behind the clock.
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', 'dmarc-dashboard'),
+        'TIMEOUT': int(os.environ.get('CACHE_TIMEOUT', '3600')),
+    }
+}
+
+
+# --- TIMESCALEDB STORAGE (see dashboard.storage) ---
+# Applied by migration 0012; re-apply after changing them with `manage.py dmarc_storage --apply`.
+# Width of each hypertable chunk. Only affects chunks created from now on.
+TIMESCALE_CHUNK_INTERVAL_DAYS = int(os.environ.get('TIMESCALE_CHUNK_INTERVAL_DAYS', '7'))
+# Chunks older than this are compressed (segmented by domain, ordered by date). 0 disables.
+TIMESCALE_COMPRESS_AFTER_DAYS = int(os.environ.get('TIMESCALE_COMPRESS_AFTER_DAYS', '30'))
+# Raw report rows older than this are dropped; the daily aggregate, sender rollups and
+# report headers are kept. 0 keeps raw rows forever. Must exceed the aggregate's 120 day refresh window.
+TIMESCALE_RETENTION_DAYS = int(os.environ.get('TIMESCALE_RETENTION_DAYS', '0'))
+
+
+# Also keep a raw JSON copy of each record's auth_results on the report row. The typed
+# SPF/DKIM tables already hold the same data, so this only adds storage; off by default.
+STORE_RAW_AUTH_RESULTS = os.environ.get('STORE_RAW_AUTH_RESULTS', 'False') == 'True'
+
+
+# --- IP ENRICHMENT (see dashboard.enrichment) ---
+# Reverse DNS, base domain and country are looked up once per sender IP and cached in the
+# database, instead of by parsedmarc for every record of every report. False restores the latter.
+IP_ENRICHMENT = os.environ.get('IP_ENRICHMENT', 'True') == 'True'
+# Cached lookups are repeated after this many days.
+IP_ENRICHMENT_TTL_DAYS = int(os.environ.get('IP_ENRICHMENT_TTL_DAYS', '30'))
+# Concurrent reverse DNS lookups, and the timeout of each.
+IP_ENRICHMENT_WORKERS = int(os.environ.get('IP_ENRICHMENT_WORKERS', '16'))
+IP_ENRICHMENT_DNS_TIMEOUT = float(os.environ.get('IP_ENRICHMENT_DNS_TIMEOUT', '2.0'))
+# Local .mmdb file (IPinfo, MaxMind GeoLite2 or DB-IP) for countries. Empty uses the
+# IPinfo Lite database bundled with parsedmarc.
+GEOIP_DATABASE = os.environ.get('GEOIP_DATABASE', '')
+
+# Per-request instrumentation (see dashboard.instrumentation): a Server-Timing header with
+# SQL count/time and template render time on every response, Prometheus metrics at /metrics,
+# and a log line with the slowest queries of requests slower than INSTRUMENTATION_SLOW_REQUEST_MS.
+INSTRUMENTATION = os.environ.get('INSTRUMENTATION', 'False') == 'True'
+INSTRUMENTATION_SLOW_REQUEST_MS = int(os.environ.get('INSTRUMENTATION_SLOW_REQUEST_MS', '500'))
+if INSTRUMENTATION:
+    MIDDLEWARE.insert(0, 'dashboard.instrumentation.InstrumentationMiddleware')
+    TEMPLATES[0]['BACKEND'] = 'dashboard.instrumentation.TimedDjangoTemplates'
+
+# Read-only JSON API under /api/v1/ (see dashboard.api)
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': ['rest_framework.renderers.JSONRenderer'],
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -122,6 +193,17 @@ USE_TZ = True
 # https://docs.djangoproject.com/en/5.2/howto/static-files/
 
 STATIC_URL = 'static/'
+# Filled by `collectstatic` (run while building the image), served by WhiteNoise
+STATIC_ROOT = os.environ.get('STATIC_ROOT', BASE_DIR / 'staticfiles')
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'whitenoise.storage.CompressedManifestStaticFilesStorage',
+    },
+}
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -131,4 +213,8 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Email Configuration for Ingress (Read from Env)
 EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', '')
 EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
-EMAIL_HOST_IMAP = os.environ.get('EMAIL_HOST_IMAP', '')
\ No newline at end of file
+EMAIL_HOST_IMAP = os.environ.get('EMAIL_HOST_IMAP', '')
+
+# A running ingest job whose worker has not reported progress for this long is
+# considered dead: it is marked failed and no longer blocks new syncs.
+INGEST_JOB_STALE_MINUTES = int(os.environ.get('INGEST_JOB_STALE_MINUTES', '15'))
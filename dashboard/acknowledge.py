@@ -0,0 +1,114 @@
+from django.db.models import Max, Min
+
+from .caching import bump_data_version
+from .models import AcknowledgedSender, DmarcReport
+from .stats import refresh_daily_stats
+
+def open_threats(source_ip=None, base_domain=None, domain=None, date_begin=None, date_end=None):
+    """
+    Unacknowledged threat rows narrowed by any combination of sender IP, sender
+    base domain, reported domain and period.
+    """
+    threats = DmarcReport.objects.filter(threat_level=DmarcReport.THREAT_RED, is_acknowledged=False)
+    if source_ip:
+        threats = threats.filter(source_ip=source_ip)
+    if base_domain:
+        threats = threats.filter(source_base_domain__iexact=base_domain)
+    if domain:
+        threats = threats.filter(domain_entity=domain)
+    if date_begin:
+        threats = threats.filter(date_begin__gte=date_begin)
+    if date_end:
+        threats = threats.filter(date_begin__lte=date_end)
+    return threats
+
+def mark_acknowledged(threats):
+    """
+    The UPDATE of acknowledge_threats, without refreshing anything. Returns
+    (rows updated, first date_begin, last date_begin); dates are None if none matched.
+    """
+    # 1. The span to refresh (same index as the UPDATE, no rows fetched)
+    span = threats.aggregate(first=Min('date_begin'), last=Max('date_begin'))
+    if span['first'] is None:
+        return 0, None, None
+
+    # 2. One statement, however many rows
+    return threats.update(is_acknowledged=True), span['first'], span['last']
+
+def acknowledge_threats(threats):
+    """
+    Acknowledges every row of `threats` with one set-based UPDATE that only
+    writes is_acknowledged, then refreshes the affected days of the daily
+    aggregate and invalidates cached pages. Returns the number of rows updated.
+    """
+    updated, first, last = mark_acknowledged(threats)
+    if not updated:
+        return 0
+
+    # 3. Threat counts come from the aggregate, pages from the cache
+    refresh_daily_stats(first, last)
+    bump_data_version()
+    return updated
+
+def acknowledge_backfilled(entries, sender_rules=None):
+    """
+    Applies the base-domain rules to the stored open threats of `entries`
+    (IpEnrichment) once their base domain is known. Offline ingest checks the
+    rules before the base domain is resolved, so those rows missed them.
+    The daily aggregate is refreshed once for all of them. Returns the number
+    of rows acknowledged.
+    """
+    if sender_rules is None:
+        sender_rules = SenderRules.load()
+
+    acknowledged = 0
+    first = last = None
+    for entry in entries:
+        if not entry.base_domain:
+            continue
+        for rule in sender_rules.by_base_domain.get(entry.base_domain.lower(), []):
+            updated, rule_first, rule_last = mark_acknowledged(
+                open_threats(source_ip=entry.ip, base_domain=entry.base_domain, domain=rule.domain_entity_id)
+            )
+            if updated:
+                acknowledged += updated
+                first = min(first, rule_first) if first else rule_first
+                last = max(last, rule_last) if last else rule_last
+
+    if acknowledged:
+        refresh_daily_stats(first, last)
+        bump_data_version()
+    return acknowledged
+
+class SenderRules:
+    """
+    The acknowledged-sender rules, indexed by IP and base domain so each
+    ingested row is checked against its few candidate rules only.
+    """
+    def __init__(self, rules):
+        self.by_ip = {}
+        self.by_base_domain = {}
+        for rule in rules:
+            if rule.source_ip:
+                self.by_ip.setdefault(rule.source_ip, []).append(rule)
+            else:
+                self.by_base_domain.setdefault(rule.source_base_domain.lower(), []).append(rule)
+
+    @classmethod
+    def load(cls):
+        return cls(AcknowledgedSender.objects.all())
+
+    def apply(self, rows):
+        """
+        Marks the threat rows that match a rule as acknowledged, before they are
+        inserted. Returns how many were marked.
+        """
+        marked = 0
+        for row in rows:
+            if row.threat_level != DmarcReport.THREAT_RED or row.is_acknowledged:
+                continue
+            candidates = self.by_ip.get(row.source_ip, []) + self.by_base_domain.get((row.source_base_domain or "").lower(), [])
+            if any(rule.matches(row) for rule in candidates):
+                row.is_acknowledged = True
+                marked += 1
+        return marked
@@ -1,3 +1,8 @@
 from django.contrib import admin
 
-# Register your models here.
+from .models import AcknowledgedSender
+
+@admin.register(AcknowledgedSender)
+class AcknowledgedSenderAdmin(admin.ModelAdmin):
+    list_display = ('source_ip', 'source_base_domain', 'domain_entity', 'note', 'created_at')
+    search_fields = ('source_ip', 'source_base_domain', 'note')
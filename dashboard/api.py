@@ -0,0 +1,168 @@
+import ipaddress
+import json
+from datetime import timedelta
+from functools import partial
+
+from asgiref.sync import async_to_sync
+from django.utils import timezone
+from django.views.decorators.http import condition
+from rest_framework import viewsets
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+from rest_framework.views import APIView
+
+from .caching import acached_context, data_version
+from .models import DomainEntity
+from .pagination import PAGE_SIZE, encode_cursor, keyset_query
+from .queries import all_reports, unacknowledged_threats
+from .serializers import DomainSerializer, ReportSerializer, requested_fields
+from .stats import GRANULARITY_TRUNC, dashboard_context
+
+MAX_PAGE_SIZE = 1000
+
+DAYS_MAP = {'7d': 7, '30d': 30, '90d': 90}
+
+def data_etag(request, *args, rolling=False, **kwargs):
+    """
+    ETag of every API response: the data version, which ingest and
+    acknowledgements bump. Responses covering a rolling window, a `period` or
+    the endpoint's default one, also change hourly as rows age out of it.
+    """
+    etag = f"v{data_version()}"
+    if rolling or request.GET.get('period'):
+        etag += f"-{timezone.now():%Y%m%d%H}"
+    return etag
+
+class DataETagMixin:
+    """
+    ETag on every response and 304 for a matching If-None-Match, see
+    data_etag. `rolling_window` marks views that default to a rolling period.
+    """
+    rolling_window = False
+
+    def dispatch(self, request, *args, **kwargs):
+        etag_func = partial(data_etag, rolling=self.rolling_window)
+        return condition(etag_func=etag_func)(super().dispatch)(request, *args, **kwargs)
+
+class KeysetPagination(BasePagination):
+    """
+    The pages' keyset pagination on (date_begin, id), newest first:
+    `?cursor=` from the previous page's `next`, `?page_size=` up to 1000.
+    """
+    def paginate_queryset(self, queryset, request, view=None):
+        try:
+            page_size = min(int(request.query_params.get('page_size', PAGE_SIZE)), MAX_PAGE_SIZE)
+        except ValueError:
+            page_size = PAGE_SIZE
+        page_size = max(page_size, 1)
+
+        rows = list(keyset_query(queryset, request.query_params.get('cursor'), page_size))
+        url = request.build_absolute_uri()
+        self.next_url = None
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            self.next_url = replace_query_param(url, 'cursor', encode_cursor(rows[-1]))
+        return rows
+
+    def get_paginated_response(self, data):
+        return Response({'next': self.next_url, 'results': data})
+
+class DomainViewSet(DataETagMixin, viewsets.ReadOnlyModelViewSet):
+    queryset = DomainEntity.objects.select_related('organization').order_by('domain_name')
+    serializer_class = DomainSerializer
+
+class ReportViewSet(DataETagMixin, viewsets.ReadOnlyModelViewSet):
+    """
+    Report rows. Filters: `domain` (id), `period` (7d/30d/90d), `ip`,
+    `threat_level` (red/yellow/green). `?fields=` picks the fields returned,
+    and only their columns are read (e.g. leave out auth_results).
+    """
+    serializer_class = ReportSerializer
+    pagination_class = KeysetPagination
+
+    def base_queryset(self):
+        source_ip = self.request.query_params.get('ip', '').strip()
+        if source_ip:
+            try:
+                source_ip = str(ipaddress.ip_address(source_ip))
+            except ValueError:
+                raise ValidationError({'ip': "Not an IP address."})
+        reports = all_reports(source_ip)
+
+        params = self.request.query_params
+        if params.get('domain'):
+            try:
+                reports = reports.filter(domain_entity_id=int(params['domain']))
+            except ValueError:
+                raise ValidationError({'domain': "Not a domain id."})
+        if params.get('threat_level'):
+            reports = reports.filter(threat_level=params['threat_level'])
+        days = DAYS_MAP.get(params.get('period'))
+        if days:
+            date_end = timezone.now()
+            reports = reports.filter(date_begin__gte=date_end - timedelta(days=days), date_begin__lte=date_end)
+        return reports
+
+    def get_queryset(self):
+        reports = self.base_queryset()
+        fields = requested_fields(self.request, ReportSerializer.Meta.fields)
+        if fields:
+            # The cursor needs date_begin and id whatever was asked for
+            columns = {ReportSerializer.COLUMNS.get(name, name) for name in fields} | {'id', 'date_begin'}
+            reports = reports.only(*columns)
+        return reports
+
+class ThreatViewSet(ReportViewSet):
+    """
+    Open threats, as on the Active Threats page: `period` (default 30d).
+    """
+    rolling_window = True
+
+    def base_queryset(self):
+        days = DAYS_MAP.get(self.request.query_params.get('period'), 30)
+        date_end = timezone.now()
+        return unacknowledged_threats(date_end - timedelta(days=days), date_end).select_related('domain_entity')
+
+class StatsView(DataETagMixin, APIView):
+    """
+    The dashboard's aggregates for `period` (default 30d) and `granularity`
+    (day/week/month), from the same cache as the dashboard page.
+    """
+    rolling_window = True
+
+    def get(self, request):
+        period = request.query_params.get('period', '30d')
+        days = DAYS_MAP.get(period, 30)
+        granularity = request.query_params.get('granularity', 'day')
+        if granularity not in GRANULARITY_TRUNC:
+            granularity = 'day'
+
+        context = async_to_sync(acached_context)(
+            'dashboard', [days, granularity], lambda: dashboard_context(days, granularity)
+        )
+        return Response({
+            'period': period,
+            'granularity': granularity,
+            'totals': context['global_stats'],
+            'pass_percentage': context['pass_percentage'],
+            'threat_ips': context['threat_ips'],
+            'domains': [
+                {
+                    'id': row['domain_entity__id'],
+                    'domain_name': row['domain_entity__domain_name'],
+                    'total': row['total'],
+                    'dmarc_pass': row['dmarc_pass_count'],
+                    'spf_pass': row['spf_pass_count'],
+                    'dkim_pass': row['dkim_pass_count'],
+                    'threats': row['active_threat_count'],
+                    'last_seen': row['last_seen'],
+                }
+                for row in context['domain_stats']
+            ],
+            'chart': {
+                'dates': json.loads(context['chart_dates']),
+                'series': json.loads(context['chart_series']),
+            },
+        })
@@ -0,0 +1,198 @@
+import math
+import platform
+import random
+import statistics
+import time
+from datetime import datetime, timedelta, timezone
+
+import django
+from asgiref.sync import async_to_sync
+from django.core.cache import cache
+from django.test import RequestFactory
+
+from . import views
+from .ingest import build_report_rows
+from .models import DmarcReport, DomainEntity
+from .seed import generate_reports, seed_database
+from .stats import pivot_chart_series
+
+def timings_summary(samples):
+    """
+    Milliseconds: min / median / p95 / max of `samples` (seconds).
+    """
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, math.ceil(len(ordered) * 0.95) - 1)]
+    return {
+        'min_ms': round(ordered[0] * 1000, 2),
+        'median_ms': round(statistics.median(ordered) * 1000, 2),
+        'p95_ms': round(p95 * 1000, 2),
+        'max_ms': round(ordered[-1] * 1000, 2),
+    }
+
+def measure_mapping(rows=20000, records=20):
+    """
+    Throughput of the pure report -> DmarcReport mapping (build_report_rows),
+    without the database: parsing into model instances and classification.
+    """
+    reports = list(generate_reports(domains=10, days=math.ceil(rows / (10 * 3 * records)), records=records, seed=-1))
+    entity = DomainEntity(pk=0, domain_name='benchmark.example')
+
+    started = time.perf_counter()
+    mapped = sum(len(build_report_rows(report, entity)) for report in reports)
+    elapsed = time.perf_counter() - started
+    return {
+        'rows': mapped,
+        'seconds': round(elapsed, 3),
+        'rows_per_sec': round(mapped / elapsed) if elapsed else None,
+    }
+
+def chart_rows(days, domains=10, fill=0.9, seed=0):
+    """
+    Synthetic (date_group, domain, volume) rows as the chart query returns
+    them: `domains` domains over `days` days, each (day, domain) cell present
+    with probability `fill`, ordered by date.
+    """
+    rng = random.Random(seed)
+    start = datetime(2026, 1, 1, tzinfo=timezone.utc)
+    return [
+        {'date_group': start + timedelta(days=day), 'domain_entity__domain_name': f"seed{domain}.example", 'volume': rng.randint(1, 5000)}
+        for day in range(days)
+        for domain in range(domains)
+        if rng.random() < fill
+    ]
+
+def legacy_chart_series(rows, domain_names):
+    """
+    The chart pivot as it was before pivot_chart_series: a linear scan of all
+    rows per (domain, date) cell. Kept only as the benchmark's baseline.
+    """
+    unique_dates = sorted(set(item['date_group'].strftime('%Y-%m-%d') for item in rows))
+    series = []
+    for domain in domain_names:
+        volumes = []
+        for date in unique_dates:
+            record = next(
+                (x for x in rows if x['date_group'].strftime('%Y-%m-%d') == date and x['domain_entity__domain_name'] == domain),
+                None
+            )
+            volumes.append(int(record['volume']) if record else 0)
+        series.append({'name': domain, 'type': 'line', 'smooth': True, 'data': volumes})
+    return unique_dates, series
+
+def measure_chart_pivot(day_counts=(30, 90, 365), domains=10, repeat=3):
+    """
+    Time of the chart pivot before (legacy_chart_series, timed once: it takes
+    seconds) and after (pivot_chart_series, best of `repeat`) on the same rows.
+    Needs no database.
+    """
+    domain_names = [f"seed{domain}.example" for domain in range(domains)]
+    results = []
+    for days in day_counts:
+        rows = chart_rows(days, domains)
+
+        started = time.perf_counter()
+        before = legacy_chart_series(rows, domain_names)
+        before_seconds = time.perf_counter() - started
+
+        after_seconds = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            after = pivot_chart_series(rows, domain_names)
+            after_seconds.append(time.perf_counter() - started)
+
+        if before != after:
+            raise AssertionError(f"Chart pivots differ at {days} days")
+        results.append({
+            'days': days,
+            'domains': domains,
+            'rows': len(rows),
+            'before_ms': round(before_seconds * 1000, 1),
+            'after_ms': round(min(after_seconds) * 1000, 1),
+        })
+    return results
+
+def grow_to(target_rows, records=20, batch_size=1000):
+    """
+    Seeds until the hypertable holds at least `target_rows` rows. Each call
+    uses a fresh seed, so new reports are added rather than deduplicated.
+    Returns the write throughput, or None if nothing had to be written.
+    """
+    missing = target_rows - DmarcReport.objects.count()
+    if missing <= 0:
+        return None
+
+    domains, reporters = 10, 3
+    days = math.ceil(missing / (domains * reporters * records))
+    seed = int(time.time() * 1000)
+
+    started = time.perf_counter()
+    report_count, row_count = seed_database(
+        generate_reports(domains=domains, days=days, records=records, reporters=reporters, seed=seed),
+        batch_size=batch_size
+    )
+    elapsed = time.perf_counter() - started
+    return {
+        'reports': report_count,
+        'rows': row_count,
+        'seconds': round(elapsed, 3),
+        'rows_per_sec': round(row_count / elapsed) if elapsed else None,
+    }
+
+def view_cases():
+    """
+    (name, view, args, query) for every page under test, with their widest period.
+    """
+    domain = DomainEntity.objects.order_by('pk').first()
+    cases = [
+        ('dashboard', async_to_sync(views.dashboard), [], {'period': '90d'}),
+        ('active_threats', views.active_threats, [], {'period': '90d'}),
+        ('report_list', views.report_list, [], {}),
+    ]
+    if domain:
+        cases.append(('domain_detail', views.domain_detail, [domain.pk], {'period': '90d'}))
+    return cases
+
+def measure_views(repeat=5):
+    """
+    Latency of each page rendered in-process: `cold` clears the page cache
+    before every request, `warm` serves it from the cache.
+    """
+    factory = RequestFactory()
+    results = {}
+    for name, view, args, query in view_cases():
+        cold, warm = [], []
+        for _ in range(repeat):
+            cache.clear()
+            started = time.perf_counter()
+            view(factory.get('/', query), *args)
+            cold.append(time.perf_counter() - started)
+
+            started = time.perf_counter()
+            view(factory.get('/', query), *args)
+            warm.append(time.perf_counter() - started)
+        results[name] = {'cold': timings_summary(cold), 'warm': timings_summary(warm)}
+    return results
+
+def run_benchmark(sizes, repeat=5, label=''):
+    """
+    The full suite: mapping throughput once, then for each data size (rows,
+    ascending) grow the database to it and time every page. Returns a
+    JSON-serialisable dict.
+    """
+    result = {
+        'label': label,
+        'started_at': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'mapping': measure_mapping(),
+        'sizes': [],
+    }
+    for size in sorted(sizes):
+        ingest = grow_to(size)
+        result['sizes'].append({
+            'target_rows': size,
+            'rows': DmarcReport.objects.count(),
+            'ingest': ingest,
+            'views': measure_views(repeat),
+        })
+    return result
@@ -0,0 +1,85 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import F
+
+from .models import DataVersion
+from .pagination import decode_cursor
+
+KEY_PREFIX = 'dmarc'
+HITS_KEY = f'{KEY_PREFIX}:stats:hits'
+MISSES_KEY = f'{KEY_PREFIX}:stats:misses'
+
+def data_version():
+    """
+    The current data version (one primary key lookup).
+    """
+    version = DataVersion.objects.filter(pk=DataVersion.SINGLETON_ID).values_list('version', flat=True).first()
+    return version or 0
+
+def bump_data_version():
+    """
+    Invalidates every cached page at once: their keys embed the old version.
+    """
+    updated = DataVersion.objects.filter(pk=DataVersion.SINGLETON_ID).update(version=F('version') + 1)
+    if not updated:
+        DataVersion.objects.get_or_create(pk=DataVersion.SINGLETON_ID, defaults={'version': 1})
+
+def count(key):
+    # incr() fails on a missing key; add() is a no-op when it exists
+    cache.add(key, 0, timeout=None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        pass
+
+def context_key(view_name, version, params):
+    return ':'.join([KEY_PREFIX, view_name, str(version), *(str(p) for p in params)])
+
+def cached_context(view_name, params, build):
+    """
+    Returns build() for (view_name, params), cached until the data version changes.
+    `params` must identify everything the result depends on (period, page, ...).
+    """
+    key = context_key(view_name, data_version(), params)
+    value = cache.get(key)
+    if value is None:
+        count(MISSES_KEY)
+        value = build()
+        cache.set(key, value)
+    else:
+        count(HITS_KEY)
+    return value
+
+async def acached_context(view_name, params, build):
+    """
+    cached_context() for async views: `build` is a coroutine function.
+    """
+    key = context_key(view_name, await sync_to_async(data_version)(), params)
+    value = await cache.aget(key)
+    if value is None:
+        await sync_to_async(count)(MISSES_KEY)
+        value = await build()
+        await cache.aset(key, value)
+    else:
+        await sync_to_async(count)(HITS_KEY)
+    return value
+
+def cursor_key(cursor):
+    """
+    Cache key part for a pagination cursor. Garbled cursors all share the
+    first page's key, matching what keyset_page() returns for them.
+    """
+    return cursor if decode_cursor(cursor) else ''
+
+def cache_stats():
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    lookups = hits + misses
+    return {
+        'backend': settings.CACHES['default']['BACKEND'],
+        'data_version': data_version(),
+        'hits': hits,
+        'misses': misses,
+        'hit_rate': round(hits / lookups, 3) if lookups else None,
+    }
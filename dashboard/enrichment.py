@@ -0,0 +1,224 @@
+import ipaddress
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from importlib.resources import files
+
+import maxminddb
+from django.conf import settings
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.ipv6 import clean_ipv6_address
+from parsedmarc.utils import get_base_domain, get_reverse_dns
+
+from .models import DmarcReport, IpEnrichment, SenderRollup
+
+logger = logging.getLogger(__name__)
+
+def geoip_database_path():
+    """
+    settings.GEOIP_DATABASE, or the IPinfo Lite database bundled with parsedmarc.
+    """
+    if settings.GEOIP_DATABASE:
+        return settings.GEOIP_DATABASE
+    import parsedmarc.resources.ipinfo
+    return str(files(parsedmarc.resources.ipinfo).joinpath("ipinfo_lite.mmdb"))
+
+def normalize_ip(value):
+    """
+    The IP as the database stores it, or None if `value` is not an IP address.
+    """
+    try:
+        address = ipaddress.ip_address(value)
+    except ValueError:
+        return None
+    return clean_ipv6_address(value) if address.version == 6 else str(address)
+
+class LruCache:
+    """
+    Bounded mapping that evicts the least recently used entry.
+    """
+    def __init__(self, size):
+        self.size = size
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        if key not in self._entries:
+            return None
+        self._entries.move_to_end(key)
+        return self._entries[key]
+
+    def set(self, key, value):
+        self._entries[key] = value
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+
+class IpEnricher:
+    """
+    Reverse DNS, base domain and country per sender IP, looked up once and
+    reused: in-process LRU -> IpEnrichment table (until IP_ENRICHMENT_TTL_DAYS)
+    -> resolution. Country comes from a local GeoIP file; reverse DNS lookups
+    for a batch run concurrently in a bounded thread pool.
+
+    With offline=True no DNS query is made: new IPs get their country only and
+    stay pending until `manage.py enrich_ips` resolves them and fills the
+    report rows in. Cached entries are used whatever their age.
+    """
+    def __init__(self, offline=False, workers=None, lru_size=10000):
+        self.offline = offline
+        self.workers = workers or settings.IP_ENRICHMENT_WORKERS
+        self.lru = LruCache(lru_size)
+        self._geoip = None
+
+    def is_fresh(self, entry):
+        if self.offline:
+            return True
+        cutoff = timezone.now() - timedelta(days=settings.IP_ENRICHMENT_TTL_DAYS)
+        return entry.dns_resolved_at is not None and entry.dns_resolved_at >= cutoff
+
+    def country(self, ip):
+        if self._geoip is None:
+            self._geoip = maxminddb.open_database(geoip_database_path())
+        try:
+            record = self._geoip.get(ip)
+        except ValueError:
+            return ""
+        if not isinstance(record, dict):
+            return ""
+        # IPinfo Lite has a flat country_code, MaxMind/DB-IP a nested country.iso_code
+        country = record.get("country_code") or (record.get("country") or {}).get("iso_code")
+        return (country or "")[:2]
+
+    def reverse_dns(self, ip):
+        try:
+            return get_reverse_dns(ip, timeout=settings.IP_ENRICHMENT_DNS_TIMEOUT, retries=0) or ""
+        except Exception as e:
+            # A resolver failure must not fail the ingest; the entry expires and is retried
+            logger.debug("Reverse DNS for %s failed: %s", ip, e)
+            return ""
+
+    def resolve(self, ips):
+        """
+        Looks up `ips` afresh and stores the results. Returns {ip: IpEnrichment}.
+        """
+        ips = sorted(ips)
+        if not ips:
+            return {}
+
+        if self.offline:
+            hostnames = dict.fromkeys(ips, "")
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.workers, len(ips))) as pool:
+                hostnames = dict(zip(ips, pool.map(self.reverse_dns, ips)))
+
+        now = timezone.now()
+        entries = [
+            IpEnrichment(
+                ip=ip,
+                reverse_dns=hostnames[ip][:255],
+                base_domain=(get_base_domain(hostnames[ip]) or "")[:255] if hostnames[ip] else "",
+                country_code=self.country(ip),
+                dns_resolved_at=None if self.offline else now,
+            )
+            for ip in ips
+        ]
+        IpEnrichment.objects.bulk_create(
+            entries,
+            update_conflicts=True,
+            unique_fields=['ip'],
+            update_fields=['reverse_dns', 'base_domain', 'country_code', 'dns_resolved_at'],
+        )
+        return {entry.ip: entry for entry in entries}
+
+    def lookup(self, ips):
+        """
+        Returns {ip: IpEnrichment} for `ips`, resolving only what no cache has.
+        """
+        found = {}
+        missing = set()
+        for ip in ips:
+            entry = self.lru.get(ip)
+            if entry is not None and self.is_fresh(entry):
+                found[ip] = entry
+            else:
+                missing.add(ip)
+
+        if missing:
+            for entry in IpEnrichment.objects.filter(ip__in=missing):
+                if self.is_fresh(entry):
+                    found[entry.ip] = entry
+                    missing.discard(entry.ip)
+            found.update(self.resolve(missing))
+
+        for ip, entry in found.items():
+            self.lru.set(ip, entry)
+        return found
+
+    def enrich_reports(self, reports):
+        """
+        Fills in the source hostname, base domain and country of every record of
+        parsed `reports`, in place. Values parsedmarc already set are kept when
+        the enrichment has nothing better.
+        """
+        sources = [
+            record.setdefault("source", {})
+            for report in reports
+            for record in report["records"]
+        ]
+        ips = {source.get("ip_address"): normalize_ip(source.get("ip_address") or "") for source in sources}
+        entries = self.lookup({ip for ip in ips.values() if ip})
+
+        for source in sources:
+            entry = entries.get(ips[source.get("ip_address")])
+            if entry is None:
+                continue
+            source["reverse_dns"] = entry.reverse_dns or source.get("reverse_dns")
+            source["base_domain"] = entry.base_domain or source.get("base_domain")
+            source["country"] = entry.country_code or source.get("country")
+
+def register_known_ips():
+    """
+    Queues every sender IP seen so far (from the sender rollups) that has no
+    enrichment entry yet, e.g. after upgrading. Returns how many were added.
+    """
+    known = IpEnrichment.objects.values('ip')
+    ips = SenderRollup.objects.exclude(source_ip__in=known).values_list('source_ip', flat=True).distinct()
+    created = IpEnrichment.objects.bulk_create([IpEnrichment(ip=ip) for ip in ips], ignore_conflicts=True)
+    return len(created)
+
+def pending_ips(limit):
+    """
+    Entries whose DNS lookup was deferred or has expired, never-resolved first.
+    """
+    cutoff = timezone.now() - timedelta(days=settings.IP_ENRICHMENT_TTL_DAYS)
+    return list(
+        IpEnrichment.objects
+        .filter(Q(dns_resolved_at__isnull=True) | Q(dns_resolved_at__lt=cutoff))
+        .order_by(F('dns_resolved_at').asc(nulls_first=True))
+        .values_list('ip', flat=True)[:limit]
+    )
+
+def backfill_reports(entries):
+    """
+    Copies resolved hostnames into the report rows and sender rollups that
+    were ingested without one. One UPDATE per IP, served by the source_ip index.
+    Returns the number of report rows updated.
+    """
+    updated = 0
+    for entry in entries:
+        if not entry.reverse_dns:
+            continue
+        updated += DmarcReport.objects.filter(source_ip=entry.ip).filter(
+            Q(source_hostname__isnull=True) | Q(source_hostname="")
+        ).update(
+            source_hostname=entry.reverse_dns,
+            source_base_domain=entry.base_domain,
+            country_code=entry.country_code or F('country_code'),
+        )
+        SenderRollup.objects.filter(source_ip=entry.ip, source_hostname="").update(
+            source_hostname=entry.reverse_dns,
+            source_base_domain=entry.base_domain,
+        )
+    return updated
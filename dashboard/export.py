@@ -0,0 +1,177 @@
+import csv
+import json
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .models import DmarcReport
+
+# (column, DmarcReport lookup, Parquet type)
+EXPORT_COLUMNS = [
+    ('date_begin', 'date_begin', 'timestamp'),
+    ('date_end', 'date_end', 'timestamp'),
+    ('domain', 'domain_entity__domain_name', 'string'),
+    ('report_id', 'report_id', 'string'),
+    ('source_ip', 'source_ip', 'string'),
+    ('source_hostname', 'source_hostname', 'string'),
+    ('source_base_domain', 'source_base_domain', 'string'),
+    ('country_code', 'country_code', 'string'),
+    ('count', 'count', 'int64'),
+    ('disposition', 'disposition', 'string'),
+    ('spf_aligned', 'spf_aligned', 'bool'),
+    ('dkim_aligned', 'dkim_aligned', 'bool'),
+    ('threat_level', 'threat_level', 'string'),
+    ('spf_result', 'spf_result', 'string'),
+    ('spf_domain', 'spf_domain', 'string'),
+    ('dkim_result', 'dkim_result', 'string'),
+    ('dkim_selector', 'dkim_selector', 'string'),
+    ('header_from', 'header_from', 'string'),
+    ('envelope_from', 'envelope_from', 'string'),
+    ('is_acknowledged', 'is_acknowledged', 'bool'),
+]
+
+COLUMN_NAMES = [name for name, _, _ in EXPORT_COLUMNS]
+
+# format -> (content type, file extension)
+EXPORT_FORMATS = {
+    'csv': ('text/csv; charset=utf-8', 'csv'),
+    'ndjson': ('application/x-ndjson', 'ndjson'),
+    'parquet': ('application/vnd.apache.parquet', 'parquet'),
+}
+
+class ExportError(Exception):
+    pass
+
+def export_queryset(domain=None, days=None, threats_only=False, source_ip=None):
+    """
+    The rows to export, with the filters of the pages they come from:
+    domain + period (domain_detail), open threats + period (active_threats),
+    source IP (report_list). `days=None` means all time.
+    """
+    reports = DmarcReport.objects.all()
+    if days:
+        date_end = timezone.now()
+        reports = reports.filter(date_begin__gte=date_end - timedelta(days=days), date_begin__lte=date_end)
+    if domain:
+        reports = reports.filter(domain_entity=domain)
+    if source_ip:
+        reports = reports.filter(source_ip=source_ip)
+    if threats_only:
+        reports = reports.filter(threat_level=DmarcReport.THREAT_RED, is_acknowledged=False)
+    return reports
+
+def iter_rows(reports, chunk_size=2000):
+    """
+    Yields value tuples in EXPORT_COLUMNS order through a server-side cursor,
+    `chunk_size` rows per fetch: memory stays flat however many rows match.
+    """
+    lookups = [lookup for _, lookup, _ in EXPORT_COLUMNS]
+    return reports.order_by('date_begin', 'id').values_list(*lookups).iterator(chunk_size=chunk_size)
+
+class Echo:
+    """
+    File-like object whose write() hands the data back, for csv.writer.
+    """
+    def write(self, value):
+        return value
+
+def iter_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(COLUMN_NAMES)
+    for row in rows:
+        yield writer.writerow(row)
+
+def iter_ndjson(rows):
+    for row in rows:
+        record = dict(zip(COLUMN_NAMES, row))
+        record['date_begin'] = record['date_begin'].isoformat()
+        record['date_end'] = record['date_end'].isoformat()
+        yield json.dumps(record) + "\n"
+
+class ChunkSink:
+    """
+    Write-only file for pyarrow that keeps what was written until drained,
+    so finished row groups can be streamed out while the next is built.
+    """
+    closed = False
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+def parquet_schema():
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ExportError("Parquet export needs pyarrow (pip install pyarrow)")
+    types = {
+        'timestamp': pa.timestamp('us', tz='UTC'),
+        'string': pa.string(),
+        'int64': pa.int64(),
+        'bool': pa.bool_(),
+    }
+    return pa.schema([(name, types[kind]) for name, _, kind in EXPORT_COLUMNS])
+
+def iter_parquet(rows, row_group_size=50000):
+    """
+    Parquet, one row group per `row_group_size` rows; each group is sent as
+    soon as it is written, and only one is held in memory.
+    """
+    schema = parquet_schema()
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    sink = ChunkSink()
+    writer = pq.ParquetWriter(sink, schema, compression='zstd')
+
+    def write_group(batch):
+        columns = list(zip(*batch))
+        writer.write_table(pa.Table.from_arrays(
+            [pa.array(column, type=field.type) for column, field in zip(columns, schema)],
+            schema=schema
+        ))
+
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= row_group_size:
+            write_group(batch)
+            batch = []
+            yield sink.drain()
+    if batch:
+        write_group(batch)
+    writer.close()
+    yield sink.drain()
+
+def export_stream(reports, export_format):
+    """
+    The export of `reports` as an iterator of str (csv, ndjson) or bytes (parquet) chunks.
+    """
+    if export_format not in EXPORT_FORMATS:
+        raise ExportError(f"Unknown format '{export_format}', use one of: {', '.join(EXPORT_FORMATS)}")
+    if export_format == 'parquet':
+        # Fail before the response starts, not half-way through it
+        parquet_schema()
+        return iter_parquet(iter_rows(reports))
+    if export_format == 'ndjson':
+        return iter_ndjson(iter_rows(reports))
+    return iter_csv(iter_rows(reports))
@@ -0,0 +1,79 @@
+import hashlib
+import logging
+import mailbox
+from pathlib import Path
+
+from parsedmarc import parse_report_file, ParserError
+
+logger = logging.getLogger(__name__)
+
+# Anything parsedmarc can read from disk; .mbox files are split into messages first
+REPORT_SUFFIXES = ('.xml', '.xml.gz', '.gz', '.zip', '.eml', '.mbox')
+
+def is_mbox(path):
+    return path.name.lower().endswith('.mbox')
+
+def iter_report_files(root):
+    """
+    Yields every report file under `root` (recursively), in a stable order.
+    `root` may also be a single file.
+    """
+    root = Path(root)
+    if root.is_file():
+        yield root
+        return
+
+    for path in sorted(root.rglob('*')):
+        if path.is_file() and path.name.lower().endswith(REPORT_SUFFIXES):
+            yield path
+
+def file_digest(path):
+    """
+    SHA-256 of the file contents, read in chunks.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def iter_file_payloads(root, known_digests=()):
+    """
+    Yields ((path, digest, is_last), payload) for every report in every new file.
+    A file yields one payload, an mbox one per message (or a single None when it
+    has none); `is_last` marks the file's final payload so the caller knows when
+    the file is fully imported.
+    Files whose digest is in `known_digests`, or repeated within this run, are skipped.
+    """
+    seen = set(known_digests)
+    for path in iter_report_files(root):
+        digest = file_digest(path)
+        if digest in seen:
+            continue
+        # The same file can sit in several folders of an archive
+        seen.add(digest)
+
+        if is_mbox(path):
+            box = mailbox.mbox(path)
+            keys = box.keys()
+            for index, key in enumerate(keys):
+                yield (str(path), digest, index == len(keys) - 1), box.get_bytes(key)
+            if not keys:
+                # Still yielded once, so the empty file gets marked as imported
+                yield (str(path), digest, True), None
+        else:
+            yield (str(path), digest, True), path.read_bytes()
+
+def parse_payload(payload, offline=False):
+    """
+    Parses raw XML, gzip, zip or email bytes. Returns None if it is not a valid
+    report, and a result without a report_type for the None of an empty mbox.
+    Kept at module level so it can be pickled into a worker process.
+    """
+    if payload is None:
+        return {"report_type": None}
+    try:
+        return parse_report_file(payload, offline=offline)
+    except ParserError as e:
+        logger.warning("Could not parse file: %s", e)
+        return None
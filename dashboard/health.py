@@ -0,0 +1,30 @@
+from django.db import DatabaseError, connection
+from django.db.migrations.executor import MigrationExecutor
+
+# Set once every migration is applied; they are not un-applied at runtime
+_migrated = False
+
+def pending_migrations():
+    """
+    The migrations `migrate` would apply, in order (empty when up to date).
+    """
+    executor = MigrationExecutor(connection)
+    return executor.migration_plan(executor.loader.graph.leaf_nodes())
+
+def readiness_problems():
+    """
+    Why this process should not receive traffic yet: [] when the database
+    answers and the schema is current.
+    """
+    global _migrated
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT 1")
+        if not _migrated:
+            pending = pending_migrations()
+            if pending:
+                return [f"{len(pending)} unapplied migrations"]
+            _migrated = True
+    except DatabaseError as e:
+        return [f"database unavailable: {e}"]
+    return []
@@ -0,0 +1,359 @@
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils.timezone import make_aware
+from django.utils.dateparse import parse_datetime
+from datetime import datetime, timezone
+
+from .acknowledge import SenderRules
+from .models import (
+    AuthDomain, DkimResult, DkimSelector, DmarcReport, DomainEntity, Organization,
+    ReportHeader, SenderRollup, SpfResult,
+)
+
+def parse_date(value):
+    """
+    Robustly parses a date value which might be a float timestamp,
+    a string timestamp, a string datetime, or a datetime object.
+    """
+    if value is None:
+        return None
+
+    # 1. If it's already a datetime object
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            return make_aware(value)
+        return value
+
+    # 2. Try parsing as a timestamp (float/int/string)
+    try:
+        return datetime.fromtimestamp(float(value), tz=timezone.utc)
+    except (ValueError, TypeError):
+        pass
+
+    # 3. Try parsing as a standard datetime string (ISO or SQL-like)
+    if isinstance(value, str):
+        # Django's helper handles 'YYYY-MM-DD HH:MM:SS' and ISO formats
+        dt = parse_datetime(value)
+        if dt is not None:
+            if dt.tzinfo is None:
+                return make_aware(dt)
+            return dt
+
+    return None
+
+def report_dates(metadata):
+    """
+    Returns (date_begin, date_end) for a report, trying every key layout
+    parsedmarc has used over the years. Falls back to 'now'.
+    """
+    date_begin = None
+    date_end = None
+
+    # 1. Try standard 'date_range' (Most common)
+    if "date_range" in metadata:
+        date_begin = parse_date(metadata["date_range"].get("begin"))
+        date_end = parse_date(metadata["date_range"].get("end"))
+
+    # 2. Try 'begin_date' / 'end_date' keys
+    if not date_begin and "begin_date" in metadata:
+        date_begin = parse_date(metadata.get("begin_date"))
+    if not date_end and "end_date" in metadata:
+        date_end = parse_date(metadata.get("end_date"))
+
+    # 3. Try flat 'begin' / 'end' keys
+    if not date_begin:
+        date_begin = parse_date(metadata.get("begin"))
+    if not date_end:
+        date_end = parse_date(metadata.get("end"))
+
+    # 4. Fallback: If all parsing failed, use Now
+    if not date_begin:
+        date_begin = datetime.now(timezone.utc)
+    if not date_end:
+        date_end = datetime.now(timezone.utc)
+
+    return date_begin, date_end
+
+class DomainResolver:
+    """
+    In-process cache of DomainEntity rows for one ingest run.
+    All known domains are loaded once; unknown ones are created in bulk
+    under the default "Unassigned" organisation.
+    """
+    def __init__(self):
+        self._default_org = None
+        self._entities = {entity.domain_name: entity for entity in DomainEntity.objects.all()}
+
+    @property
+    def default_org(self):
+        if self._default_org is None:
+            self._default_org, _ = Organization.objects.get_or_create(
+                name="Unassigned",
+                defaults={"slug": "unassigned"}
+            )
+        return self._default_org
+
+    def resolve_many(self, domain_names):
+        """
+        Returns {domain_name: DomainEntity}, creating missing domains in one INSERT.
+        """
+        missing = set(domain_names) - self._entities.keys()
+        if missing:
+            # ignore_conflicts covers a concurrent ingest creating the same domain
+            DomainEntity.objects.bulk_create(
+                [DomainEntity(organization=self.default_org, domain_name=name) for name in missing],
+                ignore_conflicts=True
+            )
+            for entity in DomainEntity.objects.filter(domain_name__in=missing):
+                self._entities[entity.domain_name] = entity
+
+        return {name: self._entities[name] for name in domain_names}
+
+    def resolve(self, domain_name):
+        return self.resolve_many([domain_name])[domain_name]
+
+def build_report_rows(report, entity):
+    """
+    Maps every <record> of a parsed aggregate report to an unsaved DmarcReport.
+    """
+    metadata = report["report_metadata"]
+    policy_pub = report["policy_published"]
+    report_id = metadata.get("report_id")
+
+    # Dates are per report, not per record, so only parse them once
+    date_begin, date_end = report_dates(metadata)
+
+    rows = []
+    for record in report["records"]:
+        source = record.get("source", {})
+        alignment = record.get("alignment", {})
+        auth_results = record.get("auth_results", {})
+        identifiers = record.get("identifiers", {})
+
+        # Handle flat vs nested structure
+        if "row" in record and isinstance(record["row"], dict):
+            count = int(record["row"].get("count", 0))
+            policy_eval = record["row"].get("policy_evaluated", {})
+        else:
+            count = int(record.get("count", 0))
+            policy_eval = record.get("policy_evaluated", {})
+
+        # Extract DKIM domains
+        dkim_domains = [
+            d["domain"] for d in auth_results.get("dkim", []) if "domain" in d
+        ]
+
+        dkim_aligned = alignment.get("dkim", False)
+        spf_aligned = alignment.get("spf", False)
+
+        rows.append(DmarcReport(
+            domain_entity=entity,
+            report_id=report_id,
+            date_begin=date_begin,
+            date_end=date_end,
+            source_ip=source.get("ip_address", "0.0.0.0"),
+            source_hostname=source.get("reverse_dns"),
+            source_base_domain=source.get("base_domain"),
+            country_code=source.get("country"),
+            count=count,
+            disposition=policy_eval.get("disposition", "none"),
+            dkim_aligned=dkim_aligned,
+            spf_aligned=spf_aligned,
+            header_from=policy_pub.get("domain", ""),
+            envelope_from=identifiers.get("envelope_from"),
+            dkim_domains=dkim_domains,
+            auth_results=auth_results,
+            **DmarcReport.classify(spf_aligned, dkim_aligned, auth_results)
+        ))
+    return rows
+
+def report_key(report):
+    """
+    The (org_name, report_id) pair that identifies a report across ingests.
+    """
+    metadata = report["report_metadata"]
+    return (metadata.get("org_name") or "", metadata.get("report_id") or "")
+
+def existing_report_keys(reports):
+    """
+    Returns the keys of `reports` that are already ingested, using ONE query
+    for the whole batch. Legacy headers (empty org_name) match any org.
+    """
+    report_ids = {report_key(report)[1] for report in reports} - {""}
+    if not report_ids:
+        return set()
+
+    existing = set(
+        ReportHeader.objects.filter(report_id__in=report_ids).values_list('org_name', 'report_id')
+    )
+    legacy_ids = {report_id for org_name, report_id in existing if not org_name}
+
+    return {
+        key for key in map(report_key, reports)
+        if key in existing or key[1] in legacy_ids
+    }
+
+def claim_report(report, entity):
+    """
+    Inserts the report header, relying on the unique constraint instead of a
+    check-then-insert. Returns False if another ingest already owns this report.
+    Must be called inside the transaction that writes the report's rows.
+    """
+    org_name, report_id = report_key(report)
+    if not report_id:
+        # Nothing to deduplicate on, always ingest
+        return True
+
+    date_begin, date_end = report_dates(report["report_metadata"])
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            INSERT INTO {ReportHeader._meta.db_table}
+                (domain_entity_id, org_name, report_id, date_begin, date_end, created_at)
+            VALUES (%s, %s, %s, %s, %s, now())
+            ON CONFLICT (org_name, report_id) DO NOTHING
+            RETURNING id
+            """,
+            [entity.pk, org_name, report_id, date_begin, date_end]
+        )
+        return cursor.fetchone() is not None
+
+def update_sender_rollups(rows, reporter="", batch_size=1000):
+    """
+    Folds freshly written report rows into SenderRollup: rows are summed per
+    sender in Python, then upserted with one INSERT ... ON CONFLICT per batch.
+    Runs in the same transaction as the rows, so a report rejected by
+    claim_report() is never counted twice.
+    """
+    rollups = {}
+    for row in rows:
+        key = (row.domain_entity_id, row.source_ip, row.spf_aligned, row.dkim_aligned, row.disposition)
+        rollup = rollups.setdefault(key, {
+            "base_domain": "", "hostname": "", "total": 0, "rows": 0,
+            "first": row.date_begin, "last": row.date_begin,
+        })
+        rollup["base_domain"] = row.source_base_domain or rollup["base_domain"]
+        rollup["hostname"] = row.source_hostname or rollup["hostname"]
+        rollup["total"] += row.count
+        rollup["rows"] += 1
+        rollup["first"] = min(rollup["first"], row.date_begin)
+        rollup["last"] = max(rollup["last"], row.date_begin)
+
+    reporters = [reporter] if reporter else []
+    items = list(rollups.items())
+    for start in range(0, len(items), batch_size):
+        batch = items[start:start + batch_size]
+        params = []
+        for key, rollup in batch:
+            params.extend(key)
+            params.extend([
+                rollup["base_domain"], rollup["hostname"], rollup["total"], rollup["rows"],
+                rollup["first"], rollup["last"], reporters,
+            ])
+        values = ", ".join(["(%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s::varchar[])"] * len(batch))
+
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"""
+                INSERT INTO {SenderRollup._meta.db_table} AS s
+                    (domain_entity_id, source_ip, spf_aligned, dkim_aligned, disposition,
+                     source_base_domain, source_hostname, total_count, row_count,
+                     first_seen, last_seen, reporters)
+                VALUES {values}
+                ON CONFLICT (domain_entity_id, source_ip, spf_aligned, dkim_aligned, disposition) DO UPDATE SET
+                    source_base_domain = COALESCE(NULLIF(EXCLUDED.source_base_domain, ''), s.source_base_domain),
+                    source_hostname = COALESCE(NULLIF(EXCLUDED.source_hostname, ''), s.source_hostname),
+                    total_count = s.total_count + EXCLUDED.total_count,
+                    row_count = s.row_count + EXCLUDED.row_count,
+                    first_seen = LEAST(s.first_seen, EXCLUDED.first_seen),
+                    last_seen = GREATEST(s.last_seen, EXCLUDED.last_seen),
+                    reporters = CASE
+                        WHEN EXCLUDED.reporters <@ s.reporters THEN s.reporters
+                        ELSE s.reporters || EXCLUDED.reporters
+                    END
+                """,
+                params
+            )
+
+def intern_names(model, names):
+    """
+    Returns {name: id} for `names` in an AuthDomain/DkimSelector-style table,
+    inserting the missing ones.
+    """
+    names = {name[:255] for name in names if name}
+    if not names:
+        return {}
+    model.objects.bulk_create([model(name=name) for name in names], ignore_conflicts=True)
+    return dict(model.objects.filter(name__in=names).values_list('name', 'id'))
+
+def auth_entries(auth_results, kind):
+    entries = (auth_results or {}).get(kind, [])
+    if not isinstance(entries, list):
+        return []
+    return [entry for entry in entries if isinstance(entry, dict)]
+
+def write_auth_results(rows, auth_results, batch_size=1000):
+    """
+    Writes the SPF and DKIM checks of freshly inserted `rows` (with their
+    parsed auth_results, in the same order) into the typed result tables.
+    """
+    spf_entries = [auth_entries(results, 'spf') for results in auth_results]
+    dkim_entries = [auth_entries(results, 'dkim') for results in auth_results]
+
+    domains = intern_names(AuthDomain, (
+        entry.get('domain') for entries in spf_entries + dkim_entries for entry in entries
+    ))
+    selectors = intern_names(DkimSelector, (
+        entry.get('selector') for entries in dkim_entries for entry in entries
+    ))
+
+    spf_results = []
+    dkim_results = []
+    for row, spf, dkim in zip(rows, spf_entries, dkim_entries):
+        shared = dict(report_row_id=row.id, date_begin=row.date_begin, domain_entity_id=row.domain_entity_id, count=row.count)
+        for entry in spf:
+            spf_results.append(SpfResult(
+                domain_id=domains.get((entry.get('domain') or '')[:255]),
+                scope=(entry.get('scope') or '')[:16],
+                result=(entry.get('result') or 'unknown')[:32],
+                **shared
+            ))
+        for entry in dkim:
+            dkim_results.append(DkimResult(
+                domain_id=domains.get((entry.get('domain') or '')[:255]),
+                selector_id=selectors.get((entry.get('selector') or '')[:255]),
+                result=(entry.get('result') or 'unknown')[:32],
+                **shared
+            ))
+
+    SpfResult.objects.bulk_create(spf_results, batch_size=batch_size)
+    DkimResult.objects.bulk_create(dkim_results, batch_size=batch_size)
+
+def write_report(report, entity, batch_size=1000, sender_rules=None):
+    """
+    Claims the report header, inserts its rows (and their SPF/DKIM results) in
+    batches of `batch_size` and folds them into the sender rollups. Threats from
+    acknowledged senders (`sender_rules`, loaded if not given) arrive acknowledged.
+    The whole report is a single transaction, so a failure half-way through
+    never leaves a partial report behind (which dedup would then skip forever).
+    Returns the number of rows written, or None if the report was a duplicate.
+    """
+    rows = build_report_rows(report, entity)
+    if sender_rules is None:
+        sender_rules = SenderRules.load()
+    sender_rules.apply(rows)
+    auth_results = [row.auth_results for row in rows]
+    if not settings.STORE_RAW_AUTH_RESULTS:
+        # The typed result tables carry the same data
+        for row in rows:
+            row.auth_results = {}
+            row.dkim_domains = []
+
+    with transaction.atomic():
+        if not claim_report(report, entity):
+            return None
+        # Postgres returns the new ids, which the result tables link to
+        DmarcReport.objects.bulk_create(rows, batch_size=batch_size)
+        write_auth_results(rows, auth_results, batch_size=batch_size)
+        update_sender_rollups(rows, report_key(report)[0], batch_size=batch_size)
+    return len(rows)
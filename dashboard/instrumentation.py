@@ -0,0 +1,227 @@
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.template.backends.django import DjangoTemplates, Template
+
+from .caching import HITS_KEY, MISSES_KEY
+
+logger = logging.getLogger(__name__)
+
+# The recorder of the request being handled, read by the template backend below
+current_recorder = ContextVar('dmarc_request_recorder', default=None)
+
+class RequestRecorder:
+    """
+    Per-request counters. Installed as a DB execute wrapper, so it sees every
+    query the request runs, including lazy ones triggered from templates.
+    """
+    def __init__(self, keep_slowest=5):
+        # Query pool threads (dashboard.queries) report to the same recorder
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.template_seconds = 0.0
+        self.keep_slowest = keep_slowest
+        self.slowest = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.queries += 1
+                self.db_seconds += elapsed
+                if len(self.slowest) < self.keep_slowest or elapsed > self.slowest[-1][0]:
+                    self.slowest.append((elapsed, sql))
+                    self.slowest.sort(key=lambda query: query[0], reverse=True)
+                    del self.slowest[self.keep_slowest:]
+
+    def server_timing(self, total_seconds):
+        """
+        Server-Timing header value. Queries run while rendering count towards
+        both `db` and `tpl`, so the parts can add up to more than `total`.
+        """
+        return ", ".join([
+            f'db;dur={self.db_seconds * 1000:.1f};desc="{self.queries} queries"',
+            f'tpl;dur={self.template_seconds * 1000:.1f}',
+            f'total;dur={total_seconds * 1000:.1f}',
+        ])
+
+@contextmanager
+def record_queries():
+    """
+    Counts this thread's queries towards the current request's recorder, for
+    threads querying on a request's behalf. Does nothing outside a recorded request.
+    """
+    recorder = current_recorder.get()
+    if recorder is None:
+        yield
+        return
+    with connection.execute_wrapper(recorder):
+        yield
+
+class TimedTemplate(Template):
+    def render(self, context=None, request=None):
+        recorder = current_recorder.get()
+        if recorder is None:
+            return super().render(context, request)
+        started = time.perf_counter()
+        try:
+            return super().render(context, request)
+        finally:
+            recorder.template_seconds += time.perf_counter() - started
+
+class TimedDjangoTemplates(DjangoTemplates):
+    """
+    The regular Django template backend, timing each top-level render
+    (includes are part of their parent's render).
+    """
+    def from_string(self, template_code):
+        return TimedTemplate(super().from_string(template_code).template, self)
+
+    def get_template(self, template_name):
+        return TimedTemplate(super().get_template(template_name).template, self)
+
+class ViewMetrics:
+    """
+    Running totals per view for /metrics. They live in process memory, so with
+    several worker processes each scrape sees the worker that answered it.
+    """
+    FIELDS = ('requests', 'seconds', 'queries', 'db_seconds', 'template_seconds')
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+
+    def observe(self, view, total_seconds, recorder):
+        with self._lock:
+            totals = self._views.setdefault(view, dict.fromkeys(self.FIELDS, 0))
+            totals['requests'] += 1
+            totals['seconds'] += total_seconds
+            totals['queries'] += recorder.queries
+            totals['db_seconds'] += recorder.db_seconds
+            totals['template_seconds'] += recorder.template_seconds
+
+    def snapshot(self):
+        with self._lock:
+            return {view: dict(totals) for view, totals in self._views.items()}
+
+    def reset(self):
+        with self._lock:
+            self._views.clear()
+
+METRICS = ViewMetrics()
+
+# (metric name, type, help, field of ViewMetrics)
+PROMETHEUS_SERIES = [
+    ('dmarc_http_requests_total', 'counter', 'Requests handled, per view.', 'requests'),
+    ('dmarc_http_request_seconds_total', 'counter', 'Time spent handling requests, per view.', 'seconds'),
+    ('dmarc_db_queries_total', 'counter', 'SQL queries run by requests, per view.', 'queries'),
+    ('dmarc_db_query_seconds_total', 'counter', 'Time spent in SQL queries, per view.', 'db_seconds'),
+    ('dmarc_template_render_seconds_total', 'counter', 'Time spent rendering templates, per view.', 'template_seconds'),
+]
+
+def label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def prometheus_metrics():
+    """
+    Request metrics and page cache counters in the Prometheus text format.
+    """
+    views = METRICS.snapshot()
+    lines = []
+    for name, kind, help_text, field in PROMETHEUS_SERIES:
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {kind}")
+        for view, totals in sorted(views.items()):
+            lines.append(f'{name}{{view="{label_value(view)}"}} {totals[field]:g}')
+
+    # Shared between processes when the cache is
+    for name, key in (('dmarc_page_cache_hits_total', HITS_KEY), ('dmarc_page_cache_misses_total', MISSES_KEY)):
+        lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name} {cache.get(key, 0)}")
+    return "\n".join(lines) + "\n"
+
+class InstrumentationMiddleware:
+    """
+    Opt-in (settings.INSTRUMENTATION): adds a Server-Timing header to every
+    response, feeds /metrics and logs the slowest queries of slow requests.
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        recorder = RequestRecorder()
+        token = current_recorder.set(recorder)
+        started = time.perf_counter()
+        try:
+            with connection.execute_wrapper(recorder):
+                response = self.get_response(request)
+        finally:
+            current_recorder.reset(token)
+        total_seconds = time.perf_counter() - started
+
+        response['Server-Timing'] = recorder.server_timing(total_seconds)
+        match = request.resolver_match
+        view = match.view_name if match else 'unresolved'
+        METRICS.observe(view, total_seconds, recorder)
+
+        if total_seconds * 1000 >= settings.INSTRUMENTATION_SLOW_REQUEST_MS:
+            logger.warning(
+                "Slow request %s %s: %.0fms, %d queries (%.0fms). Slowest:\n%s",
+                request.method, request.get_full_path(), total_seconds * 1000,
+                recorder.queries, recorder.db_seconds * 1000,
+                "\n".join(f"  {seconds * 1000:.1f}ms {sql}" for seconds, sql in recorder.slowest)
+            )
+        return response
+
+class StageTimer:
+    """
+    Wall time per ingest stage (fetch, parse, dedup, insert, ...). Stages may
+    nest, e.g. parsing pulls the next message from the fetch generator; each
+    stage is charged its own time only, so the totals add up to the run time.
+    """
+    def __init__(self):
+        self.totals = {}
+        self._stack = []
+
+    @contextmanager
+    def stage(self, name):
+        # [start, time spent in nested stages]
+        frame = [time.perf_counter(), 0.0]
+        self._stack.append(frame)
+        try:
+            yield
+        finally:
+            self._stack.pop()
+            elapsed = time.perf_counter() - frame[0]
+            self.totals[name] = self.totals.get(name, 0.0) + elapsed - frame[1]
+            if self._stack:
+                self._stack[-1][1] += elapsed
+
+    def timed(self, name, iterable):
+        """
+        Yields from `iterable`, charging the time spent producing each item to `name`.
+        """
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def summary(self):
+        return ", ".join(f"{name} {seconds:.2f}s" for name, seconds in self.totals.items())
+
+    def reset(self):
+        self.totals = {}
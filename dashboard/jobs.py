@@ -0,0 +1,90 @@
+import io
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import IngestJob
+
+# Arbitrary key for the Postgres advisory lock that serialises enqueueing
+ENQUEUE_LOCK_KEY = 0x444D4152  # "DMAR"
+
+def stale_jobs():
+    """
+    Running jobs whose worker stopped reporting progress (killed, OOM, host lost).
+    """
+    cutoff = timezone.now() - timedelta(minutes=settings.INGEST_JOB_STALE_MINUTES)
+    return IngestJob.objects.filter(status=IngestJob.RUNNING).filter(
+        Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True)
+    )
+
+def fail_stale_jobs():
+    """
+    Marks stale running jobs as failed. Returns how many there were.
+    """
+    return stale_jobs().update(
+        status=IngestJob.FAILED,
+        output="The worker running this sync stopped responding",
+        finished_at=timezone.now()
+    )
+
+def enqueue_ingest(limit=10):
+    """
+    Returns (job, created). If an ingest is already queued or running, that job
+    is returned instead of starting a second IMAP session next to it. A stale
+    running job is failed first, so a dead worker can't block syncing for good.
+    """
+    with transaction.atomic():
+        # Held until commit, so two simultaneous clicks can't both see "no active job"
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT pg_advisory_xact_lock(%s)", [ENQUEUE_LOCK_KEY])
+
+        fail_stale_jobs()
+        active = IngestJob.objects.filter(
+            status__in=[IngestJob.QUEUED, IngestJob.RUNNING]
+        ).order_by('created_at').first()
+        if active:
+            return active, False
+
+        return IngestJob.objects.create(limit=limit), True
+
+def claim_next_job():
+    """
+    Atomically moves the oldest queued job to 'running' and returns it (or None).
+    SKIP LOCKED lets several workers poll the same table safely.
+    """
+    with transaction.atomic():
+        job = IngestJob.objects.select_for_update(skip_locked=True).filter(
+            status=IngestJob.QUEUED
+        ).order_by('created_at').first()
+        if job is None:
+            return None
+
+        job.status = IngestJob.RUNNING
+        job.started_at = job.heartbeat_at = timezone.now()
+        job.save(update_fields=['status', 'started_at', 'heartbeat_at'])
+    return job
+
+def run_job(job):
+    """
+    Runs ingest_dmarc for a claimed job. The command reports progress (and
+    failures) on the job itself; this only closes it out.
+    """
+    out = io.StringIO()
+    try:
+        call_command('ingest_dmarc', limit=job.limit, stream=True, job_id=job.pk, stdout=out)
+    except Exception as e:
+        IngestJob.objects.filter(pk=job.pk).update(
+            status=IngestJob.FAILED, output=str(e), finished_at=timezone.now()
+        )
+        return
+
+    output_text = out.getvalue()
+    IngestJob.objects.filter(pk=job.pk, status=IngestJob.RUNNING).update(
+        status=IngestJob.DONE,
+        output=output_text.splitlines()[-1] if output_text else 'Done',
+        finished_at=timezone.now()
+    )
@@ -0,0 +1,81 @@
+import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from parsedmarc import parse_report_email, ParserError
+
+logger = logging.getLogger(__name__)
+
+# Same archive layout parsedmarc uses in its batch mode, so both modes can share a mailbox
+ARCHIVE_SUBFOLDERS = {
+    "aggregate": "Aggregate",
+    "failure": "Failure",
+    "smtp_tls": "SMTP-TLS",
+}
+INVALID_SUBFOLDER = "Invalid"
+
+def ensure_archive_folders(connection, archive_folder="Archive"):
+    """
+    Creates the archive folder and its per-report-type subfolders (idempotent).
+    """
+    connection.create_folder(archive_folder)
+    for subfolder in list(ARCHIVE_SUBFOLDERS.values()) + [INVALID_SUBFOLDER]:
+        connection.create_folder(f"{archive_folder}/{subfolder}")
+
+def iter_messages(connection, reports_folder="INBOX", limit=None):
+    """
+    Yields (message_id, raw_message) one at a time.
+    Only the UID list is held in memory, never more than one message body.
+    """
+    message_ids = connection.fetch_messages(reports_folder)
+    if limit:
+        message_ids = message_ids[:limit]
+
+    for message_id in message_ids:
+        yield message_id, connection.fetch_message(message_id)
+
+def parse_message(raw_message, offline=False):
+    """
+    Decompresses and parses one report email. Returns None if it is not a valid report.
+    Kept at module level so it can be pickled into a worker process.
+    """
+    try:
+        return parse_report_email(raw_message, offline=offline)
+    except ParserError as e:
+        logger.warning("Could not parse message: %s", e)
+        return None
+
+def iter_parsed_messages(messages, offline=False, workers=1, parser=parse_message):
+    """
+    Parses each (message_id, raw_message) and yields (message_id, parsed).
+    `parsed` is None when the message is not a valid report.
+    `parser` must be a module-level function taking (raw_message, offline).
+
+    With workers > 1 parsing is fanned out to a process pool. Results are still
+    yielded in mailbox order, and at most `workers * 2` messages are in flight,
+    so memory stays bounded and the single writer sees exactly the serial sequence.
+    """
+    if workers <= 1:
+        for message_id, raw_message in messages:
+            yield message_id, parser(raw_message, offline)
+        return
+
+    in_flight = deque()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for message_id, raw_message in messages:
+            in_flight.append((message_id, pool.submit(parser, raw_message, offline)))
+            if len(in_flight) >= workers * 2:
+                done_id, future = in_flight.popleft()
+                yield done_id, future.result()
+
+        while in_flight:
+            done_id, future = in_flight.popleft()
+            yield done_id, future.result()
+
+def archive_message(connection, message_id, report_type, archive_folder="Archive"):
+    """
+    Moves a processed message to the archive subfolder for its report type.
+    `report_type` None means the message was invalid.
+    """
+    subfolder = ARCHIVE_SUBFOLDERS.get(report_type, INVALID_SUBFOLDER)
+    connection.move_message(message_id, f"{archive_folder}/{subfolder}")
@@ -0,0 +1,36 @@
+import json
+import platform
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard.benchmark import measure_chart_pivot, run_benchmark
+
+
+class Command(BaseCommand):
+    help = 'Measures ingest throughput and page latency at growing data sizes; prints JSON. Writes synthetic data: use a scratch database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', type=str, default='10000,100000,1000000', help='Comma-separated row counts to grow the database to, in turn')
+        parser.add_argument('--repeat', type=int, default=5, help='Requests per page and cache state')
+        parser.add_argument('--label', type=str, default='', help='Free text stored with the results, e.g. a version or commit')
+        parser.add_argument('--output', type=str, help='Write the JSON here instead of stdout')
+        parser.add_argument('--pivot-only', action='store_true', help='Only time the dashboard chart pivot, before vs after (no database needed)')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',') if size.strip()]
+        except ValueError:
+            raise CommandError("--sizes must be comma-separated integers, e.g. 10000,100000")
+
+        if options['pivot_only']:
+            result = {'label': options['label'], 'python': platform.python_version(), 'chart_pivot': measure_chart_pivot()}
+        else:
+            result = run_benchmark(sizes, repeat=options['repeat'], label=options['label'])
+        output = json.dumps(result, indent=2)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + "\n")
+            self.stderr.write(self.style.SUCCESS(f"Results written to {options['output']}."))
+        else:
+            self.stdout.write(output)
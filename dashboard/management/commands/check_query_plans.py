@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard.queries import sequential_scans, view_query_shapes
+
+
+class Command(BaseCommand):
+    help = 'EXPLAINs every report query the pages issue and fails if one needs a sequential scan of the hypertable'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=90, help='Period to check the date-filtered queries with')
+
+    def handle(self, *args, **options):
+        failures = []
+        for name, queryset in view_query_shapes(days=options['days']):
+            scans = sequential_scans(queryset)
+            if scans:
+                failures.append(name)
+                self.stdout.write(self.style.ERROR(f"SEQ SCAN  {name} ({', '.join(sorted(set(scans)))})"))
+            else:
+                self.stdout.write(f"index     {name}")
+
+        if failures:
+            raise CommandError(f"{len(failures)} queries fall back to sequential scans: {', '.join(failures)}")
+        self.stdout.write(self.style.SUCCESS("All view queries use indexes."))
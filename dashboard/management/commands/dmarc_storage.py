@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from dashboard.storage import HYPERTABLES, apply_storage_policies, chunk_report, compression_summary
+
+
+def human_bytes(value):
+    if value is None:
+        return "-"
+    for unit in ("B", "KB", "MB", "GB"):
+        if value < 1024:
+            return f"{value:.0f} {unit}"
+        value /= 1024
+    return f"{value:.1f} TB"
+
+
+class Command(BaseCommand):
+    help = 'Reports chunk sizes and compression ratio per hypertable; --apply re-applies the TIMESCALE_* settings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--apply', action='store_true', help='Re-apply chunk interval, compression and retention policies from settings first')
+
+    def handle(self, *args, **options):
+        with connection.cursor() as cursor:
+            if options['apply']:
+                apply_storage_policies(cursor)
+                self.stdout.write(self.style.SUCCESS("Storage policies applied."))
+
+            for table in HYPERTABLES:
+                self.stdout.write(f"\n{table}")
+                self.write_table(chunk_report(cursor, table), compression_summary(cursor, table))
+
+    def write_table(self, chunks, summary):
+        # 1. Per-chunk table
+        for chunk in chunks:
+            state = "compressed" if chunk['is_compressed'] else "raw"
+            self.stdout.write(
+                f"{chunk['chunk_name']:<28} {chunk['range_start']:%Y-%m-%d} .. {chunk['range_end']:%Y-%m-%d}  "
+                f"{state:<10} {human_bytes(chunk['total_bytes']):>8}"
+            )
+
+        # 2. Totals
+        self.stdout.write(
+            f"{summary['total_chunks'] or len(chunks)} chunks, "
+            f"{summary['number_compressed_chunks'] or 0} compressed, "
+            f"hypertable size {human_bytes(summary['hypertable_bytes'])}."
+        )
+        if summary['ratio']:
+            self.stdout.write(
+                f"Compressed chunks: {human_bytes(summary['before_compression_total_bytes'])} -> "
+                f"{human_bytes(summary['after_compression_total_bytes'])} ({summary['ratio']}x)."
+            )
+        else:
+            self.stdout.write("No chunk compressed yet.")
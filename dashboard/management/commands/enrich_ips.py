@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+
+from dashboard.acknowledge import SenderRules, acknowledge_backfilled
+from dashboard.caching import bump_data_version
+from dashboard.enrichment import IpEnricher, backfill_reports, pending_ips, register_known_ips
+
+
+class Command(BaseCommand):
+    help = 'Resolves sender IPs whose reverse DNS was deferred (offline ingest) or has expired, and fills in their report rows'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--limit', type=int, default=10000, help='Resolve at most this many IPs')
+        parser.add_argument('--batch-size', type=int, default=500, help='IPs resolved concurrently per batch')
+        parser.add_argument('--include-existing', action='store_true', help='Also queue every sender IP ingested before enrichment existed')
+
+    def handle(self, *args, **options):
+        if options['include_existing']:
+            self.stdout.write(f"Queued {register_known_ips()} previously ingested IPs.")
+
+        enricher = IpEnricher(offline=False)
+        sender_rules = SenderRules.load()
+        resolved = 0
+        rows_updated = 0
+        acknowledged = 0
+
+        while resolved < options['limit']:
+            ips = pending_ips(min(options['batch_size'], options['limit'] - resolved))
+            if not ips:
+                break
+            entries = enricher.resolve(ips)
+            rows_updated += backfill_reports(entries.values())
+            # Base-domain rules could not match these rows before now
+            acknowledged += acknowledge_backfilled(entries.values(), sender_rules)
+            resolved += len(ips)
+            self.stdout.write(f"Resolved {resolved} IPs, updated {rows_updated} report rows...")
+
+        if rows_updated:
+            bump_data_version()
+        self.stdout.write(self.style.SUCCESS(
+            f"Done! Resolved {resolved} IPs, updated {rows_updated} report rows, "
+            f"acknowledged {acknowledged} threats from acknowledged senders."
+        ))
@@ -0,0 +1,51 @@
+import ipaddress
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from dashboard.export import EXPORT_FORMATS, ExportError, export_queryset, export_stream
+from dashboard.models import DomainEntity
+
+
+class Command(BaseCommand):
+    help = 'Streams report rows as CSV, NDJSON or Parquet, with the filters of the dashboard pages'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--format', choices=list(EXPORT_FORMATS), default='csv')
+        parser.add_argument('--domain', help='Only this reported domain (e.g. example.com)')
+        parser.add_argument('--days', type=int, help='Only the last N days (default: all time)')
+        parser.add_argument('--threats', action='store_true', help='Only open threats, as on the Active Threats page')
+        parser.add_argument('--ip', help='Only rows from this source IP')
+        parser.add_argument('--output', help='Write to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        domain = None
+        if options['domain']:
+            domain = DomainEntity.objects.filter(domain_name=options['domain']).first()
+            if domain is None:
+                raise CommandError(f"Unknown domain '{options['domain']}'")
+
+        if options['ip']:
+            try:
+                ipaddress.ip_address(options['ip'])
+            except ValueError:
+                raise CommandError(f"Invalid IP address '{options['ip']}'")
+
+        reports = export_queryset(domain=domain, days=options['days'], threats_only=options['threats'], source_ip=options['ip'])
+        try:
+            stream = export_stream(reports, options['format'])
+        except ExportError as e:
+            raise CommandError(str(e))
+
+        binary = options['format'] == 'parquet'
+        if options['output']:
+            with open(options['output'], 'wb' if binary else 'w', newline=None if binary else '') as f:
+                for chunk in stream:
+                    f.write(chunk)
+            self.stderr.write(self.style.SUCCESS(f"Exported to {options['output']}."))
+        elif binary:
+            for chunk in stream:
+                sys.stdout.buffer.write(chunk)
+        else:
+            for chunk in stream:
+                self.stdout.write(chunk, ending='')
@@ -1,10 +1,19 @@
 import logging
+import time
 from django.core.management.base import BaseCommand
 from django.conf import settings
-from dashboard.models import DomainEntity, DmarcReport, Organization
-from django.utils.timezone import make_aware
-from django.utils.dateparse import parse_datetime
-from datetime import datetime, timezone
+from django.db import close_old_connections
+from django.utils import timezone
+from dashboard.models import ImportedFile, IngestJob
+from dashboard.acknowledge import SenderRules
+from dashboard.ingest import DomainResolver, existing_report_keys, report_dates, report_key, write_report
+from dashboard.caching import bump_data_version
+from dashboard.enrichment import IpEnricher
+from dashboard.stats import refresh_daily_stats
+from dashboard.mailbox import archive_message, ensure_archive_folders, iter_messages, iter_parsed_messages
+from dashboard.files import iter_file_payloads, parse_payload
+from dashboard.instrumentation import StageTimer
+from dashboard.watch import MailboxWatcher, close_connection
 
 # Import the connection class and the high-level processor
 from parsedmarc.mail import IMAPConnection
@@ -12,173 +21,307 @@ from parsedmarc import get_dmarc_reports_from_mailbox
 
 logger = logging.getLogger(__name__)
 
-def parse_date(value):
-    """
-    Robustly parses a date value which might be a float timestamp, 
-    a string timestamp, a string datetime, or a datetime object.
-    """
-    if value is None:
-        return None
-    
-    # 1. If it's already a datetime object
-    if isinstance(value, datetime):
-        if value.tzinfo is None:
-            return make_aware(value)
-        return value
-    
-    # 2. Try parsing as a timestamp (float/int/string)
-    try:
-        return datetime.fromtimestamp(float(value), tz=timezone.utc)
-    except (ValueError, TypeError):
-        pass
-
-    # 3. Try parsing as a standard datetime string (ISO or SQL-like)
-    if isinstance(value, str):
-        # Django's helper handles 'YYYY-MM-DD HH:MM:SS' and ISO formats
-        dt = parse_datetime(value)
-        if dt is not None:
-            if dt.tzinfo is None:
-                return make_aware(dt)
-            return dt
-            
-    return None
-
 class Command(BaseCommand):
-    help = 'Fetches DMARC reports from IMAP and saves to DB'
+    help = 'Fetches DMARC reports from IMAP (or a local directory with --path) and saves to DB'
 
     def add_arguments(self, parser):
         parser.add_argument('--limit', type=int, default=10, help='Number of emails to process')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per INSERT when writing records')
+        parser.add_argument('--stream', action='store_true', help='Fetch, parse, save and archive one message at a time (flat memory for big backlogs)')
+        parser.add_argument('--workers', type=int, default=1, help='Parse attachments in N worker processes (implies --stream)')
+        parser.add_argument('--offline', action='store_true', help='Make no DNS queries: countries come from the local GeoIP file, reverse DNS is deferred to enrich_ips')
+        parser.add_argument('--path', help='Import .xml/.xml.gz/.zip/.eml/.mbox files from this directory (recursively) instead of IMAP')
+        parser.add_argument('--watch', action='store_true', help='Run forever on one connection, picking up new reports via IMAP IDLE (or polling)')
+        parser.add_argument('--poll-interval', type=int, default=60, help='Seconds between checks when the server has no IDLE support (--watch)')
+        parser.add_argument('--job-id', type=int, help='IngestJob to report progress on (set by run_ingest_jobs)')
 
     def handle(self, *args, **options):
         limit = options['limit']
+        self.batch_size = options['batch_size']
+        self.count_created = 0
+        self.count_skipped = 0
+        self.job_id = options['job_id']
+        self.touched_range = None
+        self.timer = StageTimer()
+
+        # parsedmarc looks every record up again; the enricher does it once per IP
+        self.enricher = IpEnricher(offline=options['offline']) if settings.IP_ENRICHMENT else None
+        offline = options['offline'] or self.enricher is not None
+
+        if options['path']:
+            self.handle_files(options['path'], options['workers'], offline)
+            return
+
+        if options['watch']:
+            self.handle_watch(limit, options['workers'], offline, options['poll_interval'])
+            return
+
         self.stdout.write(f"Connecting to IMAP (Batch Size: {limit})...")
-        
+
         try:
             # 1. Initialize the Connection
-            connection = IMAPConnection(
-                host=settings.EMAIL_HOST_IMAP,
-                user=settings.EMAIL_HOST_USER,
-                password=settings.EMAIL_HOST_PASSWORD
-            )
-            
+            connection = self.connect()
+
+            if options['stream'] or options['workers'] > 1:
+                self.handle_stream(connection, limit, options['workers'], offline)
+                return
+
             # 2. Fetch & Parse Reports
             self.stdout.write("Fetching and parsing reports...")
-            
-            results = get_dmarc_reports_from_mailbox(
-                connection=connection,
-                reports_folder="INBOX",
-                archive_folder="Archive",
-                delete=False,
-                batch_size=limit,
-                test=False
-            )
-            
+
+            # parsedmarc fetches and parses in one call, so both land in one stage
+            with self.timer.stage('fetch+parse'):
+                results = get_dmarc_reports_from_mailbox(
+                    connection=connection,
+                    reports_folder="INBOX",
+                    archive_folder="Archive",
+                    delete=False,
+                    batch_size=limit,
+                    offline=offline,
+                    test=False
+                )
+
             aggregate_reports = results.get("aggregate_reports", [])
-            
+
         except Exception as e:
             self.stdout.write(self.style.ERROR(f"Ingest Error: {e}"))
+            self.update_job(status=IngestJob.FAILED, output=f"Ingest Error: {e}", finished_at=timezone.now())
             return
 
         self.stdout.write(f"Successfully parsed {len(aggregate_reports)} reports.")
 
         # 3. Process Aggregate (RUA) Reports into Database
-        count_created = 0
-        count_skipped = 0
-        
+        started = time.monotonic()
+        self.persist_reports(aggregate_reports, DomainResolver())
+        self.report_progress(len(aggregate_reports))
+        self.refresh_stats()
+        self.write_summary(started)
+
+    def connect(self):
+        return IMAPConnection(
+            host=settings.EMAIL_HOST_IMAP,
+            user=settings.EMAIL_HOST_USER,
+            password=settings.EMAIL_HOST_PASSWORD
+        )
+
+    def handle_stream(self, connection, limit, workers=1, offline=False):
+        """
+        Generator pipeline: only one message (and its parsed report) is alive at a time.
+        Each message is committed before it is archived, so a crash never loses parsed work;
+        a re-run simply sees the committed report as a duplicate and archives it.
+        With workers > 1, parsing runs in a process pool while this process stays the only writer.
+        """
+        self.stdout.write("Streaming reports one message at a time...")
+        ensure_archive_folders(connection, "Archive")
+
+        started = time.monotonic()
+        try:
+            count_messages = self.drain_mailbox(connection, DomainResolver(), limit, workers, offline)
+        finally:
+            # Messages handled before a failure are committed and need refreshing too
+            self.refresh_stats()
+
+        self.stdout.write(f"Processed {count_messages} messages.")
+        self.write_summary(started)
+
+    def drain_mailbox(self, connection, resolver, limit, workers=1, offline=False):
+        """
+        Processes up to `limit` messages currently in the INBOX. Returns how many were handled.
+        """
+        count_messages = 0
+
+        # With workers > 1, 'parse' is the time spent waiting for the pool
+        messages = self.timer.timed('fetch', iter_messages(connection, reports_folder="INBOX", limit=limit))
+        parsed_messages = iter_parsed_messages(messages, offline=offline, workers=workers)
+        for message_id, parsed in self.timer.timed('parse', parsed_messages):
+            report_type = parsed["report_type"] if parsed else None
+            if report_type == "aggregate":
+                self.persist_reports([parsed["report"]], resolver)
+
+            with self.timer.stage('archive'):
+                archive_message(connection, message_id, report_type, "Archive")
+            count_messages += 1
+            self.report_progress(count_messages)
+
+        return count_messages
+
+    def handle_watch(self, limit, workers=1, offline=False, poll_interval=60):
+        """
+        Long-running mode: one authenticated connection, new reports picked up within
+        seconds via IDLE, reconnects with backoff when the server drops us.
+        """
+        self.stdout.write(f"Watching {settings.EMAIL_HOST_IMAP} for new reports (Ctrl+C to stop)...")
+        resolver = DomainResolver()
+
+        def connect():
+            connection = self.connect()
+            try:
+                ensure_archive_folders(connection, "Archive")
+            except Exception:
+                close_connection(connection)
+                raise
+            self.stdout.write("Connected.")
+            return connection
+
+        def process(connection):
+            # The DB may have recycled our connection while we sat in IDLE
+            close_old_connections()
+            started = time.monotonic()
+            created_before = self.count_created
+            self.timer.reset()
+
+            # Keep draining full batches until the INBOX is empty
+            count_messages = 0
+            try:
+                while True:
+                    handled = self.drain_mailbox(connection, resolver, limit, workers, offline)
+                    count_messages += handled
+                    if not limit or handled < limit:
+                        break
+            finally:
+                # Also when the connection drops mid-pass: what was committed is visible now
+                self.refresh_stats()
+
+            if count_messages:
+                elapsed = time.monotonic() - started
+                self.stdout.write(
+                    f"Processed {count_messages} messages, created {self.count_created - created_before} rows in {elapsed:.2f}s."
+                )
+                self.write_stage_timings()
+
+        MailboxWatcher(connect, process, reports_folder="INBOX", poll_interval=poll_interval).run()
+
+    def handle_files(self, path, workers=1, offline=False):
+        """
+        Same pipeline as handle_stream, fed from local files instead of a mailbox.
+        Files are tracked by content hash, so re-runs over an archive are incremental.
+        """
+        self.stdout.write(f"Importing report files from {path}...")
+
+        started = time.monotonic()
+        resolver = DomainResolver()
+        known_digests = set(ImportedFile.objects.values_list('sha256', flat=True))
+        count_files = 0
+        unreadable_files = []
+        reports_in_file = 0
+        unparsed_in_file = 0
+
+        payloads = self.timer.timed('fetch', iter_file_payloads(path, known_digests))
+        parsed_payloads = iter_parsed_messages(payloads, offline=offline, workers=workers, parser=parse_payload)
+        try:
+            for (file_path, digest, is_last), parsed in self.timer.timed('parse', parsed_payloads):
+                if parsed is None:
+                    unparsed_in_file += 1
+                elif parsed["report_type"] == "aggregate":
+                    self.persist_reports([parsed["report"]], resolver)
+                    reports_in_file += 1
+
+                # Only mark the file once all its reports are committed. Files with a
+                # payload parsedmarc could not read are tried again on the next run
+                if is_last:
+                    if unparsed_in_file:
+                        unreadable_files.append(file_path)
+                    else:
+                        ImportedFile.objects.get_or_create(
+                            sha256=digest,
+                            defaults={"path": file_path, "report_count": reports_in_file}
+                        )
+                        count_files += 1
+                    reports_in_file = 0
+                    unparsed_in_file = 0
+                    self.report_progress(count_files)
+        finally:
+            # Files imported before a failure are committed and need refreshing too
+            self.refresh_stats()
+
+        self.stdout.write(f"Imported {count_files} new files ({len(known_digests)} previously imported files skipped).")
+        if unreadable_files:
+            self.stdout.write(self.style.WARNING(
+                f"{len(unreadable_files)} files could not be fully parsed and will be retried: {', '.join(unreadable_files)}"
+            ))
+        self.write_summary(started)
+
+    def persist_reports(self, aggregate_reports, resolver):
+        """
+        Writes a batch of parsed aggregate reports, skipping ones already ingested.
+        """
+        # --- DEDUPLICATION CHECK ---
+        # One query for the whole batch; the header's unique constraint catches
+        # anything a concurrent ingest inserts after this point.
+        with self.timer.stage('dedup'):
+            known_keys = existing_report_keys(aggregate_reports)
+
+            # Resolve every domain of the batch up front (one preload + one bulk create)
+            resolver.resolve_many({
+                report["policy_published"]["domain"]
+                for report in aggregate_reports
+                if report_key(report) not in known_keys
+            })
+            # Reloaded per batch, so rules added while watching apply to the next mail
+            sender_rules = SenderRules.load()
+
+        if self.enricher:
+            with self.timer.stage('enrich'):
+                self.enricher.enrich_reports([
+                    report for report in aggregate_reports if report_key(report) not in known_keys
+                ])
+
         for report in aggregate_reports:
-            # Extract header info
-            metadata = report["report_metadata"]
-            policy_pub = report["policy_published"]
-            domain_name = policy_pub["domain"]
-            
-            # --- DEDUPLICATION CHECK ---
-            report_id = metadata.get("report_id")
-            if report_id and DmarcReport.objects.filter(report_id=report_id).exists():
-                # Quietly skip duplicates to keep logs clean, or uncomment below to see them
-                # self.stdout.write(f"Skipping duplicate report: {report_id}")
-                count_skipped += 1
+            if report_key(report) in known_keys:
+                # Quietly skip duplicates to keep logs clean
+                self.count_skipped += 1
                 continue
 
-            # Find or Create the Domain Entity
-            default_org, _ = Organization.objects.get_or_create(
-                name="Unassigned", 
-                defaults={"slug": "unassigned"}
-            )
-            
-            entity, created = DomainEntity.objects.get_or_create(
-                domain_name=domain_name,
-                defaults={"organization": default_org}
-            )
-
-            # Process every record (row) in the XML
-            for record in report["records"]:
-                source = record.get("source", {})
-                alignment = record.get("alignment", {})
-                auth_results = record.get("auth_results", {})
-                identifiers = record.get("identifiers", {})
-                
-                # Handle flat vs nested structure
-                if "row" in record and isinstance(record["row"], dict):
-                    count = int(record["row"].get("count", 0))
-                    policy_eval = record["row"].get("policy_evaluated", {})
-                else:
-                    count = int(record.get("count", 0))
-                    policy_eval = record.get("policy_evaluated", {})
-
-                # --- UPDATED DATE HANDLING ---
-                # Attempt to find dates in priority order
-                date_begin = None
-                date_end = None
-                
-                # 1. Try standard 'date_range' (Most common)
-                if "date_range" in metadata:
-                    date_begin = parse_date(metadata["date_range"].get("begin"))
-                    date_end = parse_date(metadata["date_range"].get("end"))
-                
-                # 2. Try 'begin_date' / 'end_date' keys
-                if not date_begin and "begin_date" in metadata:
-                    date_begin = parse_date(metadata.get("begin_date"))
-                if not date_end and "end_date" in metadata:
-                    date_end = parse_date(metadata.get("end_date"))
-
-                # 3. Try flat 'begin' / 'end' keys
-                if not date_begin:
-                    date_begin = parse_date(metadata.get("begin"))
-                if not date_end:
-                    date_end = parse_date(metadata.get("end"))
-
-                # 4. Fallback: If all parsing failed, use Now
-                if not date_begin:
-                    # self.stdout.write(self.style.WARNING(f"Could not parse date for report {report_id}. Using NOW."))
-                    date_begin = datetime.now(timezone.utc)
-                if not date_end:
-                    date_end = datetime.now(timezone.utc)
-                # -----------------------------
-
-                # Extract DKIM domains
-                dkim_domains = [
-                    d["domain"] for d in auth_results.get("dkim", []) if "domain" in d
-                ]
-
-                # Create the Report Entry
-                DmarcReport.objects.create(
-                    domain_entity=entity,
-                    report_id=report_id,
-                    date_begin=date_begin,
-                    date_end=date_end,
-                    source_ip=source.get("ip_address", "0.0.0.0"),
-                    source_hostname=source.get("reverse_dns"),
-                    source_base_domain=source.get("base_domain"),
-                    country_code=source.get("country"),
-                    count=count,
-                    disposition=policy_eval.get("disposition", "none"),
-                    dkim_aligned=alignment.get("dkim", False),
-                    spf_aligned=alignment.get("spf", False),
-                    header_from=policy_pub.get("domain", ""),
-                    envelope_from=identifiers.get("envelope_from"),
-                    dkim_domains=dkim_domains,
-                    auth_results=auth_results 
-                )
-                count_created += 1
-        
-        self.stdout.write(self.style.SUCCESS(f"Done! Created {count_created} rows. Skipped {count_skipped} duplicate reports."))
\ No newline at end of file
+            # Find the Domain Entity (served from the resolver's cache)
+            entity = resolver.resolve(report["policy_published"]["domain"])
+
+            # Build every record (row) in memory, then write the report in one transaction
+            with self.timer.stage('insert'):
+                written = write_report(report, entity, batch_size=self.batch_size, sender_rules=sender_rules)
+            if written is None:
+                # Lost the race to a concurrent ingest
+                self.count_skipped += 1
+                continue
+            self.count_created += written
+
+            # Remember which days changed so only those aggregate buckets get refreshed
+            date_begin, _ = report_dates(report["report_metadata"])
+            if self.touched_range is None:
+                self.touched_range = (date_begin, date_begin)
+            else:
+                self.touched_range = (min(self.touched_range[0], date_begin), max(self.touched_range[1], date_begin))
+
+    def refresh_stats(self):
+        """
+        Brings the dashboard's daily aggregate up to date for the days this run
+        wrote to, and invalidates the cached dashboard pages.
+        """
+        if self.touched_range:
+            with self.timer.stage('refresh'):
+                refresh_daily_stats(*self.touched_range)
+                bump_data_version()
+            self.touched_range = None
+
+    def update_job(self, **fields):
+        if self.job_id:
+            IngestJob.objects.filter(pk=self.job_id).update(heartbeat_at=timezone.now(), **fields)
+
+    def report_progress(self, messages_processed):
+        self.update_job(
+            messages_processed=messages_processed,
+            rows_created=self.count_created,
+            reports_skipped=self.count_skipped
+        )
+
+    def write_summary(self, started):
+        elapsed = time.monotonic() - started
+        rate = self.count_created / elapsed if elapsed > 0 else 0
+        self.stdout.write(f"Inserted {self.count_created} rows in {elapsed:.2f}s ({rate:.0f} rows/sec).")
+        self.write_stage_timings()
+        self.stdout.write(self.style.SUCCESS(f"Done! Created {self.count_created} rows. Skipped {self.count_skipped} duplicate reports."))
+
+    def write_stage_timings(self):
+        if self.timer.totals:
+            summary = self.timer.summary()
+            self.stdout.write(f"Stage timings: {summary}")
+            logger.info("Ingest stage timings: %s", summary)
@@ -0,0 +1,44 @@
+import logging
+import time
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from dashboard.jobs import claim_next_job, fail_stale_jobs, run_job
+
+logger = logging.getLogger(__name__)
+
+class Command(BaseCommand):
+    help = 'Background worker: runs ingest jobs queued from the dashboard'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--poll', type=float, default=2.0, help='Seconds to wait between checks for new jobs')
+        parser.add_argument('--once', action='store_true', help='Run every queued job, then exit')
+
+    def handle(self, *args, **options):
+        self.stdout.write("Waiting for ingest jobs...")
+        try:
+            # Jobs left running by a worker that was killed
+            failed = fail_stale_jobs()
+            if failed:
+                self.stdout.write(f"Marked {failed} stale ingest jobs as failed.")
+        except Exception as e:
+            logger.warning("Could not check for stale ingest jobs: %s", e)
+
+        while True:
+            try:
+                # Long-lived process: drop connections the DB may have closed meanwhile
+                close_old_connections()
+                job = claim_next_job()
+            except Exception as e:
+                # Usually the DB restarting or not migrated yet; keep the worker alive
+                logger.warning("Could not claim ingest job: %s", e)
+                job = None
+
+            if job:
+                self.stdout.write(f"Running ingest job #{job.pk}...")
+                run_job(job)
+                continue
+
+            if options['once']:
+                return
+            time.sleep(options['poll'])
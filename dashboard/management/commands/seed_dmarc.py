@@ -0,0 +1,50 @@
+import time
+from pathlib import Path
+
+from django.core.management.base import BaseCommand
+
+from dashboard.seed import generate_reports, report_filename, report_xml, seed_database
+
+
+class Command(BaseCommand):
+    help = 'Generates synthetic DMARC aggregate reports, as rows in the database or as XML files'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--domains', type=int, default=5, help='Number of reported domains (seedN.example)')
+        parser.add_argument('--senders', type=int, default=50, help='Distinct sending IPs shared by all domains')
+        parser.add_argument('--days', type=int, default=30, help='Days of history, ending yesterday')
+        parser.add_argument('--records', type=int, default=20, help='Records per report')
+        parser.add_argument('--reporters', type=int, default=3, help='Reporting organisations per domain per day (max 5)')
+        parser.add_argument('--failure-ratio', type=float, default=0.1, help='Share of senders that fail both SPF and DKIM')
+        parser.add_argument('--seed', type=int, default=0, help='Random seed; another seed adds new reports instead of duplicates')
+        parser.add_argument('--xml', type=str, help='Write one XML file per report into this directory instead of the database (ingest them with ingest_dmarc --path)')
+        parser.add_argument('--batch-size', type=int, default=1000, help='Rows per INSERT statement')
+
+    def handle(self, *args, **options):
+        reports = generate_reports(
+            domains=options['domains'], senders=options['senders'], days=options['days'],
+            records=options['records'], reporters=options['reporters'],
+            failure_ratio=options['failure_ratio'], seed=options['seed'],
+        )
+        started = time.monotonic()
+
+        if options['xml']:
+            count = self.write_files(reports, Path(options['xml']))
+            self.stdout.write(self.style.SUCCESS(f"Wrote {count} report files to {options['xml']}."))
+            return
+
+        report_count, row_count = seed_database(reports, options['batch_size'])
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {row_count} rows from {report_count} reports in {elapsed:.1f}s "
+            f"({row_count / elapsed if elapsed else 0:.0f} rows/sec)."
+        ))
+
+    def write_files(self, reports, directory):
+        directory.mkdir(parents=True, exist_ok=True)
+        count = 0
+        for report in reports:
+            (directory / report_filename(report)).write_bytes(report_xml(report))
+            count += 1
+        return count
+
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:49
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0004_add_is_acknowledged'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReportHeader',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('org_name', models.CharField(blank=True, default='', help_text='Reporting organisation (e.g. google.com). Empty for reports ingested before headers existed.', max_length=255)),
+                ('report_id', models.CharField(max_length=255)),
+                ('date_begin', models.DateTimeField()),
+                ('date_end', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('domain_entity', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='dashboard.domainentity')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('org_name', 'report_id'), name='unique_report_per_org')],
+            },
+        ),
+
+        # Backfill one header per report already in the hypertable so old
+        # reports are still recognised as duplicates. The reporting org was
+        # never stored, so these legacy headers get an empty org_name.
+        migrations.RunSQL(
+            sql="""
+                INSERT INTO dashboard_reportheader (domain_entity_id, org_name, report_id, date_begin, date_end, created_at)
+                SELECT DISTINCT ON (report_id) domain_entity_id, '', report_id, date_begin, date_end, now()
+                FROM dashboard_dmarcreport
+                WHERE report_id IS NOT NULL AND report_id <> ''
+                ORDER BY report_id, date_begin
+                ON CONFLICT DO NOTHING;
+            """,
+            reverse_sql=migrations.RunSQL.noop
+        ),
+    ]
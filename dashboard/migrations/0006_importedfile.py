@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0005_reportheader'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportedFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(max_length=64, unique=True)),
+                ('path', models.TextField(help_text='Where the file was when it was imported')),
+                ('report_count', models.IntegerField(default=0)),
+                ('imported_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,79 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    # CREATE MATERIALIZED VIEW ... WITH (timescaledb.continuous) and
+    # refresh_continuous_aggregate() refuse to run inside a transaction block.
+    atomic = False
+
+    dependencies = [
+        ('dashboard', '0007_ingestjob'),
+    ]
+
+    operations = [
+        # 1. Per-domain daily rollup of the raw hypertable
+        migrations.RunSQL(
+            sql="""
+                CREATE MATERIALIZED VIEW dashboard_dmarc_daily
+                WITH (timescaledb.continuous) AS
+                SELECT
+                    time_bucket(INTERVAL '1 day', date_begin) AS bucket,
+                    domain_entity_id,
+                    sum(count) AS volume,
+                    sum(count) FILTER (WHERE spf_aligned) AS spf_pass,
+                    sum(count) FILTER (WHERE dkim_aligned) AS dkim_pass,
+                    sum(count) FILTER (WHERE spf_aligned OR dkim_aligned) AS dmarc_pass,
+                    count(*) FILTER (WHERE NOT spf_aligned AND NOT dkim_aligned AND NOT is_acknowledged) AS threat_count,
+                    max(date_begin) AS last_seen
+                FROM dashboard_dmarcreport
+                GROUP BY bucket, domain_entity_id
+                WITH NO DATA;
+            """,
+            reverse_sql="DROP MATERIALIZED VIEW IF EXISTS dashboard_dmarc_daily;"
+        ),
+
+        # 2. Real-time aggregation: rows newer than the last refresh are still included
+        migrations.RunSQL(
+            sql="ALTER MATERIALIZED VIEW dashboard_dmarc_daily SET (timescaledb.materialized_only = false);",
+            reverse_sql=migrations.RunSQL.noop
+        ),
+
+        # 3. Background refresh. 120 days covers the 90d dashboard plus late-arriving reports;
+        # ingest also refreshes exactly the days it touched (dashboard.stats.refresh_daily_stats).
+        migrations.RunSQL(
+            sql="""
+                SELECT add_continuous_aggregate_policy('dashboard_dmarc_daily',
+                    start_offset => INTERVAL '120 days',
+                    end_offset => INTERVAL '1 hour',
+                    schedule_interval => INTERVAL '30 minutes');
+            """,
+            reverse_sql="SELECT remove_continuous_aggregate_policy('dashboard_dmarc_daily', if_exists => true);"
+        ),
+
+        # 4. Materialise existing history once
+        migrations.RunSQL(
+            sql="CALL refresh_continuous_aggregate('dashboard_dmarc_daily', NULL, NULL);",
+            reverse_sql=migrations.RunSQL.noop
+        ),
+
+        migrations.CreateModel(
+            name='DomainDailyStats',
+            fields=[
+                ('pk', models.CompositePrimaryKey('bucket', 'domain_entity', blank=True, editable=False, primary_key=True, serialize=False)),
+                ('bucket', models.DateTimeField()),
+                ('volume', models.BigIntegerField()),
+                ('spf_pass', models.BigIntegerField(null=True)),
+                ('dkim_pass', models.BigIntegerField(null=True)),
+                ('dmarc_pass', models.BigIntegerField(null=True)),
+                ('threat_count', models.BigIntegerField(help_text='Unacknowledged rows failing both SPF and DKIM')),
+                ('last_seen', models.DateTimeField()),
+            ],
+            options={
+                'db_table': 'dashboard_dmarc_daily',
+                'managed': False,
+            },
+        ),
+    ]
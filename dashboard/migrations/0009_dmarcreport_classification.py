@@ -0,0 +1,62 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0008_dmarc_daily_aggregate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dmarcreport',
+            name='dkim_result',
+            field=models.CharField(blank=True, default='', help_text='First DKIM result. Empty when missing.', max_length=32),
+        ),
+        migrations.AddField(
+            model_name='dmarcreport',
+            name='dkim_selector',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='dmarcreport',
+            name='spf_domain',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='dmarcreport',
+            name='spf_result',
+            field=models.CharField(blank=True, default='', help_text='First SPF result (e.g. pass, softfail). Empty when missing.', max_length=32),
+        ),
+        migrations.AddField(
+            model_name='dmarcreport',
+            name='threat_level',
+            field=models.CharField(choices=[('red', 'Fails SPF and DKIM'), ('yellow', 'Fails SPF or DKIM'), ('green', 'Passes both')], default='green', max_length=6),
+        ),
+        # Backfill existing rows with the same rules as DmarcReport.classify()
+        migrations.RunSQL(
+            sql="""
+                UPDATE dashboard_dmarcreport SET
+                    threat_level = CASE
+                        WHEN NOT spf_aligned AND NOT dkim_aligned THEN 'red'
+                        WHEN NOT spf_aligned OR NOT dkim_aligned THEN 'yellow'
+                        ELSE 'green'
+                    END,
+                    spf_result = CASE WHEN jsonb_typeof(auth_results->'spf'->0) = 'object'
+                        THEN COALESCE(NULLIF(auth_results->'spf'->0->>'result', ''), 'unknown') ELSE '' END,
+                    spf_domain = CASE WHEN jsonb_typeof(auth_results->'spf'->0) = 'object'
+                        THEN COALESCE(NULLIF(auth_results->'spf'->0->>'domain', ''), 'unknown') ELSE '' END,
+                    dkim_result = CASE WHEN jsonb_typeof(auth_results->'dkim'->0) = 'object'
+                        THEN COALESCE(NULLIF(auth_results->'dkim'->0->>'result', ''), 'unknown') ELSE '' END,
+                    dkim_selector = CASE WHEN jsonb_typeof(auth_results->'dkim'->0) = 'object'
+                        THEN COALESCE(NULLIF(auth_results->'dkim'->0->>'selector', ''), '-') ELSE '' END;
+            """,
+            reverse_sql=migrations.RunSQL.noop
+        ),
+        migrations.AddIndex(
+            model_name='dmarcreport',
+            index=models.Index(fields=['domain_entity', 'threat_level'], name='dashboard_d_domain__7cc514_idx'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:03
+
+import django.contrib.postgres.fields
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0009_dmarcreport_classification'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SenderRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_ip', models.GenericIPAddressField()),
+                ('spf_aligned', models.BooleanField()),
+                ('dkim_aligned', models.BooleanField()),
+                ('disposition', models.TextField()),
+                ('source_base_domain', models.TextField(blank=True, default='')),
+                ('source_hostname', models.TextField(blank=True, default='')),
+                ('total_count', models.BigIntegerField(default=0, help_text='Messages, summed over all reports')),
+                ('row_count', models.IntegerField(default=0, help_text='Report records folded into this rollup')),
+                ('first_seen', models.DateTimeField()),
+                ('last_seen', models.DateTimeField()),
+                ('reporters', django.contrib.postgres.fields.ArrayField(base_field=models.CharField(max_length=255), blank=True, default=list, help_text='Organisations that reported this sender', size=None)),
+                ('domain_entity', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='dashboard.domainentity')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['domain_entity', '-total_count'], name='dashboard_s_domain__67a44b_idx')],
+                'constraints': [models.UniqueConstraint(fields=('domain_entity', 'source_ip', 'spf_aligned', 'dkim_aligned', 'disposition'), name='unique_sender_outcome')],
+            },
+        ),
+
+        # Backfill from existing rows. Reporters come from the report headers;
+        # legacy headers have no org_name and contribute nothing.
+        migrations.RunSQL(
+            sql="""
+                INSERT INTO dashboard_senderrollup
+                    (domain_entity_id, source_ip, spf_aligned, dkim_aligned, disposition,
+                     source_base_domain, source_hostname, total_count, row_count,
+                     first_seen, last_seen, reporters)
+                SELECT
+                    r.domain_entity_id, r.source_ip, r.spf_aligned, r.dkim_aligned, r.disposition,
+                    COALESCE(max(r.source_base_domain), ''), COALESCE(max(r.source_hostname), ''),
+                    sum(r.count), count(*), min(r.date_begin), max(r.date_begin),
+                    COALESCE(array_agg(DISTINCT h.org_name) FILTER (WHERE h.org_name <> ''), '{}')
+                FROM dashboard_dmarcreport r
+                LEFT JOIN LATERAL (
+                    SELECT org_name FROM dashboard_reportheader
+                    WHERE report_id = r.report_id
+                    LIMIT 1
+                ) h ON true
+                GROUP BY r.domain_entity_id, r.source_ip, r.spf_aligned, r.dkim_aligned, r.disposition;
+            """,
+            reverse_sql="DELETE FROM dashboard_senderrollup;"
+        ),
+    ]
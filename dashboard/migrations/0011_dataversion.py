@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0010_senderrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('version', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.RunSQL(
+            sql="INSERT INTO dashboard_dataversion (id, version, updated_at) VALUES (1, 1, now()) ON CONFLICT DO NOTHING;",
+            reverse_sql=migrations.RunSQL.noop
+        ),
+    ]
@@ -0,0 +1,26 @@
+from django.db import migrations
+
+
+def apply_policies(apps, schema_editor):
+    # Reads the TIMESCALE_* settings; `manage.py dmarc_storage --apply` re-runs this.
+    from dashboard.storage import HYPERTABLE, apply_storage_policies
+    with schema_editor.connection.cursor() as cursor:
+        # The SPF/DKIM result hypertables get theirs in migration 0018
+        apply_storage_policies(cursor, tables=[HYPERTABLE])
+
+
+def remove_policies(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT remove_retention_policy('dashboard_dmarcreport', if_exists => true);")
+        cursor.execute("SELECT remove_compression_policy('dashboard_dmarcreport', if_exists => true);")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0011_dataversion'),
+    ]
+
+    operations = [
+        migrations.RunPython(apply_policies, remove_policies),
+    ]
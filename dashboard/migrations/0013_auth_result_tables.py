@@ -0,0 +1,116 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0012_storage_policies'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthDomain',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DkimSelector',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='dmarcreport',
+            name='auth_results',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+        migrations.AlterField(
+            model_name='dmarcreport',
+            name='dkim_domains',
+            field=models.JSONField(blank=True, default=list),
+        ),
+        migrations.CreateModel(
+            name='DkimResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('report_row_id', models.BigIntegerField(db_index=True)),
+                ('date_begin', models.DateTimeField()),
+                ('count', models.IntegerField()),
+                ('result', models.CharField(max_length=32)),
+                ('domain', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='dashboard.authdomain')),
+                ('domain_entity', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='dashboard.domainentity')),
+                ('selector', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='dashboard.dkimselector')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['domain_entity', 'date_begin'], name='dashboard_d_domain__075023_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='SpfResult',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('report_row_id', models.BigIntegerField(db_index=True)),
+                ('date_begin', models.DateTimeField()),
+                ('count', models.IntegerField()),
+                ('scope', models.CharField(blank=True, default='', max_length=16)),
+                ('result', models.CharField(max_length=32)),
+                ('domain', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, to='dashboard.authdomain')),
+                ('domain_entity', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='dashboard.domainentity')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['domain_entity', 'date_begin'], name='dashboard_s_domain__a21c50_idx')],
+            },
+        ),
+
+        # Backfill the typed tables from the JSON already stored on report rows
+        migrations.RunSQL(
+            sql="""
+                INSERT INTO dashboard_authdomain (name)
+                SELECT DISTINCT left(e->>'domain', 255)
+                FROM dashboard_dmarcreport r
+                CROSS JOIN LATERAL jsonb_array_elements(
+                    CASE WHEN jsonb_typeof(r.auth_results->'spf') = 'array' THEN r.auth_results->'spf' ELSE '[]'::jsonb END
+                    || CASE WHEN jsonb_typeof(r.auth_results->'dkim') = 'array' THEN r.auth_results->'dkim' ELSE '[]'::jsonb END
+                ) e
+                WHERE jsonb_typeof(e) = 'object' AND COALESCE(e->>'domain', '') <> ''
+                ON CONFLICT (name) DO NOTHING;
+
+                INSERT INTO dashboard_dkimselector (name)
+                SELECT DISTINCT left(e->>'selector', 255)
+                FROM dashboard_dmarcreport r
+                CROSS JOIN LATERAL jsonb_array_elements(
+                    CASE WHEN jsonb_typeof(r.auth_results->'dkim') = 'array' THEN r.auth_results->'dkim' ELSE '[]'::jsonb END
+                ) e
+                WHERE jsonb_typeof(e) = 'object' AND COALESCE(e->>'selector', '') <> ''
+                ON CONFLICT (name) DO NOTHING;
+
+                INSERT INTO dashboard_spfresult (report_row_id, date_begin, domain_entity_id, count, domain_id, scope, result)
+                SELECT r.id, r.date_begin, r.domain_entity_id, r.count, d.id,
+                       left(COALESCE(e->>'scope', ''), 16), left(COALESCE(NULLIF(e->>'result', ''), 'unknown'), 32)
+                FROM dashboard_dmarcreport r
+                CROSS JOIN LATERAL jsonb_array_elements(
+                    CASE WHEN jsonb_typeof(r.auth_results->'spf') = 'array' THEN r.auth_results->'spf' ELSE '[]'::jsonb END
+                ) e
+                LEFT JOIN dashboard_authdomain d ON d.name = left(e->>'domain', 255)
+                WHERE jsonb_typeof(e) = 'object';
+
+                INSERT INTO dashboard_dkimresult (report_row_id, date_begin, domain_entity_id, count, domain_id, selector_id, result)
+                SELECT r.id, r.date_begin, r.domain_entity_id, r.count, d.id, s.id,
+                       left(COALESCE(NULLIF(e->>'result', ''), 'unknown'), 32)
+                FROM dashboard_dmarcreport r
+                CROSS JOIN LATERAL jsonb_array_elements(
+                    CASE WHEN jsonb_typeof(r.auth_results->'dkim') = 'array' THEN r.auth_results->'dkim' ELSE '[]'::jsonb END
+                ) e
+                LEFT JOIN dashboard_authdomain d ON d.name = left(e->>'domain', 255)
+                LEFT JOIN dashboard_dkimselector s ON s.name = left(e->>'selector', 255)
+                WHERE jsonb_typeof(e) = 'object';
+            """,
+            reverse_sql="DELETE FROM dashboard_spfresult; DELETE FROM dashboard_dkimresult;"
+        ),
+    ]
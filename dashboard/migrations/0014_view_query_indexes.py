@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0013_auth_result_tables'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='dmarcreport',
+            name='dashboard_d_domain__7cc514_idx',
+        ),
+        migrations.AddIndex(
+            model_name='dmarcreport',
+            index=models.Index(fields=['domain_entity', '-date_begin', '-id'], name='dmarc_domain_recent_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dmarcreport',
+            index=models.Index(condition=models.Q(('is_acknowledged', False), ('threat_level', 'red')), fields=['-date_begin', '-id'], name='dmarc_open_threats_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dmarcreport',
+            index=models.Index(fields=['source_ip', '-date_begin'], name='dmarc_source_ip_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:14
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0014_view_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AcknowledgedSender',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_ip', models.GenericIPAddressField(blank=True, null=True)),
+                ('source_base_domain', models.CharField(blank=True, default='', help_text='Matched case-insensitively, e.g. google.com', max_length=255)),
+                ('note', models.CharField(blank=True, default='', max_length=255)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('domain_entity', models.ForeignKey(blank=True, help_text='Only for this domain; empty applies to all', null=True, on_delete=django.db.models.deletion.CASCADE, to='dashboard.domainentity')),
+            ],
+            options={
+                'constraints': [models.CheckConstraint(condition=models.Q(('source_ip__isnull', False), models.Q(('source_base_domain', ''), _negated=True), _connector='OR'), name='acknowledged_sender_has_match')],
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0015_acknowledgedsender'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IpEnrichment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ip', models.GenericIPAddressField(unique=True)),
+                ('reverse_dns', models.CharField(blank=True, default='', max_length=255)),
+                ('base_domain', models.CharField(blank=True, default='', max_length=255)),
+                ('country_code', models.CharField(blank=True, default='', max_length=2)),
+                ('dns_resolved_at', models.DateTimeField(blank=True, help_text='Empty while the DNS lookup is deferred (offline ingest)', null=True)),
+            ],
+        ),
+    ]
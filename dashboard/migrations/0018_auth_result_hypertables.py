@@ -0,0 +1,64 @@
+from django.db import migrations
+
+RESULT_TABLES = ['dashboard_spfresult', 'dashboard_dkimresult']
+
+
+def apply_policies(apps, schema_editor):
+    # Same TIMESCALE_* settings as the report rows; `manage.py dmarc_storage --apply` re-runs this.
+    from dashboard.storage import apply_storage_policies
+    with schema_editor.connection.cursor() as cursor:
+        apply_storage_policies(cursor, tables=RESULT_TABLES)
+
+
+def remove_policies(apps, schema_editor):
+    with schema_editor.connection.cursor() as cursor:
+        for table in RESULT_TABLES:
+            cursor.execute("SELECT remove_retention_policy(%s, if_exists => true);", [table])
+            cursor.execute("SELECT remove_compression_policy(%s, if_exists => true);", [table])
+
+
+def to_hypertable(table):
+    """
+    Same steps as migration 0002: the partition column has to be part of the primary key.
+    """
+    return [
+        migrations.RunSQL(
+            sql=f"ALTER TABLE {table} DROP CONSTRAINT {table}_pkey;",
+            reverse_sql=migrations.RunSQL.noop
+        ),
+        migrations.RunSQL(
+            sql=f"ALTER TABLE {table} ADD PRIMARY KEY (id, date_begin);",
+            reverse_sql=migrations.RunSQL.noop
+        ),
+        migrations.RunSQL(
+            sql=f"SELECT create_hypertable('{table}', 'date_begin', migrate_data => true);",
+            reverse_sql="SELECT 1;"
+        ),
+    ]
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('dashboard', '0017_ingestjob_heartbeat'),
+    ]
+
+    operations = [
+        # 1. Partition the SPF/DKIM results by their report's date_begin, like the report rows
+        *to_hypertable('dashboard_spfresult'),
+        *to_hypertable('dashboard_dkimresult'),
+
+        # 2. Results left behind by report chunks that retention already dropped
+        migrations.RunSQL(
+            sql="""
+                DELETE FROM dashboard_spfresult s
+                WHERE s.date_begin < COALESCE((SELECT min(date_begin) FROM dashboard_dmarcreport), 'infinity');
+                DELETE FROM dashboard_dkimresult d
+                WHERE d.date_begin < COALESCE((SELECT min(date_begin) FROM dashboard_dmarcreport), 'infinity');
+            """,
+            reverse_sql=migrations.RunSQL.noop
+        ),
+
+        # 3. Chunk interval, compression and retention
+        migrations.RunPython(apply_policies, remove_policies),
+    ]
@@ -1,4 +1,6 @@
+from django.contrib.postgres.fields import ArrayField
 from django.db import models
+from django.utils.functional import cached_property
 import json
 
 class Organization(models.Model):
@@ -49,9 +51,26 @@ class DmarcReport(models.Model):
     # Details
     header_from = models.TextField()
     envelope_from = models.TextField(null=True)
-    dkim_domains = models.JSONField(default=list) 
-    auth_results = models.JSONField() 
+    dkim_domains = models.JSONField(default=list, blank=True) 
+    # Raw copy, optional (settings.STORE_RAW_AUTH_RESULTS); SpfResult/DkimResult hold the typed data
+    auth_results = models.JSONField(default=dict, blank=True) 
     is_acknowledged = models.BooleanField(default=False, help_text="Has this threat been manually reviewed?")
+
+    # --- CLASSIFICATION (computed once at ingest, see classify()) ---
+    THREAT_RED = 'red'
+    THREAT_YELLOW = 'yellow'
+    THREAT_GREEN = 'green'
+    THREAT_CHOICES = [
+        (THREAT_RED, 'Fails SPF and DKIM'),
+        (THREAT_YELLOW, 'Fails SPF or DKIM'),
+        (THREAT_GREEN, 'Passes both'),
+    ]
+
+    threat_level = models.CharField(max_length=6, choices=THREAT_CHOICES, default=THREAT_GREEN)
+    spf_result = models.CharField(max_length=32, blank=True, default="", help_text="First SPF result (e.g. pass, softfail). Empty when missing.")
+    spf_domain = models.TextField(blank=True, default="")
+    dkim_result = models.CharField(max_length=32, blank=True, default="", help_text="First DKIM result. Empty when missing.")
+    dkim_selector = models.TextField(blank=True, default="")
     
     # --- NEW PROPERTY FOR FLAGS ---
     @property
@@ -65,14 +84,60 @@ class DmarcReport(models.Model):
         return "".join([chr(ord(c.upper()) + 127397) for c in self.country_code])
 
     class Meta:
+        # Matched to the view queries in dashboard/queries.py; `manage.py check_query_plans`
+        # fails if one of them stops being served by an index.
         indexes = [
             models.Index(fields=['date_begin', 'domain_entity']),
+            # domain_detail: one domain, newest first
+            models.Index(fields=['domain_entity', '-date_begin', '-id'], name='dmarc_domain_recent_idx'),
+            # active_threats and the threat card: a small slice of the table
+            models.Index(
+                fields=['-date_begin', '-id'],
+                condition=models.Q(threat_level='red', is_acknowledged=False),
+                name='dmarc_open_threats_idx'
+            ),
+            # IP investigations (report_list ?ip=)
+            models.Index(fields=['source_ip', '-date_begin'], name='dmarc_source_ip_idx'),
         ]
 
-    @property
+    @staticmethod
+    def classify(spf_aligned, dkim_aligned, auth_results):
+        """
+        Walks auth_results once and returns the classification columns.
+        Migration 0009 backfills existing rows with the same rules in SQL.
+        """
+        if not spf_aligned and not dkim_aligned:
+            threat_level = DmarcReport.THREAT_RED
+        elif not spf_aligned or not dkim_aligned:
+            threat_level = DmarcReport.THREAT_YELLOW
+        else:
+            threat_level = DmarcReport.THREAT_GREEN
+
+        fields = {
+            "threat_level": threat_level,
+            "spf_result": "", "spf_domain": "",
+            "dkim_result": "", "dkim_selector": "",
+        }
+
+        # auth_results structure often: {'spf': [{'domain': '...', 'result': 'pass', ...}]}
+        spf_info = (auth_results or {}).get('spf', [])
+        if spf_info and isinstance(spf_info, list) and isinstance(spf_info[0], dict):
+            fields["spf_result"] = spf_info[0].get('result') or 'unknown'
+            fields["spf_domain"] = spf_info[0].get('domain') or 'unknown'
+
+        # Often multiple signatures, grab the first one
+        dkim_info = (auth_results or {}).get('dkim', [])
+        if dkim_info and isinstance(dkim_info, list) and isinstance(dkim_info[0], dict):
+            fields["dkim_result"] = dkim_info[0].get('result') or 'unknown'
+            fields["dkim_selector"] = dkim_info[0].get('selector') or '-'
+
+        return fields
+
+    @cached_property
     def inspection_data(self):
         """
-        Parses auth_results to provide UI-ready technical and layman explanations.
+        UI-ready technical and layman explanations, built from the classification
+        columns (no JSON parsing) and memoised per instance.
         """
         data = {
             "threat": False,
@@ -82,27 +147,18 @@ class DmarcReport(models.Model):
             "layman_summary": ""
         }
 
-        # 1. Determine Threat Level
-        if not self.spf_aligned and not self.dkim_aligned:
-            data["threat"] = True
-            data["threat_color"] = "red"
-        elif not self.spf_aligned or not self.dkim_aligned:
-            data["threat_color"] = "yellow"
-        else:
-            data["threat_color"] = "green"
+        # 1. Threat Level
+        data["threat"] = self.threat_level == self.THREAT_RED
+        data["threat_color"] = self.threat_level
 
-        # 2. Extract SPF Details
-        # auth_results structure often: {'spf': [{'domain': '...', 'result': 'pass', ...}]}
-        spf_info = self.auth_results.get('spf', [])
-        if spf_info and isinstance(spf_info, list) and len(spf_info) > 0:
-            res = spf_info[0].get('result', 'unknown')
-            domain = spf_info[0].get('domain', 'unknown')
-            data["spf_tag"]["status"] = res.upper()
-            data["spf_tag"]["detail"] = f"Domain: {domain}"
+        # 2. SPF Details
+        if self.spf_result:
+            data["spf_tag"]["status"] = self.spf_result.upper()
+            data["spf_tag"]["detail"] = f"Domain: {self.spf_domain}"
             
-            if res == 'pass':
+            if self.spf_result == 'pass':
                 data["spf_tag"]["color"] = "green"
-            elif res in ['softfail', 'neutral']:
+            elif self.spf_result in ['softfail', 'neutral']:
                 data["spf_tag"]["color"] = "yellow"
             else:
                 data["spf_tag"]["color"] = "red"
@@ -110,16 +166,12 @@ class DmarcReport(models.Model):
             data["spf_tag"]["status"] = "MISSING"
             data["spf_tag"]["color"] = "red"
 
-        # 3. Extract DKIM Details
-        dkim_info = self.auth_results.get('dkim', [])
-        if dkim_info and isinstance(dkim_info, list) and len(dkim_info) > 0:
-            # Often multiple signatures, grab the first or relevant one
-            res = dkim_info[0].get('result', 'unknown')
-            selector = dkim_info[0].get('selector', '-')
-            data["dkim_tag"]["status"] = res.upper()
-            data["dkim_tag"]["detail"] = f"Selector: {selector}"
+        # 3. DKIM Details
+        if self.dkim_result:
+            data["dkim_tag"]["status"] = self.dkim_result.upper()
+            data["dkim_tag"]["detail"] = f"Selector: {self.dkim_selector}"
             
-            if res == 'pass':
+            if self.dkim_result == 'pass':
                 data["dkim_tag"]["color"] = "green"
             else:
                 data["dkim_tag"]["color"] = "red"
@@ -151,6 +203,256 @@ class DmarcReport(models.Model):
 
         return data
 
+class AuthDomain(models.Model):
+    """
+    Interned domain names seen in SPF/DKIM results, stored once instead of on every row.
+    """
+    name = models.CharField(max_length=255, unique=True)
+
+    def __str__(self):
+        return self.name
+
+class DkimSelector(models.Model):
+    """
+    Interned DKIM selector names.
+    """
+    name = models.CharField(max_length=255, unique=True)
+
+    def __str__(self):
+        return self.name
+
+class SpfResult(models.Model):
+    """
+    One SPF check of a DmarcReport row. The hypertable's key is (id, date_begin),
+    which a foreign key can't reference, so the row is linked by id with its
+    date, domain and count copied over: reports run on this table alone.
+    Also a hypertable on date_begin (migration 0018), with the report rows'
+    compression and retention, so results are dropped with their rows.
+    """
+    report_row_id = models.BigIntegerField(db_index=True)
+    date_begin = models.DateTimeField()
+    domain_entity = models.ForeignKey(DomainEntity, on_delete=models.CASCADE)
+    count = models.IntegerField()
+
+    domain = models.ForeignKey(AuthDomain, on_delete=models.PROTECT, null=True, blank=True)
+    scope = models.CharField(max_length=16, blank=True, default="")
+    result = models.CharField(max_length=32)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['domain_entity', 'date_begin']),
+        ]
+
+class DkimResult(models.Model):
+    """
+    One DKIM signature check of a DmarcReport row. Linked like SpfResult.
+    """
+    report_row_id = models.BigIntegerField(db_index=True)
+    date_begin = models.DateTimeField()
+    domain_entity = models.ForeignKey(DomainEntity, on_delete=models.CASCADE)
+    count = models.IntegerField()
+
+    domain = models.ForeignKey(AuthDomain, on_delete=models.PROTECT, null=True, blank=True)
+    selector = models.ForeignKey(DkimSelector, on_delete=models.PROTECT, null=True, blank=True)
+    result = models.CharField(max_length=32)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['domain_entity', 'date_begin']),
+        ]
+
+class DomainDailyStats(models.Model):
+    """
+    Read-only. Backed by the `dashboard_dmarc_daily` TimescaleDB continuous
+    aggregate (see migration 0008): one row per domain per UTC day, kept up to
+    date by a refresh policy and by ingest, so the dashboard never scans raw rows.
+    """
+    pk = models.CompositePrimaryKey('bucket', 'domain_entity')
+    bucket = models.DateTimeField()
+    domain_entity = models.ForeignKey(DomainEntity, on_delete=models.DO_NOTHING)
+
+    volume = models.BigIntegerField()
+    spf_pass = models.BigIntegerField(null=True)
+    dkim_pass = models.BigIntegerField(null=True)
+    dmarc_pass = models.BigIntegerField(null=True)
+    threat_count = models.BigIntegerField(help_text="Unacknowledged rows failing both SPF and DKIM")
+    last_seen = models.DateTimeField()
+
+    class Meta:
+        managed = False
+        db_table = 'dashboard_dmarc_daily'
+
+class SenderRollup(models.Model):
+    """
+    One row per sender (source IP) per domain per authentication outcome, summed
+    over every report that mentioned it. Maintained incrementally by ingest
+    (dashboard.ingest.update_sender_rollups), so "who sends as us" reads a few
+    hundred rows instead of every daily record.
+    """
+    domain_entity = models.ForeignKey(DomainEntity, on_delete=models.CASCADE)
+    source_ip = models.GenericIPAddressField()
+    spf_aligned = models.BooleanField()
+    dkim_aligned = models.BooleanField()
+    disposition = models.TextField()
+
+    # Latest non-empty values seen for this IP
+    source_base_domain = models.TextField(blank=True, default="")
+    source_hostname = models.TextField(blank=True, default="")
+
+    total_count = models.BigIntegerField(default=0, help_text="Messages, summed over all reports")
+    row_count = models.IntegerField(default=0, help_text="Report records folded into this rollup")
+    first_seen = models.DateTimeField()
+    last_seen = models.DateTimeField()
+    reporters = ArrayField(models.CharField(max_length=255), default=list, blank=True, help_text="Organisations that reported this sender")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['domain_entity', 'source_ip', 'spf_aligned', 'dkim_aligned', 'disposition'],
+                name='unique_sender_outcome'
+            ),
+        ]
+        indexes = [
+            models.Index(fields=['domain_entity', '-total_count']),
+        ]
+
+    def __str__(self):
+        return f"{self.source_ip} -> {self.domain_entity_id}"
+
+class AcknowledgedSender(models.Model):
+    """
+    A sender marked as known-benign (e.g. a mailing list or forwarder). Ingest
+    acknowledges its future threat rows on arrival; see dashboard.acknowledge.
+    Empty fields match anything, but a rule needs an IP or a base domain.
+    """
+    source_ip = models.GenericIPAddressField(null=True, blank=True)
+    source_base_domain = models.CharField(max_length=255, blank=True, default="", help_text="Matched case-insensitively, e.g. google.com")
+    domain_entity = models.ForeignKey(DomainEntity, null=True, blank=True, on_delete=models.CASCADE, help_text="Only for this domain; empty applies to all")
+    note = models.CharField(max_length=255, blank=True, default="")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.CheckConstraint(
+                condition=models.Q(source_ip__isnull=False) | ~models.Q(source_base_domain=""),
+                name="acknowledged_sender_has_match"
+            ),
+        ]
+
+    def matches(self, row):
+        """
+        Whether an (unsaved) DmarcReport row comes from this sender.
+        """
+        return (
+            (not self.source_ip or self.source_ip == row.source_ip)
+            and (not self.source_base_domain or self.source_base_domain.lower() == (row.source_base_domain or "").lower())
+            and (self.domain_entity_id is None or self.domain_entity_id == row.domain_entity_id)
+        )
+
+    def __str__(self):
+        return self.source_ip or self.source_base_domain
+
+class IpEnrichment(models.Model):
+    """
+    Reverse DNS, base domain and country of a sender IP, shared by every report
+    that mentions it (see dashboard.enrichment). Entries expire after
+    IP_ENRICHMENT_TTL_DAYS and are looked up again.
+    """
+    ip = models.GenericIPAddressField(unique=True)
+    reverse_dns = models.CharField(max_length=255, blank=True, default="")
+    base_domain = models.CharField(max_length=255, blank=True, default="")
+    country_code = models.CharField(max_length=2, blank=True, default="")
+    dns_resolved_at = models.DateTimeField(null=True, blank=True, help_text="Empty while the DNS lookup is deferred (offline ingest)")
+
+    def __str__(self):
+        return self.ip
+
+class DataVersion(models.Model):
+    """
+    Single-row counter bumped whenever report data changes (ingest, acknowledge).
+    Cached dashboard pages embed it in their keys, so a bump invalidates them all
+    at once, in every process. See dashboard.caching.
+    """
+    SINGLETON_ID = 1
+
+    version = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"Data version {self.version}"
+
+class ReportHeader(models.Model):
+    """
+    One row per ingested aggregate report. The unique (org_name, report_id)
+    pair is what makes deduplication safe when two ingests run at once.
+    """
+    domain_entity = models.ForeignKey(DomainEntity, on_delete=models.CASCADE)
+    org_name = models.CharField(max_length=255, blank=True, default="", help_text="Reporting organisation (e.g. google.com). Empty for reports ingested before headers existed.")
+    report_id = models.CharField(max_length=255)
+    date_begin = models.DateTimeField()
+    date_end = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['org_name', 'report_id'], name='unique_report_per_org'),
+        ]
+
+    def __str__(self):
+        return f"{self.org_name or '?'} / {self.report_id}"
+
+class ImportedFile(models.Model):
+    """
+    A local report file already ingested, keyed by content hash so re-runs
+    over the same archive directory only pick up new files.
+    """
+    sha256 = models.CharField(max_length=64, unique=True)
+    path = models.TextField(help_text="Where the file was when it was imported")
+    report_count = models.IntegerField(default=0)
+    imported_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.path
+
+class IngestJob(models.Model):
+    """
+    A background ingest requested from the dashboard.
+    Picked up by `manage.py run_ingest_jobs`; the view only enqueues and polls.
+    """
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED, db_index=True)
+    limit = models.IntegerField(default=10, help_text="Number of emails to process")
+
+    # Progress, updated by ingest_dmarc while the job runs
+    messages_processed = models.IntegerField(default=0)
+    rows_created = models.IntegerField(default=0)
+    reports_skipped = models.IntegerField(default=0)
+    output = models.TextField(blank=True, default="")
+
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    # Touched whenever the worker reports progress; a running job that stops
+    # beating for INGEST_JOB_STALE_MINUTES belonged to a worker that died
+    heartbeat_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    @property
+    def is_active(self):
+        return self.status in (self.QUEUED, self.RUNNING)
+
+    def __str__(self):
+        return f"Ingest #{self.pk} ({self.status})"
+
 class ForensicSample(models.Model):
     domain_entity = models.ForeignKey(DomainEntity, on_delete=models.CASCADE)
     arrival_date = models.DateTimeField()
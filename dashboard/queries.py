@@ -0,0 +1,182 @@
+import asyncio
+import contextvars
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, connection, connections, transaction
+from django.utils import timezone
+
+from .instrumentation import record_queries
+from .models import DmarcReport, DomainEntity
+from .pagination import encode_cursor, keyset_query
+
+# The report querysets behind the views. Each one is shaped to match an index on
+# DmarcReport (see Meta.indexes); `manage.py check_query_plans` verifies they still do.
+
+def domain_reports(domain, date_begin, date_end):
+    """
+    domain_detail. Index: (domain_entity, date_begin DESC, id DESC).
+    """
+    return DmarcReport.objects.filter(
+        domain_entity=domain,
+        date_begin__gte=date_begin,
+        date_begin__lte=date_end
+    )
+
+def unacknowledged_threats(date_begin, date_end):
+    """
+    active_threats and the dashboard threat card. Partial index on
+    (date_begin DESC, id DESC) WHERE threat_level = 'red' AND NOT is_acknowledged.
+    """
+    return DmarcReport.objects.filter(
+        date_begin__gte=date_begin,
+        date_begin__lte=date_end,
+        threat_level=DmarcReport.THREAT_RED,
+        is_acknowledged=False
+    )
+
+def all_reports(source_ip=None):
+    """
+    report_list, optionally narrowed to one sending IP. Index: (source_ip, date_begin DESC).
+    """
+    reports = DmarcReport.objects.select_related('domain_entity')
+    if source_ip:
+        reports = reports.filter(source_ip=source_ip)
+    return reports
+
+class QueryPool:
+    """
+    A fixed set of long-lived threads for the dashboard's concurrent queries.
+    Each keeps its DB connection between calls (DB_CONN_MAX_AGE), so a cache
+    miss doesn't open new connections, and the pool bounds how many there are.
+    """
+    def __init__(self, workers):
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='dmarc-query')
+        # Start every thread now (the executor would only add them as needed), so close() reaches all
+        self.on_every_thread(lambda: None)
+
+    def on_every_thread(self, function):
+        """
+        Runs `function` once in each thread: every task holds its thread until
+        all threads have one.
+        """
+        barrier = threading.Barrier(self.workers)
+        def task():
+            barrier.wait()
+            function()
+        return [self.executor.submit(task) for _ in range(self.workers)]
+
+    def close(self):
+        """
+        Closes every thread's DB connections and stops the threads.
+        """
+        self.on_every_thread(connections.close_all)
+        self.executor.shutdown(wait=True)
+
+_query_pool = None
+_query_pool_lock = threading.Lock()
+
+def query_pool():
+    global _query_pool
+    with _query_pool_lock:
+        if _query_pool is None:
+            _query_pool = QueryPool(settings.DB_QUERY_WORKERS)
+        return _query_pool
+
+def shutdown_query_pool():
+    """
+    Closes the pool and its connections, e.g. before the test database is
+    dropped. The next query starts a new pool.
+    """
+    global _query_pool
+    with _query_pool_lock:
+        pool, _query_pool = _query_pool, None
+    if pool is not None:
+        pool.close()
+
+def on_pooled_connection(function):
+    """
+    Wraps a blocking ORM callable for a pool thread. Like a request, it drops
+    an expired or broken connection before and after, and keeps a healthy one
+    open for the next call. Its queries count towards the request's
+    instrumentation, if any.
+    """
+    def run():
+        close_old_connections()
+        try:
+            with record_queries():
+                return function()
+        finally:
+            close_old_connections()
+    return run
+
+async def run_concurrently(*functions):
+    """
+    Runs blocking ORM callables at the same time on the query pool, each on
+    its pool thread's connection, and returns their results in order.
+    Latency is that of the slowest one.
+    """
+    loop = asyncio.get_running_loop()
+    return await asyncio.gather(*(
+        # run_in_executor doesn't carry context variables over by itself
+        loop.run_in_executor(query_pool().executor, contextvars.copy_context().run, on_pooled_connection(function))
+        for function in functions
+    ))
+
+def sequential_scans(queryset):
+    """
+    Runs EXPLAIN on `queryset` with sequential scans disabled and returns the
+    report hypertable chunks still read sequentially, i.e. the ones no index
+    can serve. Compressed chunks (compress_hyper_*) are always read whole,
+    segment by segment, and are not reported.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute("SET LOCAL enable_seqscan = off")
+        try:
+            plan = queryset.explain(format='json')
+        finally:
+            # SET LOCAL outlives a savepoint, so undo it explicitly when nested
+            cursor.execute("SET LOCAL enable_seqscan = on")
+
+    scans = []
+    nodes = [entry['Plan'] for entry in json.loads(plan)]
+    while nodes:
+        node = nodes.pop()
+        relation = node.get('Relation Name', '')
+        if node.get('Node Type') == 'Seq Scan' and (relation == DmarcReport._meta.db_table or relation.startswith('_hyper_')):
+            scans.append(relation)
+        nodes.extend(node.get('Plans', []))
+    return scans
+
+def view_query_shapes(days=90):
+    """
+    (name, queryset) for every report query the pages issue, with the widest
+    period and both a first and a follow-up page.
+    """
+    date_end = timezone.now()
+    date_begin = date_end - timedelta(days=days)
+    domain = DomainEntity.objects.order_by('pk').first()
+    newest = DmarcReport.objects.order_by('-date_begin', '-id').first()
+    cursor = encode_cursor(newest) if newest else None
+    source_ip = newest.source_ip if newest else '192.0.2.1'
+    threats = unacknowledged_threats(date_begin, date_end)
+
+    shapes = [
+        ('dashboard: threat IPs', threats.values('source_ip').distinct()),
+        ('active_threats: first page', keyset_query(threats)),
+        ('active_threats: next page', keyset_query(threats, cursor)),
+        ('report_list: first page', keyset_query(all_reports())),
+        ('report_list: next page', keyset_query(all_reports(), cursor)),
+        ('report_list: by source IP', keyset_query(all_reports(source_ip))),
+    ]
+    if domain:
+        reports = domain_reports(domain, date_begin, date_end)
+        shapes += [
+            ('domain_detail: first page', keyset_query(reports)),
+            ('domain_detail: next page', keyset_query(reports, cursor)),
+        ]
+    return shapes
@@ -0,0 +1,195 @@
+import ipaddress
+import random
+from datetime import datetime, timedelta, timezone
+from xml.etree import ElementTree as ET
+
+from .acknowledge import SenderRules
+from .caching import bump_data_version
+from .ingest import DomainResolver, report_dates, write_report
+from .stats import refresh_daily_stats
+
+# Reporting organisations the synthetic reports claim to come from
+REPORTERS = ['google.com', 'Yahoo', 'Enterprise Outlook', 'comcast.net', 'Mail.Ru']
+
+# RFC 2544 benchmarking range, so seeded IPs never collide with real senders
+SENDER_NETWORK = ipaddress.ip_network('198.18.0.0/15')
+
+def sender_profiles(senders, failure_ratio, rng):
+    """
+    Gives each sender IP a fixed behaviour, as in real traffic: most are the
+    domain's own mail servers, some are forwarders (SPF breaks, DKIM survives)
+    and `failure_ratio` of them are spoofers failing both checks.
+    """
+    profiles = []
+    for i in range(senders):
+        ip = str(SENDER_NETWORK[i + 1])
+        roll = rng.random()
+        if roll < failure_ratio:
+            kind = 'spoof'
+        elif roll < failure_ratio + (1 - failure_ratio) * 0.1:
+            kind = 'forwarder'
+        else:
+            kind = 'legit'
+        profiles.append((ip, kind))
+    return profiles
+
+def build_record(domain, ip, kind, rng):
+    """
+    One record in the shape parsedmarc returns.
+    """
+    spf_pass = kind == 'legit'
+    dkim_pass = kind != 'spoof'
+    if kind == 'spoof':
+        count = rng.randint(1, 20)
+        disposition = rng.choice(['none', 'quarantine', 'reject'])
+        envelope_from = f"bounce.{rng.choice(['spoof', 'phish', 'bulk'])}.example"
+    else:
+        count = rng.randint(1, 500)
+        disposition = 'none'
+        envelope_from = domain
+
+    dkim = []
+    if kind != 'spoof' or rng.random() < 0.5:
+        dkim.append({
+            'domain': domain if kind != 'spoof' else envelope_from,
+            'selector': rng.choice(['s1', 's2', 'google', 'selector1']),
+            'result': 'pass' if dkim_pass else 'fail',
+        })
+
+    return {
+        'source': {
+            'ip_address': ip,
+            'reverse_dns': f"mail-{ip.replace('.', '-')}.{envelope_from}",
+            'base_domain': envelope_from,
+            'country': rng.choice(['US', 'US', 'DE', 'GB', 'NL']) if kind != 'spoof' else rng.choice(['CN', 'RU', 'BR', 'VN']),
+        },
+        'count': count,
+        'alignment': {'spf': spf_pass, 'dkim': dkim_pass, 'dmarc': spf_pass or dkim_pass},
+        'policy_evaluated': {
+            'disposition': disposition,
+            'spf': 'pass' if spf_pass else 'fail',
+            'dkim': 'pass' if dkim_pass else 'fail',
+        },
+        'identifiers': {'header_from': domain, 'envelope_from': envelope_from},
+        'auth_results': {
+            'spf': [{
+                'domain': envelope_from,
+                'scope': 'mfrom',
+                'result': 'pass' if spf_pass else rng.choice(['fail', 'softfail']),
+            }],
+            'dkim': dkim,
+        },
+    }
+
+def generate_reports(domains=5, senders=50, days=30, records=20, reporters=3,
+                     failure_ratio=0.1, seed=0, end=None):
+    """
+    Yields synthetic aggregate reports (parsedmarc's parsed format), one per
+    day per domain per reporter, each with `records` records, newest day last.
+    The same arguments always produce the same reports; a different `seed`
+    produces different report ids, so seeding twice adds instead of deduplicating.
+    """
+    rng = random.Random(seed)
+    end = (end or datetime.now(timezone.utc)).replace(hour=0, minute=0, second=0, microsecond=0)
+    domain_names = [f"seed{i}.example" for i in range(domains)]
+    profiles = sender_profiles(senders, failure_ratio, rng)
+
+    for day in range(days, 0, -1):
+        begin = end - timedelta(days=day)
+        for domain in domain_names:
+            for org_name in REPORTERS[:reporters]:
+                yield {
+                    'report_metadata': {
+                        'org_name': org_name,
+                        'org_email': f"noreply-dmarc@{org_name.lower().replace(' ', '')}",
+                        'report_id': f"seed-{seed}-{begin:%Y%m%d}-{domain}-{org_name}",
+                        'date_range': {
+                            'begin': int(begin.timestamp()),
+                            'end': int((begin + timedelta(days=1, seconds=-1)).timestamp()),
+                        },
+                    },
+                    'policy_published': {'domain': domain, 'adkim': 'r', 'aspf': 'r', 'p': 'none', 'sp': 'none', 'pct': '100'},
+                    'records': [
+                        build_record(domain, *rng.choice(profiles), rng)
+                        for _ in range(records)
+                    ],
+                }
+
+def report_xml(report):
+    """
+    Renders a generated report as RUA XML, as a reporter would send it.
+    """
+    metadata = report['report_metadata']
+    policy = report['policy_published']
+
+    feedback = ET.Element('feedback')
+    meta = ET.SubElement(feedback, 'report_metadata')
+    ET.SubElement(meta, 'org_name').text = metadata['org_name']
+    ET.SubElement(meta, 'email').text = metadata['org_email']
+    ET.SubElement(meta, 'report_id').text = metadata['report_id']
+    date_range = ET.SubElement(meta, 'date_range')
+    ET.SubElement(date_range, 'begin').text = str(metadata['date_range']['begin'])
+    ET.SubElement(date_range, 'end').text = str(metadata['date_range']['end'])
+
+    published = ET.SubElement(feedback, 'policy_published')
+    for key in ('domain', 'adkim', 'aspf', 'p', 'sp', 'pct'):
+        ET.SubElement(published, key).text = policy[key]
+
+    for record in report['records']:
+        node = ET.SubElement(feedback, 'record')
+        row = ET.SubElement(node, 'row')
+        ET.SubElement(row, 'source_ip').text = record['source']['ip_address']
+        ET.SubElement(row, 'count').text = str(record['count'])
+        evaluated = ET.SubElement(row, 'policy_evaluated')
+        for key in ('disposition', 'dkim', 'spf'):
+            ET.SubElement(evaluated, key).text = record['policy_evaluated'][key]
+
+        identifiers = ET.SubElement(node, 'identifiers')
+        ET.SubElement(identifiers, 'header_from').text = record['identifiers']['header_from']
+        ET.SubElement(identifiers, 'envelope_from').text = record['identifiers']['envelope_from']
+
+        auth = ET.SubElement(node, 'auth_results')
+        for dkim in record['auth_results']['dkim']:
+            dkim_node = ET.SubElement(auth, 'dkim')
+            for key in ('domain', 'selector', 'result'):
+                ET.SubElement(dkim_node, key).text = dkim[key]
+        for spf in record['auth_results']['spf']:
+            spf_node = ET.SubElement(auth, 'spf')
+            for key in ('domain', 'scope', 'result'):
+                ET.SubElement(spf_node, key).text = spf[key]
+
+    return ET.tostring(feedback, encoding='utf-8', xml_declaration=True)
+
+def report_filename(report):
+    """
+    File name for a generated report; report ids are unique per seed.
+    """
+    return report['report_metadata']['report_id'].replace(' ', '_') + '.xml'
+
+def seed_database(reports, batch_size=1000):
+    """
+    Writes generated reports through the normal ingest path (dedup, typed
+    results, rollups), then refreshes the daily aggregate and page cache.
+    Returns (reports written, rows written).
+    """
+    resolver = DomainResolver()
+    sender_rules = SenderRules.load()
+    report_count = 0
+    row_count = 0
+    touched = None
+
+    for report in reports:
+        entity = resolver.resolve(report["policy_published"]["domain"])
+        created = write_report(report, entity, batch_size=batch_size, sender_rules=sender_rules)
+        if created is None:
+            continue
+        report_count += 1
+        row_count += created
+
+        date_begin, _ = report_dates(report["report_metadata"])
+        touched = (min(touched[0], date_begin), max(touched[1], date_begin)) if touched else (date_begin, date_begin)
+
+    if touched:
+        refresh_daily_stats(*touched)
+        bump_data_version()
+    return report_count, row_count
@@ -0,0 +1,48 @@
+from rest_framework import serializers
+
+from .models import DmarcReport, DomainEntity
+
+class SparseFieldsMixin:
+    """
+    `?fields=a,b` keeps only those fields of the serializer (unknown names are
+    ignored). Views use requested_fields() to load just those columns too.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        wanted = requested_fields(request, self.Meta.fields) if request else None
+        if wanted:
+            for name in set(self.fields) - set(wanted):
+                self.fields.pop(name)
+
+def requested_fields(request, available):
+    """
+    The `fields` query parameter as a list of known field names, or None for all.
+    """
+    value = request.query_params.get('fields')
+    if not value:
+        return None
+    return [name for name in (part.strip() for part in value.split(',')) if name in available] or None
+
+class DomainSerializer(serializers.ModelSerializer):
+    organization = serializers.CharField(source='organization.name')
+
+    class Meta:
+        model = DomainEntity
+        fields = ['id', 'domain_name', 'organization', 'is_active']
+
+class ReportSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    domain = serializers.CharField(source='domain_entity.domain_name')
+
+    # API field -> DmarcReport column(s) to load when the field is requested
+    COLUMNS = {'domain': 'domain_entity__domain_name'}
+
+    class Meta:
+        model = DmarcReport
+        fields = [
+            'id', 'domain', 'report_id', 'date_begin', 'date_end',
+            'source_ip', 'source_hostname', 'source_base_domain', 'country_code',
+            'count', 'disposition', 'spf_aligned', 'dkim_aligned', 'threat_level',
+            'spf_result', 'spf_domain', 'dkim_result', 'dkim_selector',
+            'header_from', 'envelope_from', 'is_acknowledged', 'auth_results',
+        ]
@@ -0,0 +1,166 @@
+import json
+from datetime import datetime, time, timedelta, timezone
+
+from django.db import connection
+from django.db.models import Max, Q, Sum
+from django.db.models.functions import TruncDay, TruncWeek, TruncMonth
+
+from .models import DkimResult, DomainDailyStats
+from .queries import run_concurrently, unacknowledged_threats
+
+DAILY_STATS_VIEW = 'dashboard_dmarc_daily'
+
+GRANULARITY_TRUNC = {
+    'day': TruncDay,
+    'week': TruncWeek,
+    'month': TruncMonth,
+}
+
+def day_floor(value):
+    """
+    Start of the UTC day containing `value`, i.e. its continuous aggregate bucket.
+    """
+    return datetime.combine(value.astimezone(timezone.utc).date(), time.min, tzinfo=timezone.utc)
+
+def refresh_daily_stats(start, end):
+    """
+    Re-materialises the daily aggregate for the days between `start` and `end`.
+    TimescaleDB only refreshes buckets fully inside the window, so it is widened
+    to whole UTC days. Cannot run inside a transaction; in that case the refresh
+    policy catches up on its next run instead.
+    """
+    if connection.in_atomic_block:
+        return
+
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "CALL refresh_continuous_aggregate(%s, %s, %s)",
+            [DAILY_STATS_VIEW, day_floor(start), day_floor(end) + timedelta(days=1)]
+        )
+
+def pivot_chart_series(rows, domain_names):
+    """
+    Pivots (date_group, domain_entity__domain_name, volume) rows into ECharts
+    (dates, series) in a single pass over a {(date, domain): volume} map.
+    Domains with no data on a date get 0.
+    """
+    volumes = {}
+    dates = set()
+    for row in rows:
+        date = row['date_group'].strftime('%Y-%m-%d')
+        dates.add(date)
+        key = (date, row['domain_entity__domain_name'])
+        volumes[key] = volumes.get(key, 0) + int(row['volume'])
+
+    dates = sorted(dates)
+    series = [
+        {
+            'name': domain,
+            'type': 'line',
+            'smooth': True,
+            'data': [volumes.get((date, domain), 0) for date in dates]
+        }
+        for domain in domain_names
+    ]
+    return dates, series
+
+def domain_volume_chart(stats, domain_names, granularity='day'):
+    """
+    Multi-line volume chart for `domain_names` from a DomainDailyStats queryset,
+    grouped by day, week or month. One query, one pivot pass.
+    """
+    trunc_func = GRANULARITY_TRUNC.get(granularity, TruncDay)
+
+    # Buckets are UTC days, so group them in UTC too
+    rows = stats.filter(
+        domain_entity__domain_name__in=domain_names
+    ).annotate(
+        date_group=trunc_func('bucket', tzinfo=timezone.utc)
+    ).values(
+        'date_group', 'domain_entity__domain_name'
+    ).annotate(
+        volume=Sum('volume')
+    ).order_by('date_group')
+
+    return pivot_chart_series(rows, domain_names)
+
+async def dashboard_context(days, granularity):
+    """
+    The dashboard's aggregates (cards, domain table, chart) for the last `days` days.
+    Three independent chains run concurrently on the query pool (dashboard.queries):
+    the cards' totals, the threat IP count, and the domain table followed by
+    the chart of its top 10 domains.
+    """
+    date_end = datetime.now(timezone.utc)
+    date_begin = date_end - timedelta(days=days)
+
+    # Base Query
+    # Totals come from the daily continuous aggregate (whole UTC days), never the raw hypertable
+    stats = DomainDailyStats.objects.filter(bucket__gte=day_floor(date_begin), bucket__lte=date_end)
+
+    # High Level Stats (Cards)
+    def card_totals():
+        return stats.aggregate(
+            total_volume=Sum('volume'),
+            dkim_aligned_count=Sum('dkim_pass'),
+            spf_aligned_count=Sum('spf_pass'),
+            dmarc_pass_count=Sum('dmarc_pass')
+        )
+    
+    # Threat Calculation (distinct IPs across domains can't be pre-aggregated per domain)
+    def threat_ip_count():
+        return unacknowledged_threats(date_begin, date_end).values('source_ip').distinct().count()
+
+    # Domain Table Stats (Updated with Last Seen & Threat Count)
+    domain_stats = stats.values(
+        'domain_entity__id',
+        'domain_entity__domain_name'
+    ).annotate(
+        total=Sum('volume'),
+        dmarc_pass_count=Sum('dmarc_pass'),
+        spf_pass_count=Sum('spf_pass'),
+        dkim_pass_count=Sum('dkim_pass'),
+        # NEW: Count specific threat rows for this domain
+        active_threat_count=Sum('threat_count'),
+        # NEW: Last Seen based on record date
+        last_seen=Max('last_seen')
+    ).order_by('-total')
+
+    # Chart Logic (Multi-Line by Top 10 Domains, the first rows of the table)
+    def domain_table_and_chart():
+        domain_rows = list(domain_stats)
+        top_domains = [row['domain_entity__domain_name'] for row in domain_rows[:10]]
+        return domain_rows, domain_volume_chart(stats, top_domains, granularity)
+
+    global_stats, threat_ips, (domain_rows, (unique_dates, series_data)) = await run_concurrently(
+        card_totals, threat_ip_count, domain_table_and_chart
+    )
+
+    total_volume = global_stats['total_volume'] or 0
+    dmarc_pass = global_stats['dmarc_pass_count'] or 0
+    pass_percentage = round((dmarc_pass / total_volume) * 100, 1) if total_volume > 0 else 0
+
+    return {
+        'global_stats': global_stats,
+        'threat_ips': threat_ips, 
+        'pass_percentage': pass_percentage,
+        'domain_stats': domain_rows,
+        'chart_dates': json.dumps(unique_dates),
+        'chart_series': json.dumps(series_data),
+    }
+
+def dkim_selector_failures(domain_entity, since):
+    """
+    Per (signing domain, selector) DKIM outcome for one domain since `since`,
+    worst first. Aggregated in SQL over the typed DkimResult table.
+    """
+    return DkimResult.objects.filter(
+        domain_entity=domain_entity,
+        date_begin__gte=since
+    ).values(
+        'domain__name', 'selector__name'
+    ).annotate(
+        total=Sum('count'),
+        failed=Sum('count', filter=~Q(result='pass'), default=0),
+        last_seen=Max('date_begin')
+    ).order_by('-failed', '-total')
@@ -0,0 +1,112 @@
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from .models import DkimResult, DmarcReport, SpfResult
+
+HYPERTABLE = DmarcReport._meta.db_table
+
+# Every hypertable partitioned by the report's date_begin. The SPF/DKIM result
+# tables get the same chunks, compression and retention as the report rows, so
+# their chunks are dropped together and no result outlives its report row.
+HYPERTABLES = [HYPERTABLE, SpfResult._meta.db_table, DkimResult._meta.db_table]
+
+# start_offset of the continuous aggregate refresh policy (migration 0008). Raw
+# rows must outlive it, or a refresh would see their buckets empty and erase them.
+AGGREGATE_REFRESH_WINDOW_DAYS = 120
+
+def apply_storage_policies(cursor, tables=HYPERTABLES):
+    """
+    Sets chunk interval, compression and retention on `tables` (every
+    hypertable by default) from the TIMESCALE_* settings. Idempotent: existing
+    policies are replaced.
+    """
+    chunk_days = settings.TIMESCALE_CHUNK_INTERVAL_DAYS
+    compress_days = settings.TIMESCALE_COMPRESS_AFTER_DAYS
+    retention_days = settings.TIMESCALE_RETENTION_DAYS
+
+    if retention_days and retention_days <= AGGREGATE_REFRESH_WINDOW_DAYS:
+        raise ImproperlyConfigured(
+            f"TIMESCALE_RETENTION_DAYS must be 0 (keep forever) or more than "
+            f"{AGGREGATE_REFRESH_WINDOW_DAYS} days, the daily aggregate's refresh window."
+        )
+
+    for table in tables:
+        apply_table_policies(cursor, table, chunk_days, compress_days, retention_days)
+
+def apply_table_policies(cursor, table, chunk_days, compress_days, retention_days):
+    """
+    The policies of one hypertable; its primary key must be (id, date_begin).
+    """
+    # 1. Chunk interval (new chunks only)
+    cursor.execute(
+        "SELECT set_chunk_time_interval(%s, make_interval(days => %s))",
+        [table, chunk_days]
+    )
+
+    # 2. Compression. Every unique index column must be a segmentby/orderby
+    # column, hence `id` in the order (the primary key is (id, date_begin)).
+    cursor.execute("SELECT remove_compression_policy(%s, if_exists => true)", [table])
+    if compress_days:
+        cursor.execute(
+            f"""
+            ALTER TABLE {table} SET (
+                timescaledb.compress,
+                timescaledb.compress_segmentby = 'domain_entity_id',
+                timescaledb.compress_orderby = 'date_begin DESC, id DESC'
+            )
+            """
+        )
+        cursor.execute(
+            "SELECT add_compression_policy(%s, make_interval(days => %s))",
+            [table, compress_days]
+        )
+
+    # 3. Retention
+    cursor.execute("SELECT remove_retention_policy(%s, if_exists => true)", [table])
+    if retention_days:
+        cursor.execute(
+            "SELECT add_retention_policy(%s, make_interval(days => %s))",
+            [table, retention_days]
+        )
+
+def chunk_report(cursor, table=HYPERTABLE):
+    """
+    One dict per chunk of `table`, oldest first: range, compression state and size on disk.
+    """
+    cursor.execute(
+        """
+        SELECT c.chunk_name, c.range_start, c.range_end, c.is_compressed, s.total_bytes
+        FROM timescaledb_information.chunks c
+        JOIN chunks_detailed_size(%s) s ON s.chunk_name = c.chunk_name
+        WHERE c.hypertable_name = %s
+        ORDER BY c.range_start
+        """,
+        [table, table]
+    )
+    columns = [col[0] for col in cursor.description]
+    return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+def compression_summary(cursor, table=HYPERTABLE):
+    """
+    Totals from hypertable_compression_stats(); byte counts are None until
+    at least one chunk has been compressed.
+    """
+    cursor.execute(
+        """
+        SELECT total_chunks, number_compressed_chunks,
+               before_compression_total_bytes, after_compression_total_bytes
+        FROM hypertable_compression_stats(%s)
+        """,
+        [table]
+    )
+    row = cursor.fetchone()
+    columns = [col[0] for col in cursor.description]
+    summary = dict(zip(columns, row)) if row else dict.fromkeys(columns)
+
+    before = summary['before_compression_total_bytes']
+    after = summary['after_compression_total_bytes']
+    summary['ratio'] = round(before / after, 1) if before and after else None
+
+    cursor.execute("SELECT hypertable_size(%s)", [table])
+    summary['hypertable_bytes'] = cursor.fetchone()[0]
+    return summary
@@ -1,3 +1,1048 @@
-from django.test import TestCase
+import gzip
+import io
+import mailbox
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from email.message import EmailMessage
+from pathlib import Path
+from tempfile import TemporaryDirectory
+from unittest.mock import patch
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from django.core.management import call_command
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection, connections, transaction
+from django.db.models import Sum
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, modify_settings, override_settings
+from parsedmarc import parse_report_file
+from parsedmarc.mail import MaildirConnection
+
+from .acknowledge import SenderRules, acknowledge_threats, open_threats
+from .benchmark import chart_rows, legacy_chart_series
+from .caching import bump_data_version, cache_stats, cached_context, data_version
+from .enrichment import IpEnricher, LruCache, normalize_ip
+from .export import iter_parquet
+from .ingest import DomainResolver, build_report_rows, existing_report_keys, report_key, write_report
+from .instrumentation import METRICS, InstrumentationMiddleware, StageTimer, TimedDjangoTemplates, prometheus_metrics
+from .jobs import claim_next_job, enqueue_ingest
+from .mailbox import archive_message, ensure_archive_folders, iter_messages
+from .models import AcknowledgedSender, DkimResult, DmarcReport, DomainDailyStats, DomainEntity, ImportedFile, IngestJob, IpEnrichment, Organization, ReportHeader, SenderRollup, SpfResult
+from .pagination import decode_cursor, encode_cursor, keyset_page
+from .queries import run_concurrently, shutdown_query_pool
+from .seed import generate_reports, report_filename, report_xml
+from .stats import dkim_selector_failures, pivot_chart_series
+from .storage import HYPERTABLES, apply_storage_policies
+from .watch import MailboxWatcher
+
+TESTDATA_DIR = Path(__file__).resolve().parent / 'testdata'
+
+
+def report_email(xml_path):
+    """
+    Wraps a fixture XML report in an email, the way reporters send them.
+    """
+    message = EmailMessage()
+    message['Subject'] = f"Report Domain: {xml_path.stem}"
+    message['From'] = 'noreply-dmarc@example.net'
+    message['To'] = 'dmarc@example.com'
+    message.set_content('DMARC aggregate report attached.')
+    message.add_attachment(
+        gzip.compress(xml_path.read_bytes()),
+        maintype='application', subtype='gzip',
+        filename=f"{xml_path.name}.gz"
+    )
+    return message
+
+
+def create_domain(domain_name="example.com"):
+    org, _ = Organization.objects.get_or_create(name="Example", slug="example")
+    return DomainEntity.objects.create(organization=org, domain_name=domain_name)
+
+
+def create_reports(domain, count, **fields):
+    """
+    `count` report rows for `domain`, a day apart going back from now, each
+    failing both checks. A field given as a callable is called with the row index.
+    """
+    now = datetime.now(timezone.utc)
+    defaults = {
+        'report_id': lambda i: f"r{i}",
+        'date_begin': lambda i: now - timedelta(days=i),
+        'source_ip': "192.0.2.1", 'count': 1, 'disposition': "none",
+        'spf_aligned': False, 'dkim_aligned': False, 'header_from': "example.com", 'auth_results': {},
+    }
+    rows = []
+    for i in range(count):
+        values = {name: value(i) if callable(value) else value for name, value in {**defaults, **fields}.items()}
+        values.setdefault('date_end', values['date_begin'] + timedelta(days=1))
+        values.update(DmarcReport.classify(values['spf_aligned'], values['dkim_aligned'], values['auth_results']))
+        rows.append(DmarcReport(domain_entity=domain, **values))
+    return DmarcReport.objects.bulk_create(rows)
+
+
+def build_maildir(path):
+    """
+    One message per fixture, plus a resent copy of the first one (a duplicate).
+    """
+    maildir = mailbox.Maildir(path, create=True)
+    fixtures = sorted(TESTDATA_DIR.glob('*.xml'))
+    for xml_path in fixtures + fixtures[:1]:
+        maildir.add(report_email(xml_path))
+
+
+def parse_fixture(name='google.com!example.com!1760659200!1760745599.xml'):
+    return parse_report_file(str(TESTDATA_DIR / name), offline=True)["report"]
+
+
+class BulkWriteTests(TestCase):
+    def test_rows_are_written_in_batches(self):
+        report = parse_fixture()
+        entity = DomainResolver().resolve(report["policy_published"]["domain"])
+
+        written = write_report(report, entity, batch_size=1)
+
+        self.assertEqual(written, len(report["records"]))
+        self.assertEqual(
+            sorted(DmarcReport.objects.values_list('source_ip', 'count')),
+            sorted((r["source"]["ip_address"], r["count"]) for r in report["records"])
+        )
+
+    def test_failed_report_leaves_nothing_behind(self):
+        report = parse_fixture()
+        entity = DomainResolver().resolve(report["policy_published"]["domain"])
+
+        with patch('dashboard.ingest.update_sender_rollups', side_effect=RuntimeError("boom")):
+            with self.assertRaises(RuntimeError):
+                write_report(report, entity)
+        self.assertFalse(DmarcReport.objects.exists())
+        self.assertFalse(ReportHeader.objects.exists())
+
+        # Not mistaken for a duplicate on the next run
+        self.assertEqual(write_report(report, entity), len(report["records"]))
+
+
+class ReportDedupTests(TestCase):
+    def test_second_write_of_a_report_is_a_no_op(self):
+        report = parse_fixture()
+        entity = DomainResolver().resolve(report["policy_published"]["domain"])
+        write_report(report, entity)
+        rows = DmarcReport.objects.count()
+        rollups = list(SenderRollup.objects.values_list('source_ip', 'total_count'))
+
+        self.assertIsNone(write_report(report, entity))
+        self.assertEqual(DmarcReport.objects.count(), rows)
+        self.assertEqual(ReportHeader.objects.count(), 1)
+        self.assertEqual(list(SenderRollup.objects.values_list('source_ip', 'total_count')), rollups)
+
+    def test_known_reports_found_in_one_query(self):
+        report = parse_fixture()
+        other = parse_fixture('yahoo.com!example.com!1760745600!1760831999.xml')
+        write_report(report, DomainResolver().resolve(report["policy_published"]["domain"]))
+
+        with self.assertNumQueries(1):
+            known = existing_report_keys([report, other])
+        self.assertEqual(known, {report_key(report)})
+
+
+class DomainResolverTests(TestCase):
+    def test_known_domains_need_no_queries(self):
+        domain = create_domain()
+        resolver = DomainResolver()
+        with self.assertNumQueries(0):
+            self.assertEqual(resolver.resolve("example.com"), domain)
+
+    def test_unknown_domains_created_together_under_unassigned(self):
+        resolver = DomainResolver()
+        entities = resolver.resolve_many(["new.example", "other.example"])
+
+        self.assertEqual(set(entities), {"new.example", "other.example"})
+        self.assertEqual({entity.organization.slug for entity in entities.values()}, {"unassigned"})
+        with self.assertNumQueries(0):
+            resolver.resolve_many(["new.example", "other.example"])
+
+
+class ParallelIngestTests(TestCase):
+    def run_ingest(self, maildir_path, **options):
+        out = io.StringIO()
+        connection = MaildirConnection(maildir_path)
+        with patch('dashboard.management.commands.ingest_dmarc.IMAPConnection', return_value=connection):
+            call_command('ingest_dmarc', stream=True, offline=True, limit=100, stdout=out, **options)
+
+        rows = sorted(DmarcReport.objects.values_list(
+            'domain_entity__domain_name', 'report_id', 'source_ip', 'count',
+            'spf_aligned', 'dkim_aligned', 'disposition'
+        ))
+        return out.getvalue().splitlines()[-1], rows
+
+    def test_parallel_parsing_matches_serial(self):
+        with TemporaryDirectory() as tmp:
+            build_maildir(f"{tmp}/serial")
+            build_maildir(f"{tmp}/parallel")
+
+            serial_summary, serial_rows = self.run_ingest(f"{tmp}/serial")
+            DmarcReport.objects.all().delete()
+            ReportHeader.objects.all().delete()
+            parallel_summary, parallel_rows = self.run_ingest(f"{tmp}/parallel", workers=2)
+
+        self.assertIn("Created 7 rows. Skipped 1 duplicate reports.", serial_summary)
+        self.assertEqual(serial_summary, parallel_summary)
+        self.assertEqual(serial_rows, parallel_rows)
+
+
+class StreamIngestTests(TestCase):
+    def run_stream(self, maildir_path):
+        connection = MaildirConnection(maildir_path)
+        with patch('dashboard.management.commands.ingest_dmarc.IMAPConnection', return_value=connection):
+            call_command('ingest_dmarc', stream=True, offline=True, limit=100, stdout=io.StringIO())
+
+    def test_messages_are_archived_only_after_their_report_is_saved(self):
+        real_write_report = write_report
+        calls = []
+
+        def crash_on_second_report(*args, **kwargs):
+            calls.append(1)
+            if len(calls) == 2:
+                raise RuntimeError("killed")
+            return real_write_report(*args, **kwargs)
+
+        with TemporaryDirectory() as tmp:
+            maildir_path = f"{tmp}/inbox"
+            maildir = mailbox.Maildir(maildir_path, create=True)
+            for xml_path in sorted(TESTDATA_DIR.glob('*.xml')):
+                maildir.add(report_email(xml_path))
+            with patch('dashboard.management.commands.ingest_dmarc.write_report', side_effect=crash_on_second_report):
+                self.run_stream(maildir_path)
+
+            # Only the message whose report was committed has left the INBOX
+            self.assertEqual(len(MaildirConnection(maildir_path).fetch_messages("INBOX")), 2)
+            self.assertEqual(ReportHeader.objects.count(), 1)
+
+            self.run_stream(maildir_path)
+            self.assertEqual(MaildirConnection(maildir_path).fetch_messages("INBOX"), [])
+            self.assertEqual(len(MaildirConnection(maildir_path).fetch_messages("Archive/Aggregate")), 3)
+
+        self.assertEqual(ReportHeader.objects.count(), 3)
+        self.assertEqual(DmarcReport.objects.count(), 7)
+
+    def test_failed_run_still_invalidates_cached_pages(self):
+        real_write_report = write_report
+        calls = []
+
+        def crash_after_first_report(*args, **kwargs):
+            calls.append(1)
+            if len(calls) == 2:
+                raise RuntimeError("killed")
+            return real_write_report(*args, **kwargs)
+
+        version = data_version()
+        with TemporaryDirectory() as tmp:
+            build_maildir(f"{tmp}/inbox")
+            with patch('dashboard.management.commands.ingest_dmarc.write_report', side_effect=crash_after_first_report):
+                self.run_stream(f"{tmp}/inbox")
+
+        self.assertEqual(ReportHeader.objects.count(), 1)
+        self.assertEqual(data_version(), version + 1)
+
+
+class FileImportTests(TestCase):
+    def import_path(self, path):
+        out = io.StringIO()
+        call_command('ingest_dmarc', path=path, offline=True, stdout=out)
+        return out.getvalue()
+
+    def test_rerun_over_unchanged_directory_imports_nothing(self):
+        with TemporaryDirectory() as tmp:
+            for xml_path in TESTDATA_DIR.glob('*.xml'):
+                (Path(tmp) / xml_path.name).write_bytes(xml_path.read_bytes())
+            # The same report again, compressed under another name
+            (Path(tmp) / "copy.xml.gz").write_bytes(gzip.compress(next(TESTDATA_DIR.glob('*.xml')).read_bytes()))
+
+            self.assertIn("Imported 4 new files", self.import_path(tmp))
+            rows = DmarcReport.objects.count()
+
+            output = self.import_path(tmp)
+
+        self.assertIn("Imported 0 new files (4 previously imported files skipped)", output)
+        self.assertIn("Created 0 rows. Skipped 0 duplicate reports.", output)
+        self.assertEqual(DmarcReport.objects.count(), rows)
+        self.assertEqual(ImportedFile.objects.count(), 4)
+
+    def test_empty_mbox_is_recorded_and_unreadable_file_retried(self):
+        with TemporaryDirectory() as tmp:
+            (Path(tmp) / "empty.mbox").write_bytes(b"")
+            (Path(tmp) / "broken.xml").write_bytes(b"<feedback></feedback>")
+
+            first = self.import_path(tmp)
+            second = self.import_path(tmp)
+
+        self.assertIn("Imported 1 new files (0 previously imported files skipped)", first)
+        self.assertIn("Imported 0 new files (1 previously imported files skipped)", second)
+        self.assertIn("1 files could not be fully parsed and will be retried", second)
+        self.assertEqual(list(ImportedFile.objects.values_list('path', 'report_count')), [(f"{tmp}/empty.mbox", 0)])
+
+    def test_failed_run_still_invalidates_cached_pages(self):
+        real_write_report = write_report
+        calls = []
+
+        def crash_after_first_report(*args, **kwargs):
+            calls.append(1)
+            if len(calls) == 2:
+                raise RuntimeError("killed")
+            return real_write_report(*args, **kwargs)
+
+        version = data_version()
+        with TemporaryDirectory() as tmp:
+            for xml_path in TESTDATA_DIR.glob('*.xml'):
+                (Path(tmp) / xml_path.name).write_bytes(xml_path.read_bytes())
+            with patch('dashboard.management.commands.ingest_dmarc.write_report', side_effect=crash_after_first_report):
+                with self.assertRaises(RuntimeError):
+                    self.import_path(tmp)
+
+        self.assertEqual(ImportedFile.objects.count(), 1)
+        self.assertEqual(data_version(), version + 1)
+
+
+class IngestJobTests(TransactionTestCase):
+    """
+    Real transactions: the SKIP LOCKED test holds a row lock from a second connection.
+    """
+    def test_second_enqueue_joins_the_first(self):
+        job, created = enqueue_ingest()
+        again, created_again = enqueue_ingest()
+        self.assertTrue(created)
+        self.assertFalse(created_again)
+        self.assertEqual(again.pk, job.pk)
+
+    def test_claim_skips_jobs_locked_by_another_worker(self):
+        first = IngestJob.objects.create()
+        second = IngestJob.objects.create()
+        locked = threading.Event()
+        release = threading.Event()
+
+        def other_worker():
+            try:
+                with transaction.atomic():
+                    IngestJob.objects.select_for_update().get(pk=first.pk)
+                    locked.set()
+                    release.wait(5)
+            finally:
+                connections.close_all()
+
+        thread = threading.Thread(target=other_worker)
+        thread.start()
+        try:
+            self.assertTrue(locked.wait(5))
+            claimed = claim_next_job()
+        finally:
+            release.set()
+            thread.join()
+
+        self.assertEqual(claimed.pk, second.pk)
+        self.assertEqual(IngestJob.objects.get(pk=second.pk).status, IngestJob.RUNNING)
+        self.assertEqual(IngestJob.objects.get(pk=first.pk).status, IngestJob.QUEUED)
+
+    def test_stale_running_job_no_longer_blocks_syncing(self):
+        now = datetime.now(timezone.utc)
+        long_ago = now - timedelta(hours=1)
+        dead = IngestJob.objects.create(status=IngestJob.RUNNING, started_at=long_ago, heartbeat_at=long_ago)
+        alive = IngestJob.objects.create(status=IngestJob.RUNNING, started_at=long_ago, heartbeat_at=now)
+
+        call_command('run_ingest_jobs', once=True, stdout=io.StringIO())
+        self.assertEqual(IngestJob.objects.get(pk=dead.pk).status, IngestJob.FAILED)
+        self.assertEqual(enqueue_ingest(), (alive, False))
+
+        IngestJob.objects.filter(pk=alive.pk).update(heartbeat_at=long_ago)
+        job, created = enqueue_ingest()
+        self.assertTrue(created)
+        self.assertEqual(IngestJob.objects.get(pk=alive.pk).status, IngestJob.FAILED)
+
+
+class MailboxWatcherTests(SimpleTestCase):
+    """
+    A local Maildir stands in for the IMAP server: it has no IDLE, so the
+    watcher falls back to polling, and its connect() can be made to fail.
+    A fake client covers the IDLE path.
+    """
+    def test_reconnects_with_backoff_then_picks_up_new_mail(self):
+        with TemporaryDirectory() as tmp:
+            maildir_path = f"{tmp}/inbox"
+            build_maildir(maildir_path)
+            attempts = []
+            sleeps = []
+            processed = []
+
+            def connect():
+                attempts.append(1)
+                if len(attempts) < 3:
+                    raise ConnectionError("server unavailable")
+                connection = MaildirConnection(maildir_path)
+                ensure_archive_folders(connection)
+                return connection
+
+            def process(connection):
+                for message_id, raw_message in iter_messages(connection):
+                    processed.append(message_id)
+                    archive_message(connection, message_id, "aggregate")
+                # A new report lands while we wait for the next pass
+                if len(sleeps) == 2:
+                    mailbox.Maildir(maildir_path).add(report_email(sorted(TESTDATA_DIR.glob('*.xml'))[1]))
+
+            watcher = MailboxWatcher(connect, process, poll_interval=60, sleep=sleeps.append)
+            watcher.run(should_stop=lambda: len(sleeps) >= 4)
+
+        self.assertEqual(len(attempts), 3)
+        # Two failed logins back off 1s then 2s; after that we poll every 60s
+        self.assertEqual(sleeps, [1, 2, 60, 60])
+        self.assertEqual(len(processed), 5)
+
+
+    def test_dropped_connection_is_closed_before_reconnecting(self):
+        class Client:
+            def __init__(self, fail_logout):
+                self.fail_logout = fail_logout
+                self.calls = []
+
+            def logout(self):
+                self.calls.append('logout')
+                if self.fail_logout:
+                    raise OSError("connection reset")
+
+            def shutdown(self):
+                self.calls.append('shutdown')
+
+        clients = [Client(fail_logout=True), Client(fail_logout=False)]
+        connections_made = []
+
+        def connect():
+            connection = MaildirConnection.__new__(MaildirConnection)
+            connection._client = clients[len(connections_made)]
+            connections_made.append(connection)
+            return connection
+
+        def process(connection):
+            if len(connections_made) == 1:
+                raise ConnectionError("server closed the connection")
+
+        sleeps = []
+        watcher = MailboxWatcher(connect, process, poll_interval=60, sleep=sleeps.append)
+        watcher.run(should_stop=lambda: len(connections_made) == 2)
+
+        self.assertEqual(clients[0].calls, ['logout', 'shutdown'])
+        # The last connection is logged out when the watcher stops
+        self.assertEqual(clients[1].calls, ['logout'])
+
+    def test_idle_is_ended_when_the_check_fails_then_reconnects(self):
+        class IdleClient:
+            """
+            Stands in for an IMAP server with IDLE; the first session drops mid-wait.
+            """
+            def __init__(self, drops):
+                self.drops = drops
+                self.calls = []
+
+            def has_capability(self, capability):
+                return capability == 'IDLE'
+
+            def select_folder(self, folder):
+                self.calls.append(('select_folder', folder))
+
+            def idle(self):
+                self.calls.append('idle')
+
+            def idle_check(self, timeout):
+                self.calls.append(('idle_check', timeout))
+                if self.drops:
+                    raise ConnectionError("connection reset")
+
+            def idle_done(self):
+                self.calls.append('idle_done')
+
+            def logout(self):
+                self.calls.append('logout')
+
+        class Connection:
+            def __init__(self, client):
+                self._client = client
+
+        clients = [IdleClient(drops=True), IdleClient(drops=False)]
+        connections_made = []
+
+        def connect():
+            connection = Connection(clients[len(connections_made)])
+            connections_made.append(connection)
+            return connection
+
+        sleeps = []
+        watcher = MailboxWatcher(connect, lambda connection: None, idle_timeout=30, sleep=sleeps.append)
+        watcher.run(should_stop=lambda: clients[1].calls.count('idle_done') == 1)
+
+        self.assertEqual(clients[0].calls, [('select_folder', 'INBOX'), 'idle', ('idle_check', 30), 'idle_done', 'logout'])
+        # One backoff, then a fresh session waits with IDLE instead of polling
+        self.assertEqual(sleeps, [1])
+        self.assertEqual(clients[1].calls, [('select_folder', 'INBOX'), 'idle', ('idle_check', 30), 'idle_done', 'logout'])
+
+
+class ChartPivotTests(SimpleTestCase):
+    def test_pivot_fills_missing_days_with_zero(self):
+        day1 = datetime(2026, 10, 1, tzinfo=timezone.utc)
+        day2 = datetime(2026, 10, 2, tzinfo=timezone.utc)
+        rows = [
+            {'date_group': day1, 'domain_entity__domain_name': 'example.com', 'volume': 5},
+            {'date_group': day1, 'domain_entity__domain_name': 'example.org', 'volume': 2},
+            {'date_group': day2, 'domain_entity__domain_name': 'example.com', 'volume': 7},
+        ]
+
+        dates, series = pivot_chart_series(rows, ['example.com', 'example.org', 'example.net'])
+
+        self.assertEqual(dates, ['2026-10-01', '2026-10-02'])
+        self.assertEqual([s['data'] for s in series], [[5, 7], [2, 0], [0, 0]])
+        self.assertEqual([s['name'] for s in series], ['example.com', 'example.org', 'example.net'])
+
+    def test_same_output_as_the_pivot_it_replaced(self):
+        rows = chart_rows(days=20, domains=4, fill=0.7)
+        domain_names = [f"seed{domain}.example" for domain in range(4)]
+        self.assertEqual(pivot_chart_series(rows, domain_names), legacy_chart_series(rows, domain_names))
+
+
+class DailyStatsTests(TestCase):
+    def test_aggregate_matches_raw_rows(self):
+        domain = create_domain()
+        start = datetime(2026, 10, 1, 6, tzinfo=timezone.utc)
+        # Four rows per day over three days, one of them an acknowledged threat
+        create_reports(
+            domain, 12, date_begin=lambda i: start + timedelta(days=i // 4, hours=i % 4),
+            count=lambda i: i + 1, spf_aligned=lambda i: i % 2 == 0, dkim_aligned=lambda i: i % 3 == 0,
+            is_acknowledged=lambda i: i == 5
+        )
+
+        stats = DomainDailyStats.objects.filter(domain_entity=domain).order_by('bucket')
+        self.assertEqual([row.bucket for row in stats], [start.replace(hour=0) + timedelta(days=d) for d in range(3)])
+        raw = DmarcReport.objects.filter(domain_entity=domain)
+        self.assertEqual(
+            stats.aggregate(volume=Sum('volume'), spf=Sum('spf_pass'), dkim=Sum('dkim_pass'), dmarc=Sum('dmarc_pass'), threats=Sum('threat_count')),
+            {
+                'volume': sum(r.count for r in raw),
+                'spf': sum(r.count for r in raw if r.spf_aligned),
+                'dkim': sum(r.count for r in raw if r.dkim_aligned),
+                'dmarc': sum(r.count for r in raw if r.spf_aligned or r.dkim_aligned),
+                'threats': sum(1 for r in raw if not r.spf_aligned and not r.dkim_aligned and not r.is_acknowledged),
+            }
+        )
+
+
+class InspectionDataTests(SimpleTestCase):
+    def build(self, spf_aligned, dkim_aligned, auth_results):
+        return DmarcReport(
+            spf_aligned=spf_aligned, dkim_aligned=dkim_aligned, auth_results=auth_results,
+            **DmarcReport.classify(spf_aligned, dkim_aligned, auth_results)
+        )
+
+    def test_threat_is_read_from_columns(self):
+        report = self.build(False, False, {
+            'spf': [{'domain': 'spoof.example', 'result': 'softfail'}],
+            'dkim': [{'domain': 'spoof.example', 'selector': 's1', 'result': 'fail'}],
+        })
+
+        self.assertEqual(report.threat_level, DmarcReport.THREAT_RED)
+        data = report.inspection_data
+        self.assertTrue(data['threat'])
+        self.assertEqual(data['spf_tag'], {'label': 'SPF', 'status': 'SOFTFAIL', 'color': 'yellow', 'detail': 'Domain: spoof.example'})
+        self.assertEqual(data['dkim_tag'], {'label': 'DKIM', 'status': 'FAIL', 'color': 'red', 'detail': 'Selector: s1'})
+
+        # Later accesses reuse the same dict, auth_results is not walked again
+        report.auth_results = None
+        self.assertIs(report.inspection_data, data)
+
+    def test_missing_results(self):
+        report = self.build(True, False, {'spf': [{'domain': 'example.com', 'result': 'pass'}], 'dkim': []})
+
+        self.assertEqual(report.threat_level, DmarcReport.THREAT_YELLOW)
+        self.assertEqual(report.inspection_data['spf_tag']['color'], 'green')
+        self.assertEqual(report.inspection_data['dkim_tag']['status'], 'MISSING')
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.domain = create_domain()
+        start = datetime(2026, 10, 1, tzinfo=timezone.utc)
+        # Pairs of rows share a date_begin, so pages must split on id too
+        create_reports(
+            self.domain, 7, report_id=lambda i: f"r{i // 2}", date_begin=lambda i: start + timedelta(days=i // 2),
+            spf_aligned=True, dkim_aligned=True
+        )
+
+    def test_pages_cover_every_row_once_newest_first(self):
+        seen = []
+        cursor = None
+        while True:
+            page, cursor = keyset_page(DmarcReport.objects.all(), cursor, page_size=3)
+            seen.extend((r.date_begin, r.id) for r in page)
+            if cursor is None:
+                break
+
+        self.assertEqual(len(seen), 7)
+        self.assertEqual(seen, sorted(seen, reverse=True))
+
+    def test_load_more_returns_rows_only(self):
+        first = self.client.get(f"/domain/{self.domain.id}/?period=90d")
+        self.assertContains(first, "Load more")
+
+        cursor = encode_cursor(first.context['reports'][-1])
+        more = self.client.get(f"/domain/{self.domain.id}/", {'period': '90d', 'cursor': cursor}, HTTP_HX_REQUEST='true')
+        self.assertNotContains(more, "<table")
+
+
+class CursorTests(SimpleTestCase):
+    def test_round_trip(self):
+        report = DmarcReport(id=42, date_begin=datetime(2026, 10, 1, 12, 30, 0, 123456, tzinfo=timezone.utc))
+        self.assertEqual(decode_cursor(encode_cursor(report)), (report.date_begin, 42))
+
+    def test_garbled_cursor_starts_from_the_top(self):
+        for value in (None, "", "abc", "1-2-3", "99999999999999999999999-1"):
+            self.assertIsNone(decode_cursor(value))
+
+    def test_row_partials_render_lazy_details(self):
+        report = DmarcReport(
+            id=7, date_begin=datetime(2026, 10, 1, tzinfo=timezone.utc), source_ip="192.0.2.1",
+            count=3, disposition="none", spf_aligned=False, dkim_aligned=False, auth_results={},
+            domain_entity=DomainEntity(domain_name="example.com"),
+            **DmarcReport.classify(False, False, {})
+        )
+        for template in ('domain_rows', 'threat_rows', 'report_list_rows'):
+            html = render_to_string(f'dashboard/partials/{template}.html', {'reports': [report], 'next_cursor': '1-7'})
+            self.assertIn('cursor=1-7', html)
+            self.assertNotIn('Raw JSON', html)
+
+
+class SenderRollupTests(TestCase):
+    def test_rollup_accumulates_across_reports_and_ignores_duplicates(self):
+        xml_path = TESTDATA_DIR / 'google.com!example.com!1760659200!1760745599.xml'
+        report = parse_report_file(str(xml_path), offline=True)["report"]
+        resent = {**report, "report_metadata": {**report["report_metadata"], "org_name": "Other Reporter", "report_id": "resent-1"}}
+        entity = DomainResolver().resolve(report["policy_published"]["domain"])
+
+        write_report(report, entity)
+        self.assertIsNone(write_report(report, entity))
+        write_report(resent, entity)
+
+        self.assertEqual(SenderRollup.objects.count(), len(report["records"]))
+        for rollup in SenderRollup.objects.all():
+            rows = DmarcReport.objects.filter(domain_entity=entity, source_ip=rollup.source_ip)
+            self.assertEqual(rollup.total_count, sum(r.count for r in rows))
+            self.assertEqual(rollup.row_count, 2)
+            self.assertEqual(sorted(rollup.reporters), sorted([report["report_metadata"]["org_name"], "Other Reporter"]))
+
+
+class PageCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_cached_until_data_version_bumps(self):
+        builds = []
+        build = lambda: builds.append(1) or {'rows': len(builds)}
+
+        self.assertEqual(cached_context('dashboard', [30, 'day'], build), {'rows': 1})
+        self.assertEqual(cached_context('dashboard', [30, 'day'], build), {'rows': 1})
+        self.assertEqual(cached_context('dashboard', [7, 'day'], build), {'rows': 2})
+
+        bump_data_version()
+        self.assertEqual(cached_context('dashboard', [30, 'day'], build), {'rows': 3})
+
+        stats = cache_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 3))
+
+    def test_stats_endpoint(self):
+        response = self.client.get('/cache/stats/')
+        self.assertEqual(response.json()['hits'], 0)
+
+
+class StoragePolicyTests(SimpleTestCase):
+    @override_settings(TIMESCALE_RETENTION_DAYS=60)
+    def test_retention_must_outlive_aggregate_refresh_window(self):
+        # Raised before any SQL runs, so no cursor is needed
+        with self.assertRaises(ImproperlyConfigured):
+            apply_storage_policies(cursor=None)
+
+
+class AuthResultTablesTests(TestCase):
+    def ingest_fixture(self):
+        xml_path = TESTDATA_DIR / 'google.com!example.com!1760659200!1760745599.xml'
+        report = parse_report_file(str(xml_path), offline=True)["report"]
+        entity = DomainResolver().resolve(report["policy_published"]["domain"])
+        write_report(report, entity)
+        return report, entity
+
+    def test_typed_results_replace_raw_json(self):
+        report, entity = self.ingest_fixture()
+
+        expected_spf = sum(len(r["auth_results"]["spf"]) for r in report["records"])
+        expected_dkim = sum(len(r["auth_results"]["dkim"]) for r in report["records"])
+        self.assertEqual(SpfResult.objects.count(), expected_spf)
+        self.assertEqual(DkimResult.objects.count(), expected_dkim)
+        self.assertFalse(DmarcReport.objects.exclude(auth_results={}).exists())
+
+        # Every result points at a real report row
+        row_ids = set(DmarcReport.objects.values_list('id', flat=True))
+        self.assertTrue(set(SpfResult.objects.values_list('report_row_id', flat=True)) <= row_ids)
+
+        # Classification still comes from the parsed record
+        self.assertEqual(
+            sorted(DmarcReport.objects.values_list('spf_result', flat=True)),
+            sorted(r["auth_results"]["spf"][0]["result"] for r in report["records"])
+        )
+
+    @override_settings(STORE_RAW_AUTH_RESULTS=True)
+    def test_raw_json_kept_on_request(self):
+        report, entity = self.ingest_fixture()
+        self.assertEqual(
+            sorted(DmarcReport.objects.values_list('auth_results', flat=True), key=str),
+            sorted((r["auth_results"] for r in report["records"]), key=str)
+        )
+
+    def test_result_tables_are_hypertables(self):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT hypertable_name FROM timescaledb_information.hypertables")
+            hypertables = {row[0] for row in cursor.fetchall()}
+        self.assertTrue(set(HYPERTABLES) <= hypertables)
+
+    def test_selector_report(self):
+        report, entity = self.ingest_fixture()
+        rows = list(dkim_selector_failures(entity, datetime(2000, 1, 1, tzinfo=timezone.utc)))
+
+        dkim = [(r["auth_results"]["dkim"], r["count"]) for r in report["records"]]
+        total = sum(count for results, count in dkim for _ in results)
+        self.assertEqual(sum(row['total'] for row in rows), total)
+
+
+class QueryPlanTests(TestCase):
+    def test_view_queries_use_indexes(self):
+        now = datetime.now(timezone.utc)
+        create_reports(
+            create_domain(), 500, date_begin=lambda i: now - timedelta(hours=i),
+            source_ip=lambda i: f"192.0.2.{i % 250}", spf_aligned=lambda i: i % 2 == 0, dkim_aligned=lambda i: i % 3 != 0
+        )
+
+        out = io.StringIO()
+        # Raises CommandError if any query needs a sequential scan
+        call_command('check_query_plans', stdout=out)
+        self.assertIn("All view queries use indexes.", out.getvalue())
+
+
+class SyntheticReportTests(SimpleTestCase):
+    def test_xml_parses_back_to_the_generated_report(self):
+        report = next(generate_reports(domains=1, days=1, records=5, reporters=1))
+        with TemporaryDirectory() as tmp:
+            path = Path(tmp) / report_filename(report)
+            path.write_bytes(report_xml(report))
+            parsed = parse_report_file(str(path), offline=True)["report"]
+
+        entity = DomainEntity(pk=1, domain_name="seed0.example")
+        fields = ('source_ip', 'count', 'spf_aligned', 'dkim_aligned', 'disposition', 'threat_level', 'spf_result', 'dkim_selector')
+        self.assertEqual(
+            [[getattr(row, f) for f in fields] for row in build_report_rows(parsed, entity)],
+            [[getattr(row, f) for f in fields] for row in build_report_rows(report, entity)]
+        )
+
+    def test_same_seed_same_reports(self):
+        self.assertEqual(list(generate_reports(days=2, seed=7)), list(generate_reports(days=2, seed=7)))
+
+
+class SeedCommandTests(TestCase):
+    def test_seed_writes_rows_and_daily_stats(self):
+        call_command('seed_dmarc', domains=2, days=2, records=5, reporters=1, stdout=io.StringIO())
+        self.assertEqual(DmarcReport.objects.count(), 2 * 2 * 5)
+
+        # Seeding again with the same seed is deduplicated
+        call_command('seed_dmarc', domains=2, days=2, records=5, reporters=1, stdout=io.StringIO())
+        self.assertEqual(DmarcReport.objects.count(), 2 * 2 * 5)
+
+
+class InstrumentationTests(SimpleTestCase):
+    def setUp(self):
+        METRICS.reset()
+
+    def test_server_timing_and_metrics(self):
+        backend = TimedDjangoTemplates({'NAME': 'timed', 'DIRS': [], 'APP_DIRS': False, 'OPTIONS': {}})
+
+        def view(request):
+            return HttpResponse(backend.from_string("{{ value }}").render({'value': 'ok'}))
+
+        response = InstrumentationMiddleware(view)(RequestFactory().get('/'))
+        self.assertEqual(response.content, b'ok')
+        self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="0 queries", tpl;dur=[\d.]+, total;dur=[\d.]+$')
+
+        metrics = prometheus_metrics()
+        self.assertIn('dmarc_http_requests_total{view="unresolved"} 1', metrics)
+        self.assertIn('dmarc_db_queries_total{view="unresolved"} 0', metrics)
+
+    def test_nested_stages_are_charged_once(self):
+        timer = StageTimer()
+        # outer starts at 0, inner runs from 1 to 3, outer ends at 6
+        with patch('dashboard.instrumentation.time.perf_counter', side_effect=[0, 1, 3, 6]):
+            with timer.stage('parse'):
+                with timer.stage('fetch'):
+                    pass
+        self.assertEqual(timer.totals, {'parse': 4, 'fetch': 2})
+
+
+class SenderRulesTests(SimpleTestCase):
+    def row(self, threat_level=DmarcReport.THREAT_RED, **fields):
+        fields = {'source_ip': '192.0.2.1', 'source_base_domain': 'lists.example', 'domain_entity_id': 1, **fields}
+        return DmarcReport(threat_level=threat_level, **fields)
+
+    def test_only_matching_threats_are_acknowledged(self):
+        rules = SenderRules([
+            AcknowledgedSender(source_ip='192.0.2.1'),
+            AcknowledgedSender(source_base_domain='Forwarder.example', domain_entity_id=2),
+        ])
+        rows = [
+            self.row(),
+            self.row(source_ip='192.0.2.2'),
+            self.row(threat_level=DmarcReport.THREAT_YELLOW),
+            self.row(source_ip='192.0.2.3', source_base_domain='forwarder.example', domain_entity_id=2),
+            self.row(source_ip='192.0.2.3', source_base_domain='forwarder.example', domain_entity_id=1),
+        ]
+        self.assertEqual(rules.apply(rows), 2)
+        self.assertEqual([row.is_acknowledged for row in rows], [True, False, False, True, False])
+
+
+class BulkAcknowledgeTests(TestCase):
+    def setUp(self):
+        self.domain = create_domain()
+        create_reports(self.domain, 12, source_ip=lambda i: f"192.0.2.{i % 3}", spf_aligned=lambda i: i % 2 == 0)
+
+    def test_acknowledge_by_ip(self):
+        threats = open_threats(source_ip="192.0.2.1")
+        expected = threats.count()
+        self.assertEqual(acknowledge_threats(threats), expected)
+        self.assertFalse(open_threats(source_ip="192.0.2.1").exists())
+        self.assertTrue(open_threats(source_ip="192.0.2.0").exists())
+
+    def test_remembered_sender_applies_at_ingest(self):
+        response = self.client.post('/threats/ack/', {'ip': '192.0.2.2', 'remember': '1'})
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(AcknowledgedSender.objects.filter(source_ip='192.0.2.2').exists())
+
+        rows = build_report_rows({
+            "report_metadata": {"org_name": "Example", "report_id": "later", "date_range": {"begin": 1760659200, "end": 1760745599}},
+            "policy_published": {"domain": "example.com"},
+            "records": [{"source": {"ip_address": "192.0.2.2"}, "count": 3, "alignment": {"spf": False, "dkim": False}}],
+        }, self.domain)
+        SenderRules.load().apply(rows)
+        self.assertTrue(rows[0].is_acknowledged)
+
+    def test_filter_required(self):
+        self.assertEqual(self.client.post('/threats/ack/').status_code, 400)
+
+    def test_invalid_domain(self):
+        self.assertEqual(self.client.post('/threats/ack/', {'domain': 'abc'}).status_code, 400)
+        self.assertTrue(open_threats().exists())
+
+
+class LruCacheTests(SimpleTestCase):
+    def test_evicts_least_recently_used(self):
+        lru = LruCache(2)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        lru.get('a')
+        lru.set('c', 3)
+        self.assertEqual((lru.get('a'), lru.get('b'), lru.get('c')), (1, None, 3))
+
+    def test_ips_are_normalized_like_the_database(self):
+        self.assertEqual(normalize_ip('2001:DB8:0:0::1'), '2001:db8::1')
+        self.assertEqual(normalize_ip('192.0.2.1'), '192.0.2.1')
+        self.assertIsNone(normalize_ip('not-an-ip'))
+
+
+class IpEnrichmentTests(TestCase):
+    def parse_fixture(self):
+        xml_path = TESTDATA_DIR / 'google.com!example.com!1760659200!1760745599.xml'
+        return parse_report_file(str(xml_path), offline=True)["report"]
+
+    def test_lookups_are_cached_per_ip(self):
+        reports = [self.parse_fixture(), self.parse_fixture()]
+        ips = {record["source"]["ip_address"] for record in reports[0]["records"]}
+
+        with patch('dashboard.enrichment.get_reverse_dns', return_value='mail.sender.example') as lookup:
+            IpEnricher().enrich_reports(reports)
+            # A new process: served by the table, not DNS
+            IpEnricher().enrich_reports([self.parse_fixture()])
+        self.assertEqual(lookup.call_count, len(ips))
+        self.assertEqual(reports[1]["records"][0]["source"]["base_domain"], 'sender.example')
+
+    def test_offline_ingest_is_backfilled(self):
+        report = self.parse_fixture()
+        IpEnricher(offline=True).enrich_reports([report])
+        entity = DomainResolver().resolve(report["policy_published"]["domain"])
+        write_report(report, entity)
+        self.assertFalse(IpEnrichment.objects.filter(dns_resolved_at__isnull=False).exists())
+
+        with patch('dashboard.enrichment.get_reverse_dns', return_value='mail.sender.example'):
+            call_command('enrich_ips', stdout=io.StringIO())
+
+        self.assertFalse(IpEnrichment.objects.filter(dns_resolved_at__isnull=True).exists())
+        self.assertEqual(set(DmarcReport.objects.values_list('source_hostname', 'source_base_domain')), {('mail.sender.example', 'sender.example')})
+
+    def test_backfill_applies_base_domain_rules(self):
+        AcknowledgedSender.objects.create(source_base_domain='sender.example')
+        report = self.parse_fixture()
+        IpEnricher(offline=True).enrich_reports([report])
+        write_report(report, DomainResolver().resolve(report["policy_published"]["domain"]))
+        self.assertTrue(open_threats().exists())
+
+        with patch('dashboard.enrichment.get_reverse_dns', return_value='mail.sender.example'):
+            call_command('enrich_ips', stdout=io.StringIO())
+
+        self.assertFalse(open_threats().exists())
+        self.assertTrue(DmarcReport.objects.filter(threat_level=DmarcReport.THREAT_RED, is_acknowledged=True).exists())
+
+
+class HealthTests(SimpleTestCase):
+    def test_liveness_needs_no_database(self):
+        response = self.client.get('/healthz')
+        self.assertEqual((response.status_code, response.content), (200, b'ok'))
+
+
+class ReadinessTests(TestCase):
+    def test_ready_when_migrated(self):
+        response = self.client.get('/readyz')
+        self.assertEqual((response.status_code, response.content), (200, b'ready'))
+
+
+class ConcurrentQueryTests(SimpleTestCase):
+    def tearDown(self):
+        shutdown_query_pool()
+
+    def test_results_in_order_and_overlapping(self):
+        def slow(value):
+            return lambda: time.sleep(0.3) or value
+
+        started = time.monotonic()
+        results = async_to_sync(run_concurrently)(slow('a'), slow('b'), slow('c'))
+        self.assertEqual(results, ['a', 'b', 'c'])
+        self.assertLess(time.monotonic() - started, 0.8)
+
+    @override_settings(DB_QUERY_WORKERS=2)
+    def test_threads_are_reused(self):
+        thread_name = lambda: threading.current_thread().name
+        names = set()
+        for _ in range(3):
+            names.update(async_to_sync(run_concurrently)(thread_name, thread_name, thread_name))
+        self.assertLessEqual(len(names), 2)
+
+
+class DashboardViewTests(TransactionTestCase):
+    # The query pool's threads only see committed rows
+    def setUp(self):
+        cache.clear()
+        METRICS.reset()
+        create_reports(create_domain(), 3, count=2, spf_aligned=lambda i: i == 0)
+
+    def tearDown(self):
+        # Its connections would keep the test database from being dropped
+        shutdown_query_pool()
+
+    @modify_settings(MIDDLEWARE={'prepend': 'dashboard.instrumentation.InstrumentationMiddleware'})
+    def test_totals_and_pooled_queries_are_counted(self):
+        response = self.client.get('/', {'period': '7d'})
+        self.assertEqual(response.context['global_stats']['total_volume'], 6)
+        self.assertEqual(response.context['threat_ips'], 1)
+        self.assertEqual([row['total'] for row in response.context['domain_stats']], [6])
+
+        # Card totals, threat IPs, domain table and chart all ran on the pool
+        queries = int(re.search(r'desc="(\d+) queries"', response['Server-Timing']).group(1))
+        self.assertGreaterEqual(queries, 4)
+
+
+class ExportTests(TestCase):
+    def setUp(self):
+        self.domain = create_domain()
+        create_reports(
+            self.domain, 10, source_ip=lambda i: f"192.0.2.{i}", count=lambda i: i + 1, spf_aligned=lambda i: i % 2 == 0
+        )
+
+    def test_csv_export_filters_like_active_threats(self):
+        response = self.client.get('/reports/export/', {'format': 'csv', 'threats': '1', 'period': '7d'})
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertTrue(lines[0].startswith("date_begin,date_end,domain,"))
+        # Odd rows fail both checks; days 1, 3 and 5 fall inside the period
+        self.assertEqual(len(lines) - 1, 3)
+
+    def test_ndjson_command(self):
+        out = io.StringIO()
+        call_command('export_dmarc', format='ndjson', domain='example.com', stdout=out)
+        self.assertEqual(len(out.getvalue().splitlines()), 10)
+
+    def test_unknown_format(self):
+        self.assertEqual(self.client.get('/reports/export/', {'format': 'xlsx'}).status_code, 400)
+
+    def test_invalid_domain(self):
+        self.assertEqual(self.client.get('/reports/export/', {'domain': 'abc'}).status_code, 400)
+
+
+class ParquetExportTests(SimpleTestCase):
+    def test_row_groups_are_streamed(self):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            self.skipTest("pyarrow is not installed")
+
+        now = datetime.now(timezone.utc)
+        row = (now, now, 'example.com', 'r1', '192.0.2.1', None, None, 'US', 5, 'none', True, False,
+               'yellow', 'pass', 'example.com', 'fail', 's1', 'example.com', 'example.com', False)
+        chunks = list(iter_parquet(iter([row] * 25), row_group_size=10))
+
+        self.assertEqual(len(chunks), 3)
+        parquet = pq.ParquetFile(io.BytesIO(b"".join(chunks)))
+        self.assertEqual((parquet.metadata.num_rows, parquet.num_row_groups), (25, 3))
+
+
+class ApiTests(TestCase):
+    def setUp(self):
+        self.domain = create_domain()
+        create_reports(
+            self.domain, 7, source_ip=lambda i: f"192.0.2.{i}", spf_aligned=lambda i: i % 2 == 0,
+            auth_results={'spf': [], 'dkim': []}
+        )
+
+    def test_cursor_pages_cover_every_row_once(self):
+        seen = []
+        url = '/api/v1/reports/?page_size=3'
+        while url:
+            page = self.client.get(url).json()
+            seen.extend(row['report_id'] for row in page['results'])
+            url = page['next']
+        self.assertEqual(seen, [f"r{i}" for i in range(7)])
+
+    def test_fields_leave_out_auth_results(self):
+        rows = self.client.get('/api/v1/reports/', {'fields': 'domain,source_ip'}).json()['results']
+        self.assertEqual(rows[0], {'domain': 'example.com', 'source_ip': '192.0.2.0'})
+
+    def test_invalid_domain_filter(self):
+        response = self.client.get('/api/v1/reports/', {'domain': 'abc'})
+        self.assertEqual((response.status_code, list(response.json())), (400, ['domain']))
+
+    def test_threats_are_open_red_rows(self):
+        rows = self.client.get('/api/v1/threats/', {'period': '7d'}).json()['results']
+        self.assertEqual([row['report_id'] for row in rows], ['r1', 'r3', 'r5'])
+
+    def test_not_modified_until_data_changes(self):
+        first = self.client.get('/api/v1/domains/')
+        etag = first['ETag']
+        self.assertEqual(self.client.get('/api/v1/domains/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        bump_data_version()
+        self.assertEqual(self.client.get('/api/v1/domains/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_rolling_default_period_changes_hourly(self):
+        hourly = r'^"v\d+-\d{10}"$'
+        self.assertRegex(self.client.get('/api/v1/threats/')['ETag'], hourly)
+        self.assertRegex(self.client.get('/api/v1/reports/', {'period': '7d'})['ETag'], hourly)
+        # All time, nothing ages out
+        self.assertRegex(self.client.get('/api/v1/reports/')['ETag'], r'^"v\d+"$')
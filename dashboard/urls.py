@@ -1,14 +1,34 @@
-from django.urls import path
-from . import views
+from django.urls import include, path
+from rest_framework.routers import SimpleRouter
+
+from . import api, views
+
+router = SimpleRouter()
+router.register('domains', api.DomainViewSet, basename='api-domain')
+router.register('reports', api.ReportViewSet, basename='api-report')
+router.register('threats', api.ThreatViewSet, basename='api-threat')
 
 urlpatterns = [
     path('', views.dashboard, name='dashboard'),
     path('domain/<int:domain_id>/', views.domain_detail, name='domain_detail'),
+    path('domain/<int:domain_id>/senders/', views.domain_senders, name='domain_senders'),
+    path('domain/<int:domain_id>/selectors/', views.domain_selectors, name='domain_selectors'),
     path('threats/', views.active_threats, name='active_threats'),
     
     # --- NEW: View All Reports ---
     path('reports/', views.report_list, name='report_list'),
+    path('reports/export/', views.export_reports, name='export_reports'),
     
     path('ingest/trigger/', views.trigger_ingest, name='trigger_ingest'),
+    path('ingest/<int:job_id>/status/', views.ingest_status, name='ingest_status'),
+    path('cache/stats/', views.cache_stats_view, name='cache_stats'),
+    path('metrics', views.metrics, name='metrics'),
+    path('healthz', views.health, name='health'),
+    path('readyz', views.ready, name='ready'),
+    path('report/<int:report_id>/details/', views.report_details, name='report_details'),
+    path('threats/ack/', views.bulk_acknowledge, name='bulk_acknowledge'),
     path('report/<int:report_id>/ack/', views.acknowledge_report, name='acknowledge_report'),
+
+    path('api/v1/stats/', api.StatsView.as_view(), name='api-stats'),
+    path('api/v1/', include(router.urls)),
 ]
\ No newline at end of file
@@ -1,157 +1,142 @@
-from django.shortcuts import render, get_object_or_404
-from django.db.models import Sum, Q, Count, Max
+from asgiref.sync import sync_to_async
+from django.shortcuts import redirect, render, get_object_or_404
 from django.utils import timezone
 from datetime import timedelta
-from django.db.models.functions import TruncDay, TruncWeek, TruncMonth
-from django.core.management import call_command
-from django.http import HttpResponse
-from django.core.paginator import Paginator #
-import io
-import json
+from django.conf import settings
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+import ipaddress
 
-from .models import DmarcReport, DomainEntity
+from .acknowledge import acknowledge_threats, open_threats
+from .models import AcknowledgedSender, DkimResult, DmarcReport, DomainEntity, IngestJob, SenderRollup, SpfResult
+from .export import EXPORT_FORMATS, ExportError, export_queryset, export_stream
+from .caching import acached_context, bump_data_version, cache_stats, cached_context, cursor_key
+from .health import readiness_problems
+from .instrumentation import prometheus_metrics
+from .jobs import enqueue_ingest
+from .pagination import keyset_page
+from .queries import all_reports, domain_reports, unacknowledged_threats
+from .stats import GRANULARITY_TRUNC, dashboard_context, dkim_selector_failures, refresh_daily_stats
 
-def dashboard(request):
+async def dashboard(request):
+    """
+    Async, so its independent queries can run at the same time (see
+    dashboard_context). Fastest under ASGI; under WSGI Django gives each
+    request its own event loop.
+    """
     # 1. Date Filter Logic
     period = request.GET.get('period', '30d')
     granularity = request.GET.get('granularity', 'day')
+    if granularity not in GRANULARITY_TRUNC:
+        granularity = 'day'
     
     days_map = {'7d': 7, '30d': 30, '90d': 90}
     days = days_map.get(period, 30)
     
-    date_end = timezone.now()
-    date_begin = date_end - timedelta(days=days)
+    # Everything below only changes when data does, see dashboard.caching
+    context = await acached_context('dashboard', [days, granularity], lambda: dashboard_context(days, granularity))
+    context = {**context, 'period': period, 'granularity': granularity}
 
-    # 2. Base Query
-    reports = DmarcReport.objects.filter(date_begin__gte=date_begin, date_begin__lte=date_end)
+    return await sync_to_async(render)(request, 'dashboard/dashboard.html', context)
 
-    # 3. High Level Stats (Cards)
-    global_stats = reports.aggregate(
-        total_volume=Sum('count'),
-        dkim_aligned_count=Sum('count', filter=Q(dkim_aligned=True)),
-        spf_aligned_count=Sum('count', filter=Q(spf_aligned=True)),
-        dmarc_pass_count=Sum('count', filter=Q(spf_aligned=True) | Q(dkim_aligned=True))
-    )
+def domain_detail(request, domain_id):
+    domain = get_object_or_404(DomainEntity, pk=domain_id)
+    
+    period = request.GET.get('period', '30d')
+    days_map = {'7d': 7, '30d': 30, '90d': 90}
+    days = days_map.get(period, 30)
     
-    # Threat Calculation
-    threat_ips = reports.filter(
-        spf_aligned=False, 
-        dkim_aligned=False,
-        is_acknowledged=False
-    ).values('source_ip').distinct().count()
-
-    total_volume = global_stats['total_volume'] or 0
-    dmarc_pass = global_stats['dmarc_pass_count'] or 0
-    pass_percentage = round((dmarc_pass / total_volume) * 100, 1) if total_volume > 0 else 0
-
-    # 4. Domain Table Stats (Updated with Last Seen & Threat Count)
-    domain_stats = reports.values(
-        'domain_entity__id',
-        'domain_entity__domain_name'
-    ).annotate(
-        total=Sum('count'),
-        dmarc_pass_count=Sum('count', filter=Q(spf_aligned=True) | Q(dkim_aligned=True)),
-        spf_pass_count=Sum('count', filter=Q(spf_aligned=True)),
-        dkim_pass_count=Sum('count', filter=Q(dkim_aligned=True)),
-        # NEW: Count specific threat rows for this domain
-        active_threat_count=Count('id', filter=Q(spf_aligned=False, dkim_aligned=False, is_acknowledged=False)),
-        # NEW: Last Seen based on record date
-        last_seen=Max('date_begin')
-    ).order_by('-total')
-
-    # 5. Chart Logic (Multi-Line by Domain)
-    trunc_func = TruncDay
-    if granularity == 'week':
-        trunc_func = TruncWeek
-    elif granularity == 'month':
-        trunc_func = TruncMonth
-
-    # A. Get Top 10 Domains
-    top_domains = list(domain_stats[:10].values_list('domain_entity__domain_name', flat=True))
-
-    # B. Aggregate data
-    chart_data_qs = reports.filter(
-        domain_entity__domain_name__in=top_domains
-    ).annotate(
-        date_group=trunc_func('date_begin')
-    ).values(
-        'date_group', 'domain_entity__domain_name'
-    ).annotate(
-        volume=Sum('count')
-    ).order_by('date_group')
-
-    # C. Pivot Data
-    unique_dates = sorted(list(set(item['date_group'].strftime('%Y-%m-%d') for item in chart_data_qs)))
+    date_end = timezone.now()
+    date_begin = date_end - timedelta(days=days)
     
-    series_data = []
-    for domain in top_domains:
-        domain_volumes = []
-        for date in unique_dates:
-            record = next(
-                (x for x in chart_data_qs if x['date_group'].strftime('%Y-%m-%d') == date and x['domain_entity__domain_name'] == domain), 
-                None
-            )
-            vol = int(record['volume']) if record else 0
-            domain_volumes.append(vol)
-            
-        series_data.append({
-            'name': domain,
-            'type': 'line',
-            'smooth': True,
-            'data': domain_volumes
-        })
+    reports = domain_reports(domain, date_begin, date_end)
 
+    # One page at a time; the "load more" row asks for the next one via htmx
+    cursor = request.GET.get('cursor')
+    page, next_cursor = cached_context(
+        'domain_detail', [domain.pk, days, cursor_key(cursor)],
+        lambda: keyset_page(reports, cursor)
+    )
+    
     context = {
+        'domain': domain,
+        'reports': page,
         'period': period,
-        'granularity': granularity,
-        'global_stats': global_stats,
-        'threat_ips': threat_ips, 
-        'pass_percentage': pass_percentage,
-        'domain_stats': domain_stats,
-        'chart_dates': json.dumps(unique_dates),
-        'chart_series': json.dumps(series_data),
+        'cursor': cursor,
+        'next_cursor': next_cursor,
     }
+    if request.headers.get('HX-Request'):
+        return render(request, 'dashboard/partials/domain_rows.html', context)
+    return render(request, 'dashboard/domain_detail.html', context)
 
-    return render(request, 'dashboard/dashboard.html', context)
-
-def domain_detail(request, domain_id):
+def domain_senders(request, domain_id):
+    """
+    Who sends as this domain: one line per source IP and outcome, read from the
+    sender rollups instead of the raw report rows.
+    """
     domain = get_object_or_404(DomainEntity, pk=domain_id)
-    
+
     period = request.GET.get('period', '30d')
     days_map = {'7d': 7, '30d': 30, '90d': 90}
     days = days_map.get(period, 30)
-    
-    date_end = timezone.now()
-    date_begin = date_end - timedelta(days=days)
-    
-    reports = DmarcReport.objects.filter(
+
+    # Totals are all-time; the period only picks senders seen recently
+    senders = SenderRollup.objects.filter(
         domain_entity=domain,
-        date_begin__gte=date_begin, 
-        date_begin__lte=date_end
-    ).order_by('-date_begin')
-    
+        last_seen__gte=timezone.now() - timedelta(days=days)
+    ).order_by('-total_count')[:200]
+
     context = {
         'domain': domain,
-        'reports': reports,
+        'senders': senders,
         'period': period
     }
-    return render(request, 'dashboard/domain_detail.html', context)
+    return render(request, 'dashboard/domain_senders.html', context)
+
+def domain_selectors(request, domain_id):
+    """
+    DKIM results per signing domain and selector, to spot a failing key.
+    """
+    domain = get_object_or_404(DomainEntity, pk=domain_id)
+
+    period = request.GET.get('period', '30d')
+    days_map = {'7d': 7, '30d': 30, '90d': 90}
+    days = days_map.get(period, 30)
+
+    selectors = cached_context(
+        'domain_selectors', [domain.pk, days],
+        lambda: list(dkim_selector_failures(domain, timezone.now() - timedelta(days=days)))
+    )
+
+    context = {
+        'domain': domain,
+        'selectors': selectors,
+        'period': period
+    }
+    return render(request, 'dashboard/domain_selectors.html', context)
 
 # --- NEW VIEW FOR ALL REPORTS ---
 def report_list(request):
     """
-    Shows a paginated list of all reports, ordered by date (newest first).
+    Shows all reports, newest first, 50 at a time (keyset pagination, no COUNT(*)).
+    `?ip=` narrows it to one sending IP.
     """
-    report_list = DmarcReport.objects.select_related('domain_entity').all().order_by('-date_begin')
-    
-    paginator = Paginator(report_list, 50) # Show 50 reports per page
-    
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    source_ip = request.GET.get('ip', '').strip()
+    try:
+        source_ip = str(ipaddress.ip_address(source_ip)) if source_ip else ''
+    except ValueError:
+        source_ip = ''
+
+    cursor = request.GET.get('cursor')
+    page, next_cursor = keyset_page(all_reports(source_ip), cursor)
     
     context = {
-        'page_obj': page_obj
+        'reports': page,
+        'source_ip': source_ip,
+        'cursor': cursor,
+        'next_cursor': next_cursor,
     }
+    if request.headers.get('HX-Request'):
+        return render(request, 'dashboard/partials/report_list_rows.html', context)
     return render(request, 'dashboard/report_list.html', context)
 
 def active_threats(request):
@@ -165,45 +150,131 @@ def active_threats(request):
     date_end = timezone.now()
     date_begin = date_end - timedelta(days=days)
 
-    threats = DmarcReport.objects.filter(
-        date_begin__gte=date_begin,
-        date_begin__lte=date_end,
-        spf_aligned=False,
-        dkim_aligned=False,
-        is_acknowledged=False
-    ).select_related('domain_entity').order_by('-date_begin')
+    threats = unacknowledged_threats(date_begin, date_end).select_related('domain_entity')
+
+    cursor = request.GET.get('cursor')
+    page, next_cursor = cached_context(
+        'active_threats', [days, cursor_key(cursor)],
+        lambda: keyset_page(threats, cursor)
+    )
 
     context = {
-        'reports': threats,
+        'reports': page,
         'period': period,
-        'total_threats': threats.count()
+        'cursor': cursor,
+        'next_cursor': next_cursor,
     }
+    if request.headers.get('HX-Request'):
+        return render(request, 'dashboard/partials/threat_rows.html', context)
+
+    context['total_threats'] = cached_context('active_threats_total', [days], threats.count)
     return render(request, 'dashboard/active_threats.html', context)
 
+def export_reports(request):
+    """
+    Streams report rows as CSV, NDJSON or Parquet (`format`), filtered like the
+    page the link is on: `domain` + `period` (domain_detail), `threats=1` +
+    `period` (active_threats), `ip` (report_list). Rows are read through a
+    server-side cursor and written out as they arrive, so memory use does not
+    grow with the export (under WSGI; ASGI buffers sync streams).
+    """
+    export_format = request.GET.get('format', 'csv')
+    domain = None
+    if request.GET.get('domain'):
+        try:
+            domain = get_object_or_404(DomainEntity, pk=int(request.GET['domain']))
+        except ValueError:
+            return HttpResponse("Invalid domain", status=400)
+
+    # No period means all time
+    days_map = {'7d': 7, '30d': 30, '90d': 90}
+    days = days_map.get(request.GET.get('period'))
+
+    source_ip = request.GET.get('ip', '').strip()
+    try:
+        source_ip = str(ipaddress.ip_address(source_ip)) if source_ip else ''
+    except ValueError:
+        return HttpResponse("Invalid IP address", status=400)
+    threats_only = request.GET.get('threats') == '1'
+
+    reports = export_queryset(domain=domain, days=days, threats_only=threats_only, source_ip=source_ip)
+    try:
+        stream = export_stream(reports, export_format)
+    except ExportError as e:
+        return HttpResponse(str(e), status=400)
+
+    content_type, extension = EXPORT_FORMATS[export_format]
+    scope = domain.domain_name if domain else 'threats' if threats_only else 'reports'
+    response = StreamingHttpResponse(stream, content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="dmarc-{scope}-{timezone.now():%Y%m%d}.{extension}"'
+    return response
+
+def cache_stats_view(request):
+    """
+    Page cache hit/miss counters and the current data version, as JSON.
+    """
+    return JsonResponse(cache_stats())
+
+def metrics(request):
+    """
+    Request and cache metrics in the Prometheus text format (INSTRUMENTATION only).
+    """
+    if not settings.INSTRUMENTATION:
+        raise Http404("Instrumentation is disabled")
+    return HttpResponse(prometheus_metrics(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def health(request):
+    """
+    Liveness: the process answers requests. Touches nothing else.
+    """
+    return HttpResponse("ok", content_type="text/plain")
+
+def ready(request):
+    """
+    Readiness: the database answers and is migrated, so pages can be served.
+    """
+    problems = readiness_problems()
+    if problems:
+        return HttpResponse("\n".join(problems), content_type="text/plain", status=503)
+    return HttpResponse("ready", content_type="text/plain")
+
+def report_details(request, report_id):
+    """
+    The expandable panel of one report row, loaded the first time it is opened.
+    """
+    report = get_object_or_404(DmarcReport, id=report_id)
+    template = 'dashboard/partials/threat_details.html' if request.GET.get('view') == 'threat' else 'dashboard/partials/domain_details.html'
+    context = {
+        'report': report,
+        # date_begin narrows the lookup to the one chunk holding the row's results
+        'spf_results': SpfResult.objects.filter(report_row_id=report.id, date_begin=report.date_begin).select_related('domain'),
+        'dkim_results': DkimResult.objects.filter(report_row_id=report.id, date_begin=report.date_begin).select_related('domain', 'selector'),
+    }
+    return render(request, template, context)
+
 def trigger_ingest(request):
+    """
+    Queues a background ingest (or joins the one already queued/running)
+    and returns a status panel that polls until the job finishes.
+    """
     if request.method == "POST":
-        out = io.StringIO()
-        try:
-            call_command('ingest_dmarc', limit=10, stdout=out)
-            output_text = out.getvalue()
-            return HttpResponse(f"""
-                <div class="text-sm text-green-600 bg-green-50 p-2 rounded flex items-center">
-                    <span class="mr-2">✔</span> Sync Complete: {output_text.splitlines()[-1] if output_text else 'Done'}
-                </div>
-            """)
-        except Exception as e:
-            return HttpResponse(f"""
-                <div class="text-sm text-red-600 bg-red-50 p-2 rounded">
-                    Error: {str(e)}
-                </div>
-            """)
+        job, created = enqueue_ingest(limit=10)
+        return render(request, 'dashboard/ingest_status.html', {'job': job})
     return HttpResponse(status=400)
 
+def ingest_status(request, job_id):
+    job = get_object_or_404(IngestJob, pk=job_id)
+    return render(request, 'dashboard/ingest_status.html', {'job': job})
+
 def acknowledge_report(request, report_id):
     if request.method == "POST":
-        report = get_object_or_404(DmarcReport, id=report_id)
+        report = get_object_or_404(DmarcReport.objects.only('id', 'date_begin', 'is_acknowledged'), id=report_id)
         report.is_acknowledged = not report.is_acknowledged
-        report.save()
+        # Only the flag is written, not the whole row
+        DmarcReport.objects.filter(id=report.id, date_begin=report.date_begin).update(is_acknowledged=report.is_acknowledged)
+        bump_data_version()
+        # Threat counts on the dashboard come from the daily aggregate
+        refresh_daily_stats(report.date_begin, report.date_begin)
         
         checked_attr = "checked" if report.is_acknowledged else ""
         label_text = "Reviewed" if report.is_acknowledged else "Mark as Reviewed"
@@ -220,4 +291,54 @@ def acknowledge_report(request, report_id):
                 <span class="ml-2 text-xs {text_color}">{label_text}</span>
             </label>
         """)
-    return HttpResponse(status=400)
\ No newline at end of file
+    return HttpResponse(status=400)
+
+def bulk_acknowledge(request):
+    """
+    Marks every open threat matching the posted filters as reviewed in one
+    UPDATE. Filters: `ip`, `base_domain`, `domain` (id) and `period` (7d/30d/90d),
+    in any combination; the Active Threats page posts just its period.
+    With `remember`, an ip/base_domain filter also becomes an acknowledged-sender
+    rule, so that sender's future threats arrive already reviewed.
+    """
+    if request.method != "POST":
+        return HttpResponse(status=400)
+
+    source_ip = request.POST.get('ip', '').strip()
+    base_domain = request.POST.get('base_domain', '').strip()
+    domain = None
+    if request.POST.get('domain'):
+        try:
+            domain = get_object_or_404(DomainEntity, pk=int(request.POST['domain']))
+        except ValueError:
+            return HttpResponse("Invalid domain", status=400)
+
+    days_map = {'7d': 7, '30d': 30, '90d': 90}
+    days = days_map.get(request.POST.get('period'))
+    date_end = timezone.now() if days else None
+    date_begin = date_end - timedelta(days=days) if days else None
+
+    if source_ip:
+        try:
+            source_ip = str(ipaddress.ip_address(source_ip))
+        except ValueError:
+            return HttpResponse("Invalid IP address", status=400)
+    if not (source_ip or base_domain or domain or days):
+        # Refuse to acknowledge every threat ever received by accident
+        return HttpResponse("No filter given", status=400)
+
+    if request.POST.get('remember') and (source_ip or base_domain):
+        AcknowledgedSender.objects.get_or_create(
+            source_ip=source_ip or None,
+            source_base_domain=base_domain.lower(),
+            domain_entity=domain
+        )
+
+    acknowledge_threats(open_threats(source_ip, base_domain, domain, date_begin, date_end))
+
+    if request.headers.get('HX-Request'):
+        # The lists and counters on the page are now stale
+        response = HttpResponse(status=204)
+        response['HX-Refresh'] = 'true'
+        return response
+    return redirect('active_threats')
@@ -0,0 +1,81 @@
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+def close_connection(connection):
+    """
+    Logs out of an IMAP connection and closes its socket, ignoring errors: it is
+    usually already broken. Connections without a client (Maildir) are left alone.
+    """
+    client = getattr(connection, '_client', None)
+    if not hasattr(client, 'logout'):
+        return
+    try:
+        client.logout()
+    except Exception as e:
+        logger.debug("Logout failed (%s), closing the socket", e)
+        try:
+            client.shutdown()
+        except Exception:
+            pass
+
+class MailboxWatcher:
+    """
+    Keeps one mailbox connection open and processes new reports as they arrive.
+
+    Between passes it waits with IMAP IDLE when the server supports it, and
+    falls back to polling every `poll_interval` seconds otherwise (or for
+    non-IMAP connections such as a local Maildir). Any error drops the
+    connection and reconnects with exponential backoff, capped at `max_backoff`.
+    """
+    def __init__(self, connect, process, reports_folder="INBOX", idle_timeout=300,
+                 poll_interval=60, max_backoff=300, sleep=time.sleep):
+        self.connect = connect
+        self.process = process
+        self.reports_folder = reports_folder
+        self.idle_timeout = idle_timeout
+        self.poll_interval = poll_interval
+        self.max_backoff = max_backoff
+        self.sleep = sleep
+
+    def run(self, should_stop=lambda: False):
+        backoff = 1
+        connection = None
+        try:
+            while not should_stop():
+                try:
+                    connection = self.connect()
+                    while not should_stop():
+                        self.process(connection)
+                        # Only a full successful pass proves the connection is healthy
+                        backoff = 1
+                        if should_stop():
+                            break
+                        self.wait_for_mail(connection)
+                except Exception as e:
+                    logger.warning("Mailbox error (%s). Reconnecting in %ss...", e, backoff)
+                    # Don't leave the old session and socket open next to the new one
+                    close_connection(connection)
+                    connection = None
+                    self.sleep(backoff)
+                    backoff = min(backoff * 2, self.max_backoff)
+        finally:
+            close_connection(connection)
+
+    def wait_for_mail(self, connection):
+        """
+        Blocks until the server announces new mail or the timeout expires.
+        """
+        client = getattr(connection, '_client', None)
+        if hasattr(client, 'idle') and client.has_capability('IDLE'):
+            client.select_folder(self.reports_folder)
+            client.idle()
+            try:
+                # Returns early on EXISTS/RECENT; the timeout doubles as a keepalive
+                client.idle_check(timeout=self.idle_timeout)
+            finally:
+                client.idle_done()
+        else:
+            self.sleep(self.poll_interval)
+            connection.keepalive()
@@ -1,48 +1,80 @@
 import os
 import time
 import socket
-import subprocess
 import sys
+from urllib.parse import urlparse
+
+# Used when the container is started without a command
+DEFAULT_COMMAND = ["gunicorn", "-c", "gunicorn.conf.py"]
 
 def wait_for_postgres(host, port):
-    s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     while True:
+        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         try:
             s.connect((host, port))
             s.close()
             print("PostgreSQL started")
             break
         except socket.error:
+            s.close()
             print("Waiting for PostgreSQL...")
             time.sleep(1)
 
+def database_address():
+    url = urlparse(os.environ.get('DATABASE_URL', 'postgres://db:5432'))
+    return url.hostname or 'db', url.port or 5432
+
+def ensure_superuser():
+    """
+    Idempotent & secure: only creates the account if it does not exist yet.
+    """
+    from django.contrib.auth import get_user_model
+    User = get_user_model()
+    username = os.environ.get('DJANGO_SUPERUSER_USERNAME', 'admin')
+    email = os.environ.get('DJANGO_SUPERUSER_EMAIL', 'admin@example.com')
+    password = os.environ.get('DJANGO_SUPERUSER_PASSWORD', 'admin')
+
+    if not User.objects.filter(username=username).exists():
+        User.objects.create_superuser(username, email, password)
+        print(f"Superuser '{username}' created")
+    else:
+        print(f"Superuser '{username}' already exists")
+
+def prepare_database():
+    """
+    Migrations and the superuser check, run in this process instead of one
+    `manage.py` subprocess each; `migrate` only runs when something is pending.
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+    import django
+    django.setup()
+    from django.core.management import call_command
+    from django.db import connections
+    from dashboard.health import pending_migrations
+
+    pending = pending_migrations()
+    if pending:
+        print(f"Applying {len(pending)} Migrations...")
+        call_command('migrate', interactive=False)
+    else:
+        print("Migrations up to date")
+
+    print("Checking for Superuser...")
+    ensure_superuser()
+
+    # Don't hand open connections over to the server process
+    connections.close_all()
+
 if __name__ == "__main__":
     # 1. Wait for DB
-    wait_for_postgres('db', 5432)
+    wait_for_postgres(*database_address())
 
-    # 2. Run Migrations
-    print("Applying Migrations...")
-    subprocess.run(["python", "manage.py", "migrate"], check=True)
+    # 2. Migrations & Superuser
+    prepare_database()
 
-    # 3. Create Superuser (Idempotent & Secure)
-    print("Checking for Superuser...")
-    script = """
-import os
-from django.contrib.auth import get_user_model
-User = get_user_model()
-username = os.environ.get('DJANGO_SUPERUSER_USERNAME', 'admin')
-email = os.environ.get('DJANGO_SUPERUSER_EMAIL', 'admin@example.com')
-password = os.environ.get('DJANGO_SUPERUSER_PASSWORD', 'admin')
-
-if not User.objects.filter(username=username).exists():
-    User.objects.create_superuser(username, email, password)
-    print(f"Superuser '{username}' created")
-else:
-    print(f"Superuser '{username}' already exists")
-"""
-    # Pass environment variables to the subprocess
-    subprocess.run(["python", "manage.py", "shell", "-c", script], check=True)
-
-    # 4. Start Server
-    print("Starting Server...")
-    subprocess.run(["python", "manage.py", "runserver", "0.0.0.0:8000"])
\ No newline at end of file
+    # 3. Start the server (or whatever command the container was given),
+    # replacing this process so it receives signals directly
+    command = sys.argv[1:] or DEFAULT_COMMAND
+    print(f"Starting {' '.join(command)}...")
+    sys.stdout.flush()
+    os.execvp(command[0], command)
@@ -0,0 +1,27 @@
+# Gunicorn settings for the web container (`gunicorn -c gunicorn.conf.py`).
+# Every value can be overridden from the environment.
+import multiprocessing
+import os
+
+# config.wsgi:application, or config.asgi:application with WEB_WORKER_CLASS=uvicorn_worker.UvicornWorker
+wsgi_app = os.environ.get('WEB_APP', 'config.wsgi:application')
+bind = os.environ.get('WEB_BIND', '0.0.0.0:8000')
+
+# Pre-forked worker processes, each serving WEB_THREADS requests at a time.
+# Each thread holds its own persistent DB connection (DB_CONN_MAX_AGE), as do
+# the DB_QUERY_WORKERS dashboard query threads, so workers x (threads + query
+# workers) must stay below Postgres' max_connections (100 by default).
+workers = int(os.environ.get('WEB_WORKERS', min(multiprocessing.cpu_count() * 2 + 1, 8)))
+threads = int(os.environ.get('WEB_THREADS', '4'))
+worker_class = os.environ.get('WEB_WORKER_CLASS', 'gthread')
+
+timeout = int(os.environ.get('WEB_TIMEOUT', '60'))
+graceful_timeout = 30
+keepalive = 5
+
+# Recycle workers now and then, staggered, to bound slow memory growth
+max_requests = int(os.environ.get('WEB_MAX_REQUESTS', '1000'))
+max_requests_jitter = max_requests // 10
+
+accesslog = '-'
+errorlog = '-'